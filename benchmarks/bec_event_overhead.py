@@ -0,0 +1,83 @@
+"""
+Measure how long BestEffortCallback takes to handle an Event.
+
+This sends a run of synthetic Events with many fields, of which only a few
+are hinted, to a BestEffortCallback with the table and plots disabled, with
+only the table, and with both, and reports microseconds per Event. Output is
+discarded and plots are drawn with the non-interactive Agg backend.
+"""
+import argparse
+import contextlib
+import os
+import time
+import uuid
+
+import matplotlib
+matplotlib.use('Agg')
+
+from bluesky.callbacks.best_effort import BestEffortCallback  # noqa: E402
+
+
+def make_documents(num, num_fields, num_hinted):
+    fields = ['field{}'.format(i) for i in range(num_fields)]
+    start = {'uid': str(uuid.uuid4()), 'time': time.time(), 'scan_id': 1,
+             'plan_type': 'generator', 'plan_name': 'benchmark',
+             'motors': ['motor'],
+             'hints': {'dimensions': [(['motor'], 'primary')]}}
+    descriptor = {
+        'uid': str(uuid.uuid4()), 'time': time.time(),
+        'run_start': start['uid'], 'name': 'primary',
+        'data_keys': {key: {'dtype': 'number', 'shape': [], 'source': key}
+                      for key in ['motor'] + fields},
+        'object_keys': {'motor': ['motor'], 'det': fields},
+        'hints': {'motor': {'fields': ['motor']},
+                  'det': {'fields': fields[:num_hinted]}}}
+    events = []
+    for i in range(num):
+        data = {key: float(i) for key in ['motor'] + fields}
+        events.append({'uid': str(uuid.uuid4()), 'time': time.time(),
+                       'descriptor': descriptor['uid'], 'seq_num': i + 1,
+                       'data': data, 'timestamps': {k: 0 for k in data},
+                       'filled': {}})
+    stop = {'uid': str(uuid.uuid4()), 'time': time.time(),
+            'run_start': start['uid'], 'exit_status': 'success'}
+    return start, descriptor, events, stop
+
+
+def measure(bec, docs):
+    start, descriptor, events, stop = docs
+    with open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull):
+        bec('start', start)
+        bec('descriptor', descriptor)
+        t0 = time.perf_counter()
+        for event in events:
+            bec('event', event)
+        elapsed = time.perf_counter() - t0
+        bec('stop', stop)
+    return elapsed / len(events)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--num', type=int, default=10000,
+                        help='number of Events')
+    parser.add_argument('--fields', type=int, default=100,
+                        help='number of fields in each Event')
+    parser.add_argument('--hinted', type=int, default=2,
+                        help='number of hinted (plotted) fields')
+    args = parser.parse_args()
+    docs = make_documents(args.num, args.fields, args.hinted)
+
+    for label, table, plots in [('disabled', False, False),
+                                ('table only', True, False),
+                                ('table and plots', True, True)]:
+        bec = BestEffortCallback(table_enabled=table)
+        if not plots:
+            bec.disable_plots()
+        per_event = measure(bec, docs)
+        print("{:>16}: {:8.1f} us per Event".format(label, per_event * 1e6))
+
+
+if __name__ == '__main__':
+    main()
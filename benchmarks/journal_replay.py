@@ -0,0 +1,89 @@
+"""
+Measure how fast documents are written to and replayed from a journal.
+
+This writes a run of synthetic Events, each carrying a few scalars and
+optionally an image, to a Journal in a temporary directory, then replays the
+run from a JournalReader into a callback that does nothing, and reports
+documents and megabytes per second for both.
+"""
+import argparse
+import os
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+from bluesky.callbacks.journal import Journal, JournalReader
+
+
+def make_documents(num, shape):
+    start = {'uid': str(uuid.uuid4()), 'time': time.time()}
+    descriptor = {'uid': str(uuid.uuid4()), 'time': time.time(),
+                  'run_start': start['uid'], 'name': 'primary',
+                  'data_keys': {}}
+    image = np.zeros(shape, dtype='uint16') if shape else None
+    yield 'start', start
+    yield 'descriptor', descriptor
+    for i in range(num):
+        data = {'x': i, 'y': 2. * i, 'z': 'label'}
+        if image is not None:
+            data['img'] = image
+        yield 'event', {'uid': str(uuid.uuid4()), 'time': time.time(),
+                        'descriptor': descriptor['uid'], 'seq_num': i + 1,
+                        'data': data, 'timestamps': {k: 0 for k in data}}
+    yield 'stop', {'uid': str(uuid.uuid4()), 'time': time.time(),
+                   'run_start': start['uid'], 'exit_status': 'success'}
+
+
+def journal_size(directory):
+    return sum(os.path.getsize(os.path.join(directory, name))
+               for name in os.listdir(directory))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--num', type=int, default=100000,
+                        help='number of Events')
+    parser.add_argument('--shape', type=int, nargs=2,
+                        help='also put an image of this shape in each Event')
+    parser.add_argument('--fsync', default='stop',
+                        help="Journal fsync policy: 'none', 'stop', "
+                             "'always', or a number of seconds")
+    args = parser.parse_args()
+    fsync = {'none': None, 'stop': 'stop', 'always': 'always'}.get(
+        args.fsync)
+    if fsync is None and args.fsync != 'none':
+        fsync = float(args.fsync)
+    docs = list(make_documents(args.num, args.shape))
+
+    with tempfile.TemporaryDirectory() as directory:
+        journal = Journal(directory, fsync=fsync)
+        t0 = time.perf_counter()
+        for name, doc in docs:
+            journal(name, doc)
+        journal.close()
+        write = time.perf_counter() - t0
+        nbytes = journal_size(directory)
+
+        reader = JournalReader(directory)
+        run = reader[-1]
+        t0 = time.perf_counter()
+        run.replay(lambda name, doc: None)
+        replay = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        last = sum(1 for _ in run.events(seq_num=args.num))
+        seek = time.perf_counter() - t0
+        reader.close()
+
+    for label, elapsed in [('Wrote', write), ('Replayed', replay)]:
+        print("%s %d documents (%.1f MB) in %.2f s: %.0f documents/s, "
+              "%.1f MB/s" % (label, len(docs), nbytes / 1e6, elapsed,
+                             len(docs) / elapsed, nbytes / elapsed / 1e6))
+    print("Seeking to the last Event took %.1f ms." % (seek * 1e3))
+    assert last == 1
+
+
+if __name__ == '__main__':
+    main()
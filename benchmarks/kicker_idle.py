@@ -0,0 +1,52 @@
+"""
+Measure how often a kicker wakes an idle event loop, and the CPU it uses.
+
+This opens a few figures, installs the notebook kicker on an event loop that
+has nothing else to do, and runs the loop for a while, first with a fixed
+update interval (the former behaviour) and then with the default adaptive
+one. It reports kicks per second and CPU seconds per second of wall time.
+The figures are drawn with the non-interactive Agg backend.
+"""
+import argparse
+import asyncio
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt  # noqa: E402
+
+from bluesky import utils  # noqa: E402
+
+
+def measure(duration, **kwargs):
+    loop = asyncio.new_event_loop()
+    utils.install_nb_kicker(loop=loop, **kwargs)
+    kicker = utils._NB_KICKER_INSTALLED[loop]
+    cpu = time.process_time()
+    loop.run_until_complete(asyncio.sleep(duration, loop=loop))
+    cpu = time.process_time() - cpu
+    utils._NB_KICKER_INSTALLED.pop(loop)._handle.cancel()
+    loop.close()
+    return kicker.kicks / duration, cpu / duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--duration', type=float, default=10,
+                        help='seconds to run each kicker')
+    parser.add_argument('--figures', type=int, default=4,
+                        help='number of open figures')
+    args = parser.parse_args()
+    for i in range(args.figures):
+        fig, ax = plt.subplots()
+        ax.plot(range(1000))
+        fig.canvas.draw()
+    for label, kwargs in [('fixed 0.03 s', {'max_interval': 0.03}),
+                          ('adaptive', {})]:
+        kicks, cpu = measure(args.duration, **kwargs)
+        print("{:>14}: {:6.1f} kicks/s, {:.4f} CPU s/s".format(label, kicks,
+                                                               cpu))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Measure how long the RunEngine takes to open a run with each md store.
+
+This runs many short plans that only open and close a run, with ``RE.md``
+set to a plain dict, a historydict.HistoryDict, and a
+bluesky.utils.MetadataStore, each backed by a file in a temporary directory,
+and reports the median and 99th percentile time from 'open_run' to the
+'start' document.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from bluesky import RunEngine
+from bluesky.utils import MetadataStore, Msg
+
+
+def measure(RE, num):
+    latencies = []
+    t0 = None
+
+    def on_start(name, doc):
+        latencies.append(time.perf_counter() - t0)
+
+    RE.subscribe(on_start, 'start')
+    plan = [Msg('open_run'), Msg('close_run')]
+    for _ in range(num):
+        t0 = time.perf_counter()
+        RE(plan)
+    return np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--num', type=int, default=1000,
+                        help='number of runs per store')
+    parser.add_argument('--md-keys', type=int, default=20,
+                        help='number of other keys in the md store')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        stores = [('dict', lambda: {})]
+        try:
+            from historydict import HistoryDict
+        except ImportError:
+            print("historydict is not installed; skipping it.")
+        else:
+            stores.append(('HistoryDict', lambda: HistoryDict(
+                os.path.join(directory, 'history.db'))))
+        stores.append(('MetadataStore', lambda: MetadataStore(
+            os.path.join(directory, 'md.sqlite'))))
+        for label, make_store in stores:
+            RE = RunEngine(make_store())
+            for i in range(args.md_keys):
+                RE.md['key{}'.format(i)] = 'value {}'.format(i)
+            latencies = measure(RE, args.num) * 1e3
+            if hasattr(RE.md, 'close'):
+                RE.md.close()
+            # Let go of the store before its directory is removed.
+            RE.md = {}
+            print("{:>14}: open_run median {:.3f} ms, "
+                  "99th percentile {:.3f} ms".format(
+                      label, np.median(latencies),
+                      np.percentile(latencies, 99)))
+
+
+if __name__ == '__main__':
+    main()
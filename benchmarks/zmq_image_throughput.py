@@ -0,0 +1,133 @@
+"""
+Measure the throughput of image-bearing Event documents over 0MQ.
+
+This runs a Proxy and a RemoteDispatcher in subprocesses, publishes a run of
+synthetic Events each carrying one image, and reports Events and megabytes
+per second as seen by the RemoteDispatcher, optionally passing the images
+through shared memory instead of the Proxy. It also times serialization
+alone, comparing the Publisher's array frames with the legacy approach of
+deep-copying the document and converting arrays to lists before pickling.
+"""
+import argparse
+import copy
+import multiprocessing
+import pickle
+import time
+import uuid
+
+import numpy as np
+
+from bluesky.callbacks.zmq import (Proxy, Publisher, RemoteDispatcher,
+                                   _extract_arrays)
+from bluesky.utils import apply_to_dict_recursively, sanitize_np
+
+
+def make_documents(num, shape, dtype):
+    start = {'uid': str(uuid.uuid4()), 'time': time.time()}
+    descriptor = {'uid': str(uuid.uuid4()), 'time': time.time(),
+                  'run_start': start['uid'], 'name': 'primary',
+                  'data_keys': {'img': {'source': 'bench', 'dtype': 'array',
+                                        'shape': list(shape)}}}
+    image = np.random.randint(0, 255, size=shape).astype(dtype)
+    yield 'start', start
+    yield 'descriptor', descriptor
+    for i in range(num):
+        yield 'event', {'uid': str(uuid.uuid4()), 'time': time.time(),
+                        'descriptor': descriptor['uid'], 'seq_num': i + 1,
+                        'data': {'img': image}, 'timestamps': {'img': 0}}
+    yield 'stop', {'uid': str(uuid.uuid4()), 'time': time.time(),
+                   'run_start': start['uid'], 'exit_status': 'success'}
+
+
+def start_proxy(in_port, out_port):
+    Proxy(in_port, out_port).start()
+
+
+def start_dispatcher(out_port, queue):
+    d = RemoteDispatcher('127.0.0.1:%d' % out_port)
+    received = {'events': 0, 'nbytes': 0}
+
+    def count(name, doc):
+        if name == 'event':
+            received['events'] += 1
+            received['nbytes'] += doc['data']['img'].nbytes
+        elif name == 'stop':
+            queue.put((time.time(), received['events'], received['nbytes']))
+
+    d.subscribe(count)
+    queue.put('ready')
+    d.start()
+
+
+def bench_serialization(num, shape, dtype):
+    docs = [doc for name, doc in make_documents(num, shape, dtype)
+            if name == 'event']
+
+    t0 = time.perf_counter()
+    for doc in docs:
+        buffers = []
+        pickle.dumps(_extract_arrays(doc, buffers))
+    frames = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for doc in docs:
+        legacy = copy.deepcopy(doc)
+        apply_to_dict_recursively(legacy, sanitize_np)
+        pickle.dumps(legacy)
+    legacy = time.perf_counter() - t0
+    return frames / num, legacy / num
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--num', type=int, default=500,
+                        help='number of Events to publish')
+    parser.add_argument('--shape', type=int, nargs=2, default=(2048, 1024),
+                        help='image shape')
+    parser.add_argument('--dtype', default='uint16')
+    parser.add_argument('--ports', type=int, nargs=2, default=(5577, 5578))
+    parser.add_argument('--shared-memory', type=int, metavar='MB',
+                        help='pass images through a shared memory ring '
+                             'buffer of this size')
+    args = parser.parse_args()
+    in_port, out_port = args.ports
+    nbytes = np.dtype(args.dtype).itemsize * np.prod(args.shape)
+    print("Events carry one %s %s image (%.1f MB)."
+          % (args.dtype, tuple(args.shape), nbytes / 1e6))
+
+    frames, legacy = bench_serialization(min(args.num, 20), args.shape,
+                                         args.dtype)
+    print("Serialization per Event: array frames %.2f ms, "
+          "legacy lists %.2f ms" % (frames * 1e3, legacy * 1e3))
+
+    queue = multiprocessing.Queue()
+    proxy = multiprocessing.Process(target=start_proxy,
+                                    args=(in_port, out_port), daemon=True)
+    dispatcher = multiprocessing.Process(target=start_dispatcher,
+                                         args=(out_port, queue), daemon=True)
+    proxy.start()
+    dispatcher.start()
+    try:
+        assert queue.get(timeout=10) == 'ready'
+        shared_memory = args.shared_memory
+        if shared_memory is not None:
+            shared_memory *= 2**20
+        publisher = Publisher('127.0.0.1:%d' % in_port,
+                              shared_memory=shared_memory)
+        time.sleep(1)  # let the subscription propagate through the proxy
+        t0 = time.time()
+        for name, doc in make_documents(args.num, args.shape, args.dtype):
+            publisher(name, doc)
+        t1, num_received, bytes_received = queue.get(timeout=600)
+        publisher.close()
+    finally:
+        proxy.terminate()
+        dispatcher.terminate()
+    elapsed = t1 - t0
+    print("Received %d of %d Events in %.2f s: %.1f Events/s, %.1f MB/s"
+          % (num_received, args.num, elapsed, num_received / elapsed,
+             bytes_received / elapsed / 1e6))
+
+
+if __name__ == '__main__':
+    main()
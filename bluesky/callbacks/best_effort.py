@@ -38,6 +38,8 @@ class BestEffortCallback(CallbackBase):
         self._live_grids = {}
         self._live_scatters = {}
         self._peak_stats = {}  # same structure as live_plots
+        # maps descriptor uid to the _Route for its Events
+        self._routes = {}
         self._cleanup_motor_heuristic = False
         self._stream_names_seen = set()
 
@@ -146,6 +148,8 @@ class BestEffortCallback(CallbackBase):
     def descriptor(self, doc):
         self._descriptors[doc['uid']] = doc
         stream_name = doc.get('name', 'primary')  # fall back for old docs
+        route = self._routes[doc['uid']] = _Route()
+        route.primary = doc.get('name') == 'primary'
 
         if stream_name not in self._stream_names_seen:
             self._stream_names_seen.add(stream_name)
@@ -153,6 +157,8 @@ class BestEffortCallback(CallbackBase):
                 print("New stream: {!r}".format(stream_name))
 
         columns = hinted_fields(doc)
+        if doc.get('name') == 'baseline':
+            route.baseline_columns = set(columns)
 
         # ## This deals with old documents. ## #
 
@@ -281,6 +287,7 @@ class BestEffortCallback(CallbackBase):
                 # Stash them in state.
                 self._live_plots[doc['uid']][y_key] = live_plot
                 self._peak_stats[doc['uid']][y_key] = peak_stats
+                route.consumers.extend([live_plot, peak_stats])
 
             for ax in axes[:-1]:
                 ax.set_xlabel('')
@@ -324,6 +331,7 @@ class BestEffortCallback(CallbackBase):
                         live_grid('start', self._start_doc)
                         live_grid('descriptor', doc)
                         self._live_grids[doc['uid']][I_key] = live_grid
+                        route.consumers.append(live_grid)
             else:
                 self._live_scatters[doc['uid']] = {}
                 x_key, y_key = dim_fields
@@ -341,6 +349,7 @@ class BestEffortCallback(CallbackBase):
                     live_scatter('start', self._start_doc)
                     live_scatter('descriptor', doc)
                     self._live_scatters[doc['uid']][I_key] = live_scatter
+                    route.consumers.append(live_scatter)
         else:
             raise NotImplementedError("we do not support 3D+ in BEC yet "
                                       "(and it should have bailed above)")
@@ -350,14 +359,13 @@ class BestEffortCallback(CallbackBase):
             pass
 
     def event(self, doc):
-        descriptor = self._descriptors[doc['descriptor']]
-        if descriptor.get('name') == 'primary':
-            if self._table is not None:
-                self._table('event', doc)
+        route = self._routes[doc['descriptor']]
+        if route.primary and self._table is not None:
+            self._table('event', doc)
 
         # Show the baseline readings.
-        if descriptor.get('name') == 'baseline':
-            columns = hinted_fields(descriptor)
+        if route.baseline_columns is not None:
+            columns = route.baseline_columns
             self._baseline_toggle = not self._baseline_toggle
             if self._baseline_toggle:
                 file = self._buffer
@@ -375,19 +383,8 @@ class BestEffortCallback(CallbackBase):
                     print('| {:>30} | {:<30} |'.format(k, v), file=file)
                 print(border, file=file)
 
-        for y_key in doc['data']:
-            live_plot = self._live_plots.get(doc['descriptor'], {}).get(y_key)
-            if live_plot is not None:
-                live_plot('event', doc)
-            live_grid = self._live_grids.get(doc['descriptor'], {}).get(y_key)
-            if live_grid is not None:
-                live_grid('event', doc)
-            live_sc = self._live_scatters.get(doc['descriptor'], {}).get(y_key)
-            if live_sc is not None:
-                live_sc('event', doc)
-            peak_stats = self._peak_stats.get(doc['descriptor'], {}).get(y_key)
-            if peak_stats is not None:
-                peak_stats('event', doc)
+        for consumer in route.consumers:
+            consumer('event', doc)
 
     def stop(self, doc):
         if self._table is not None:
@@ -422,6 +419,7 @@ class BestEffortCallback(CallbackBase):
     def clear(self):
         self._start_doc = None
         self._descriptors.clear()
+        self._routes.clear()
         self._stream_names_seen.clear()
         self._table = None
         self._live_plots.clear()
@@ -433,6 +431,23 @@ class BestEffortCallback(CallbackBase):
         self._baseline_toggle = True
 
 
+class _Route:
+    """
+    Where BestEffortCallback sends the Events of one descriptor.
+
+    This is worked out once, when the descriptor arrives, so that handling
+    an Event does not involve looking at its fields.
+    """
+    __slots__ = ('primary', 'baseline_columns', 'consumers')
+
+    def __init__(self):
+        self.primary = False  # whether to show the Events in the table
+        self.baseline_columns = None  # fields to show, if a baseline stream
+        # the plots and PeakStats that use the Events, in the order in which
+        # the Events are passed to them
+        self.consumers = []
+
+
 class PeakResults:
     ATTRS = ('com', 'cen', 'max', 'min', 'fwhm', 'nlls')
 
@@ -0,0 +1,308 @@
+"""
+Store runs as columns of numbers in memory-mapped ``.npy`` files.
+
+Each run gets a directory, named after its uid, holding ``metadata.json``
+(the run's 'start', descriptors, and 'stop' documents and a description of
+the columns) and a subdirectory per stream. Each stream has a ``.npy`` file
+per field, one row per Event, plus ``time.npy``, ``seq_num.npy``, and a
+``timestamps`` subdirectory with one ``.npy`` file per field.
+
+The files are regular ``.npy`` files that grow as Events arrive, so a stream
+of any length is read back with ``numpy.load(path, mmap_mode='r')`` (see
+:func:`load_stream`) without reading it into memory.
+"""
+import json
+import logging
+import os
+
+import numpy as np
+
+from ..npy import NpyColumn, missing_value
+from .core import CallbackBase
+
+logger = logging.getLogger(__name__)
+
+_METADATA_NAME = 'metadata.json'
+# dtypes of scalar fields, by the 'dtype' of their data key
+_SCALAR_DTYPES = {'number': np.float64, 'integer': np.int64,
+                  'boolean': np.bool_}
+# Names of the columns every stream has, which fields cannot use
+_RESERVED_NAMES = {'time', 'seq_num'}
+
+
+def _column_type(data_key, value):
+    """
+    Return the dtype and shape of the column for a field, or None if it
+    cannot be stored as a column.
+    """
+    if data_key.get('external') or data_key.get('dtype') == 'string':
+        return None
+    value = np.asarray(value)
+    if value.dtype.kind not in 'biufc':
+        return None
+    dtype = _SCALAR_DTYPES.get(data_key.get('dtype'))
+    if dtype is not None and value.ndim == 0:
+        return np.dtype(dtype), ()
+    # Arrays, and fields whose values do not match their description: trust
+    # the values.
+    return value.dtype, value.shape
+
+
+def _as_rows(values, column):
+    """
+    Return values as an array of rows of a column.
+
+    Values that do not have the column's shape, or cannot be converted to
+    its dtype, are replaced by the fill value. Also return whether there
+    were any.
+    """
+    try:
+        rows = np.asarray(values, dtype=column.dtype)
+    except (TypeError, ValueError):
+        pass
+    else:
+        if rows.shape[1:] == column.shape:
+            return rows, False
+    rows = np.full((len(values),) + column.shape, missing_value(column.dtype),
+                   dtype=column.dtype)
+    misfit = False
+    for i, value in enumerate(values):
+        try:
+            value = np.asarray(value, dtype=column.dtype)
+        except (TypeError, ValueError):
+            misfit = True
+            continue
+        if value.shape == column.shape:
+            rows[i] = value
+        else:
+            misfit = True
+    return rows, misfit
+
+
+def _jsonable(obj):
+    "Make numpy objects in documents JSON-serializable."
+    if isinstance(obj, (np.ndarray, np.generic)):
+        return obj.tolist()
+    raise TypeError("{!r} is not JSON serializable".format(obj))
+
+
+class ColumnStore(CallbackBase):
+    """
+    A callback that stores each stream of a run as memory-mapped columns.
+
+    Numeric, boolean, and array fields are stored. String fields,
+    externally-stored fields, and fields named 'time' or 'seq_num', which
+    would collide with the columns every stream has, are not; they are
+    listed in the metadata. The dtype and shape of a
+    column are those of the field's first value. Later values that do not
+    fit are stored as NaN (or 0), with a warning.
+
+    Parameters
+    ----------
+    directory : string
+        Directory under which a directory is made for each run.
+    flush_interval : int, optional
+        Update the files' headers every this many Events, so that readers
+        see the Events received so far. Headers are always updated at the
+        end of a run. Default is 1000.
+
+    Examples
+    --------
+
+    Store every run, then load a column of the last run without reading
+    the rest.
+
+    >>> store = ColumnStore('/var/tmp/bluesky-columns')
+    >>> RE.subscribe(store)
+    >>> uid, = RE(count([det], num=1000000))
+    >>> columns = load_stream('/var/tmp/bluesky-columns', uid)
+    >>> columns['det'][-10:]
+    """
+    def __init__(self, directory, *, flush_interval=1000):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._run_directory = None
+        self._metadata = None
+        self._descriptors = {}  # {descriptor uid: stream name}
+        self._streams = {}  # {stream name: {field: NpyColumn}}
+        self._unflushed = 0
+        self._misfit_fields = set()
+
+    def start(self, doc):
+        self._close_columns()
+        self._run_directory = os.path.join(self.directory, doc['uid'])
+        os.makedirs(self._run_directory)
+        self._metadata = {'start': doc, 'descriptors': {}, 'stop': None,
+                          'streams': {}}
+        self._write_metadata()
+        super().start(doc)
+
+    def descriptor(self, doc):
+        stream = doc.get('name', 'primary')
+        self._descriptors[doc['uid']] = stream
+        self._metadata['descriptors'].setdefault(stream, []).append(doc)
+        if stream not in self._streams:
+            stream_directory = os.path.join(self._run_directory, stream)
+            os.makedirs(os.path.join(stream_directory, 'timestamps'))
+            self._streams[stream] = {
+                'time': NpyColumn(os.path.join(stream_directory, 'time.npy'),
+                                  np.float64),
+                'seq_num': NpyColumn(os.path.join(stream_directory,
+                                                  'seq_num.npy'),
+                                     np.int64)}
+            self._metadata['streams'][stream] = {'fields': [],
+                                                 'skipped_fields': []}
+        self._write_metadata()
+        super().descriptor(doc)
+
+    def event(self, doc):
+        self._append(doc['descriptor'], [doc['time']], [doc['seq_num']],
+                     {key: [val] for key, val in doc['data'].items()},
+                     {key: [val] for key, val in doc['timestamps'].items()},
+                     doc.get('filled', {}))
+        super().event(doc)
+
+    def event_page(self, doc):
+        filled = {key: all(val) for key, val in doc.get('filled', {}).items()}
+        self._append(doc['descriptor'], doc['time'], doc['seq_num'],
+                     doc['data'], doc['timestamps'], filled)
+
+    def bulk_events(self, doc):
+        for events in doc.values():
+            for event in events:
+                self.event(event)
+
+    def _append(self, descriptor_uid, time, seq_num, data, timestamps,
+                filled):
+        stream = self._descriptors[descriptor_uid]
+        columns = self._streams[stream]
+        descriptor = self._metadata['descriptors'][stream][-1]
+        if descriptor['uid'] != descriptor_uid:
+            descriptor = next(d for d in self._metadata['descriptors'][stream]
+                              if d['uid'] == descriptor_uid)
+        info = self._metadata['streams'][stream]
+        length = columns['time'].length
+        num = len(time)
+        for key, values in data.items():
+            # Every field stored has a timestamps column. (The field itself
+            # may share its name with a column that every stream has.)
+            if 'timestamps/' + key not in columns:
+                if key in info['skipped_fields']:
+                    continue
+                data_key = descriptor['data_keys'].get(key, {})
+                if filled.get(key):
+                    data_key = dict(data_key, external=None)
+                if key in _RESERVED_NAMES or '/' in key:
+                    logger.warning("Not storing the field %r: its name is "
+                                   "reserved or not a valid file name.", key)
+                    column_type = None
+                else:
+                    column_type = _column_type(data_key, values[0])
+                if column_type is None:
+                    info['skipped_fields'].append(key)
+                    self._write_metadata()
+                    continue
+                dtype, shape = column_type
+                stream_directory = os.path.join(self._run_directory, stream)
+                columns[key] = NpyColumn(
+                    os.path.join(stream_directory, key + '.npy'),
+                    dtype, shape, length)
+                columns['timestamps/' + key] = NpyColumn(
+                    os.path.join(stream_directory, 'timestamps',
+                                 key + '.npy'),
+                    np.float64, (), length)
+                info['fields'].append(key)
+                self._write_metadata()
+            rows, misfit = _as_rows(values, columns[key])
+            if misfit and key not in self._misfit_fields:
+                self._misfit_fields.add(key)
+                logger.warning("Values of %r that do not have the dtype %s "
+                               "and shape %s of its first value are stored "
+                               "as %r.", key, columns[key].dtype,
+                               columns[key].shape,
+                               missing_value(columns[key].dtype))
+            columns[key].append(rows)
+            columns['timestamps/' + key].append(timestamps[key])
+        columns['time'].append(time)
+        columns['seq_num'].append(seq_num)
+        length += num
+        # Pad the columns of fields missing from these Events.
+        for column in columns.values():
+            if column.length < length:
+                column.append(np.full((length - column.length,) +
+                                      column.shape,
+                                      missing_value(column.dtype),
+                                      dtype=column.dtype))
+        self._unflushed += num
+        if self._unflushed >= self.flush_interval:
+            self.flush()
+
+    def stop(self, doc):
+        self._metadata['stop'] = doc
+        self._close_columns()
+        super().stop(doc)
+
+    def flush(self):
+        "Make the Events received so far visible to readers."
+        for columns in self._streams.values():
+            for column in columns.values():
+                column.flush()
+        self._unflushed = 0
+
+    def _close_columns(self):
+        for columns in self._streams.values():
+            for column in columns.values():
+                column.close()
+        if self._metadata is not None:
+            self._write_metadata()
+        self._streams.clear()
+        self._descriptors.clear()
+        self._unflushed = 0
+        self._misfit_fields.clear()
+
+    def _write_metadata(self):
+        path = os.path.join(self._run_directory, _METADATA_NAME)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self._metadata, f, default=_jsonable)
+        os.replace(path + '.tmp', path)
+
+
+def load_stream(directory, uid, stream_name='primary'):
+    """
+    Load the columns of a stream stored by a :class:`ColumnStore`.
+
+    The columns are memory-mapped, read-only arrays: only the parts that are
+    used are read from disk.
+
+    Parameters
+    ----------
+    directory : string
+        The ColumnStore's directory.
+    uid : string
+        uid of the run's 'start' document
+    stream_name : string, optional
+        Default is 'primary'.
+
+    Returns
+    -------
+    columns : dict
+        maps each field, 'time', and 'seq_num' to an array, and
+        ``'timestamps/<field>'`` to the timestamps of each field. If the run
+        is still going, the columns may have different lengths; they are
+        truncated to the shortest.
+    """
+    run_directory = os.path.join(directory, uid)
+    with open(os.path.join(run_directory, _METADATA_NAME)) as f:
+        metadata = json.load(f)
+    stream_directory = os.path.join(run_directory, stream_name)
+    names = ['time', 'seq_num'] + metadata['streams'][stream_name]['fields']
+    columns = {}
+    for name in names:
+        columns[name] = np.load(os.path.join(stream_directory, name + '.npy'),
+                                mmap_mode='r')
+        if name not in ('time', 'seq_num'):
+            columns['timestamps/' + name] = np.load(
+                os.path.join(stream_directory, 'timestamps', name + '.npy'),
+                mmap_mode='r')
+    length = min(len(column) for column in columns.values())
+    return {name: column[:length] for name, column in columns.items()}
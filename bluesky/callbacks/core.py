@@ -4,12 +4,13 @@ Useful callbacks for the Run Engine
 from itertools import count
 import warnings
 from collections import deque, namedtuple, OrderedDict, ChainMap
+import threading
 import time as ttime
 
 from datetime import datetime
 import numpy as np
 import logging
-from ..utils import ensure_uid
+from ..utils import ensure_uid, unpack_event_page
 logger = logging.getLogger(__name__)
 
 # back-compat
@@ -28,6 +29,13 @@ class CallbackBase:
     def event(self, doc):
         pass
 
+    def event_page(self, doc):
+        # Fall back to unpacking the page for subclasses that handle Events.
+        if type(self).event is CallbackBase.event:
+            return
+        for event in unpack_event_page(doc):
+            self.event(event)
+
     def bulk_events(self, doc):
         pass
 
@@ -189,6 +197,19 @@ class LiveTable(CallbackBase):
 
     out : callable, optional
         Function to call to 'print' a line.  Defaults to `print`
+
+    refresh_interval : float, optional
+        If given, buffer rows and print them at most once every this many
+        seconds, so that a slow terminal does not hold up the RunEngine.
+        Rows held back are printed by a timer once the interval has passed,
+        even if no more Events arrive. By default, each row is printed as
+        soon as its Event arrives.
+
+    max_rows_per_refresh : int, optional
+        When rows are buffered and more than this many have piled up, print
+        only the most recent ones, after a line saying how many were left
+        out. The complete table is still given to ``logbook`` and kept in
+        :attr:`table`. Defaults to 10.
     '''
     _FMTLOOKUP = {'s': '{pad}{{{k}: >{width}.{prec}{dtype}}}{pad}',
                   'f': '{pad}{{{k}: >{width}.{prec}{dtype}}}{pad}',
@@ -206,7 +227,8 @@ class LiveTable(CallbackBase):
     def __init__(self, fields, *, stream_name='primary',
                  print_header_interval=50,
                  min_width=12, default_prec=3, extra_pad=1,
-                 logbook=None, out=print):
+                 logbook=None, out=print, refresh_interval=None,
+                 max_rows_per_refresh=10):
         super().__init__()
         self._header_interval = print_header_interval
         # expand objects
@@ -226,7 +248,14 @@ class LiveTable(CallbackBase):
         self._rows = []
         self.logbook = logbook
         self._sep_format = None
+        self._header = None
         self._out = out
+        self._refresh_interval = refresh_interval
+        self._max_rows_per_refresh = max_rows_per_refresh
+        self._pending = []  # lines buffered but not yet printed
+        self._last_refresh = 0
+        self._refresh_timer = None
+        self._refresh_lock = threading.RLock()
 
     def descriptor(self, doc):
         def patch_up_precision(p):
@@ -291,6 +320,7 @@ class LiveTable(CallbackBase):
         self._print(self._sep_format)
         self._print(self._header)
         self._print(self._sep_format)
+        self.flush()
         super().descriptor(doc)
 
     def event(self, doc):
@@ -333,6 +363,7 @@ class LiveTable(CallbackBase):
 
         if self._sep_format is not None:
             self._print(self._sep_format)
+        self.flush()
         self._stop = doc
 
         wm = self.water_mark.format(st=self._start)
@@ -343,11 +374,58 @@ class LiveTable(CallbackBase):
 
     def start(self, doc):
         self._rows = []
+        with self._refresh_lock:
+            if self._refresh_timer is not None:
+                self._refresh_timer.cancel()
+                self._refresh_timer = None
+            self._pending = []
         self._start = doc
         self._stop = None
         self._sep_format = None
         super().start(doc)
 
+    @property
+    def table(self):
+        "The complete table of the current (or last) run, as a string"
+        return '\n'.join(self._rows)
+
+    def flush(self):
+        "Print the buffered rows."
+        with self._refresh_lock:
+            if self._refresh_timer is not None:
+                self._refresh_timer.cancel()
+                self._refresh_timer = None
+            pending, self._pending = self._pending, []
+            self._last_refresh = ttime.monotonic()
+            self._print_pending(pending)
+
+    def _print_pending(self, pending):
+        if len(pending) > self._max_rows_per_refresh:
+            omitted = pending[:-self._max_rows_per_refresh]
+            pending = pending[-self._max_rows_per_refresh:]
+            num = sum(line not in (self._sep_format, self._header)
+                      for line in omitted)
+            summary = '... {} rows ...'.format(num)
+            if self._sep_format is not None:
+                summary = '|{}|'.format(
+                    summary.center(len(self._sep_format) - 2))
+            self._out(summary)
+        for line in pending:
+            self._out(line)
+
     def _print(self, out_str):
         self._rows.append(out_str)
-        self._out(out_str)
+        if self._refresh_interval is None:
+            self._out(out_str)
+            return
+        with self._refresh_lock:
+            self._pending.append(out_str)
+            wait = (self._last_refresh + self._refresh_interval -
+                    ttime.monotonic())
+            if wait <= 0:
+                self.flush()
+            elif self._refresh_timer is None:
+                # Print the row later, in case no more Events come to do it.
+                self._refresh_timer = threading.Timer(wait, self.flush)
+                self._refresh_timer.daemon = True
+                self._refresh_timer.start()
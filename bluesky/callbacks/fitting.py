@@ -172,6 +172,21 @@ def center_of_mass(input, labels=None, index=None):
     return [tuple(v) for v in np.array(results).T]
 
 
+def _half_max_crossings(x, y, mid):
+    "Return the x values at which y, interpolated linearly, crosses mid."
+    crossings = np.where(np.diff((y > mid).astype(np.int)))[0]
+    _cen_list = []
+    for cr in crossings.ravel():
+        _x = x[cr:cr+2]
+        _y = y[cr:cr+2] - mid
+
+        dx = np.diff(_x)[0]
+        dy = np.diff(_y)[0]
+        m = dy / dx
+        _cen_list.append((-_y[0] / m) + _x[0])
+    return _cen_list
+
+
 class PeakStats(CollectThenCompute):
     """
     Compute peak statsitics after a run finishes.
@@ -276,16 +291,7 @@ class PeakStats(CollectThenCompute):
         self.min = x[np.argmin(y)], self.y_data[np.argmin(y)],
         self.com, = np.interp(center_of_mass(y), np.arange(len(x)), x)
         mid = (np.max(y) + np.min(y)) / 2
-        crossings = np.where(np.diff((y > mid).astype(np.int)))[0]
-        _cen_list = []
-        for cr in crossings.ravel():
-            _x = x[cr:cr+2]
-            _y = y[cr:cr+2] - mid
-
-            dx = np.diff(_x)[0]
-            dy = np.diff(_y)[0]
-            m = dy / dx
-            _cen_list.append((-_y[0] / m) + _x[0])
+        _cen_list = _half_max_crossings(x, y, mid)
 
         if _cen_list:
             self.cen = np.mean(_cen_list)
@@ -295,3 +301,143 @@ class PeakStats(CollectThenCompute):
                                    dtype=float)
         # reset y data
         y = self.y_data
+
+
+class LivePeakStats(CallbackBase):
+    """
+    Compute peak statistics as a run progresses, in constant memory.
+
+    The results are the attributes of :class:`PeakStats`, updated after
+    every Event, so they can be used during the run, for example to stop an
+    alignment scan once the peak has been passed. Events are not kept:
+    running sums give the center of mass, the extrema are tracked as they
+    arrive, and the half-maximum crossings are updated with each new point.
+
+    Parameters
+    ----------
+    x : string
+        field name for the x variable (e.g., a motor)
+    y : string
+        field name for the y variable (e.g., a detector)
+    max_points : int, optional
+        Maximum number of points kept to find the crossings again when the
+        half-maximum level moves, which it does when a new maximum or
+        minimum arrives. Beyond this, every other point is dropped, and the
+        crossings found at the new level are approximate. Default is 1000.
+
+    Note
+    ----
+    It is assumed that the two fields, x and y, are recorded in the same
+    Event stream.
+
+    Unlike :class:`PeakStats`, the center of mass is ``sum(x * y) /
+    sum(y)``. The two agree when the points are evenly spaced in x, as in
+    a scan. There is no background subtraction.
+
+    Attributes
+    ----------
+    com : center of mass
+    cen : mid-point between half-max points on each side of the peak
+    max : x location of y maximum
+    min : x location of y minimum
+    crossings : crosses between y and middle line, which is
+          ((np.max(y) + np.min(y)) / 2). Users can estimate FWHM based
+          on those info.
+    fwhm : the computed full width half maximum (fwhm) of a peak.
+           The distance between the first and last crossing is taken to
+           be the fwhm.
+    """
+
+    def __init__(self, x, y, *, max_points=1000):
+        self.x = x
+        self.y = y
+        self.max_points = max_points
+        self._reset()
+        super().__init__()
+
+    def __getitem__(self, key):
+        if key in ['com', 'cen', 'max', 'min']:
+            return getattr(self, key)
+        else:
+            raise KeyError
+
+    def _reset(self):
+        self.com = None
+        self.cen = None
+        self.max = None
+        self.min = None
+        self.crossings = None
+        self.fwhm = None
+        self._sum_y = 0
+        self._sum_xy = 0
+        self._num = 0
+        # Every _stride-th point, for finding the crossings at a new level
+        self._x_points = []
+        self._y_points = []
+        self._stride = 1
+        self._mid = None
+        self._crossings = []
+        self._last = None
+
+    def start(self, doc):
+        self._reset()
+        super().start(doc)
+
+    def event(self, doc):
+        try:
+            x = doc['data'][self.x]
+            y = doc['data'][self.y]
+        except KeyError:
+            pass
+        else:
+            self.update(x, y)
+        super().event(doc)
+
+    def update(self, x, y):
+        "Add a point and update the results."
+        self._sum_y += y
+        self._sum_xy += x * y
+        self.com = self._sum_xy / self._sum_y if self._sum_y else np.nan
+        if self.max is None or y > self.max[1]:
+            self.max = x, y
+        if self.min is None or y < self.min[1]:
+            self.min = x, y
+
+        if (self._num % self._stride == 0 and
+                len(self._x_points) >= self.max_points):
+            del self._x_points[1::2]
+            del self._y_points[1::2]
+            self._stride *= 2
+        kept = self._num % self._stride == 0
+        if kept:
+            self._x_points.append(x)
+            self._y_points.append(y)
+        self._num += 1
+
+        mid = (self.max[1] + self.min[1]) / 2
+        if mid != self._mid:
+            # The level moved: look for the crossings again.
+            self._mid = mid
+            x_points = self._x_points
+            y_points = self._y_points
+            if not kept:
+                x_points = x_points + [x]
+                y_points = y_points + [y]
+            self._crossings = _half_max_crossings(
+                np.asarray(x_points), np.asarray(y_points), mid)
+        elif (self._last[1] > mid) != (y > mid):
+            last_x, last_y = self._last
+            self._crossings.append(
+                last_x + (mid - last_y) * (x - last_x) / (y - last_y))
+        self._last = x, y
+
+        if self._crossings:
+            self.crossings = np.array(self._crossings)
+            self.cen = np.mean(self.crossings)
+            if len(self._crossings) >= 2:
+                self.fwhm = np.abs(self.crossings[-1] - self.crossings[0],
+                                   dtype=float)
+            else:
+                self.fwhm = None
+        else:
+            self.crossings = self.cen = self.fwhm = None
@@ -0,0 +1,609 @@
+"""
+Persist the document stream in local, append-only files.
+
+A journal is a directory of segment files plus an index. Each segment starts
+with a magic string and holds a sequence of frames, one per document: the
+length of the payload and its CRC32 followed by the payload, the serialized
+``(name, doc)`` pair. A frame that was being written when the process died is
+detected by its length or checksum and ignored.
+
+The index, ``index.jsonl``, has one JSON object per line locating documents
+by segment number and byte offset:
+
+* ``{"start": uid, "time": t, "segment": s, "offset": o}`` for each run start
+* ``{"stop": uid, "run_start": uid, "segment": s, "offset": o}``
+* ``{"descriptor": uid, "run_start": uid, "name": stream, ...}``
+* ``{"events": descriptor uid, "first": seq_num, "last": seq_num, ...}`` for
+  a range of Events (or EventPages) of one stream, the first of which is at
+  the given offset. The range does not span segments, but other documents
+  may be interleaved with its Events.
+
+A :class:`Journal` writes journals, and a :class:`JournalReader` reads them,
+even while they are being written.
+"""
+import json
+import mmap
+import numbers
+import os
+import pickle
+import struct
+import time as ttime
+import zlib
+
+from event_model import DocumentNames
+
+from ..run_engine import Dispatcher
+from ..utils import unpack_event_page
+
+# Marks the beginning of every segment file.
+_MAGIC = b'BSJRNL01'
+# Each frame starts with the length and the CRC32 of its payload.
+_FRAME = struct.Struct('<QI')
+_INDEX_NAME = 'index.jsonl'
+_SEGMENT_TEMPLATE = '{:08d}.journal'
+_FSYNC_POLICIES = (None, 'stop', 'always')
+
+
+def _segment_path(directory, number):
+    return os.path.join(directory, _SEGMENT_TEMPLATE.format(number))
+
+
+def _segment_numbers(directory):
+    "Return the numbers of the segments in a journal, in order."
+    numbers = []
+    for filename in os.listdir(directory):
+        stem, ext = os.path.splitext(filename)
+        if ext == '.journal' and stem.isdigit():
+            numbers.append(int(stem))
+    return sorted(numbers)
+
+
+class Journal:
+    """
+    A callback that appends every document to a journal on local disk.
+
+    Parameters
+    ----------
+    directory : string
+        Directory of the journal. It is created if needed. If it already
+        holds a journal, documents are appended to it, starting a new segment.
+    segment_size : int, optional
+        A new segment file is started once the current one has reached this
+        many bytes. Documents are never split across segments. Default is
+        1 GiB.
+    fsync : {None, 'stop', 'always'} or float, optional
+        When to force data to disk, which protects it from an operating
+        system crash or power loss, not only from the death of this process.
+        ``None`` leaves it to the operating system, 'stop' forces it at the
+        end of every run and whenever a segment is completed, 'always' after
+        every document, and a number at most once per that many seconds (and
+        at the end of every run). Default is 'stop'.
+    index_interval : int, optional
+        Maximum number of Events in one index entry. Smaller values make
+        seeking to an Event faster and the index bigger. Default is 1000.
+    serializer : function, optional
+        Function serializing a ``(name, doc)`` tuple. Default is
+        ``pickle.dumps``.
+
+    Attributes
+    ----------
+    segment : int
+        Number of the segment last written to, or -1.
+
+    Notes
+    -----
+    Every document is written to the operating system immediately, in a
+    single system call, so nothing already handed to the Journal is lost if
+    the process dies.
+
+    Example
+    -------
+
+    Journal all the documents generated by a RunEngine.
+
+    >>> RE.subscribe(Journal('/var/tmp/bluesky-journal'))
+    """
+    def __init__(self, directory, *, segment_size=2**30, fsync='stop',
+                 index_interval=1000, serializer=pickle.dumps):
+        if not (fsync in _FSYNC_POLICIES or isinstance(fsync, (int, float))):
+            raise ValueError("fsync must be one of {} or a number of seconds, "
+                             "not {!r}".format(_FSYNC_POLICIES, fsync))
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_size = segment_size
+        self.fsync = fsync
+        self.index_interval = index_interval
+        self._serializer = serializer
+        self._last_fsync = ttime.monotonic()
+        # {descriptor uid: run start uid} for the runs that are open
+        self._descriptors = {}
+        # {descriptor uid: [first seq_num, last seq_num, segment, offset,
+        #                   number of Events]} for the Events not yet indexed
+        self._ranges = {}
+        self._index = open(os.path.join(directory, _INDEX_NAME), 'a')
+        numbers = _segment_numbers(directory)
+        self.segment = numbers[-1] if numbers else -1
+        self._fd = None  # The first segment is created on the first write.
+
+    def _next_segment(self):
+        if self._fd is not None:
+            self._close_ranges(list(self._ranges))
+            if self.fsync is not None:
+                self._sync()
+            os.close(self._fd)
+        self.segment += 1
+        self._fd = os.open(_segment_path(self.directory, self.segment),
+                           os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        os.write(self._fd, _MAGIC)
+        self._offset = len(_MAGIC)
+
+    def __call__(self, name, doc):
+        name = DocumentNames(name)
+        if self._fd is None or self._offset >= self.segment_size:
+            self._next_segment()
+        payload = self._serializer((name.value, doc))
+        header = _FRAME.pack(len(payload), zlib.crc32(payload))
+        offset = self._offset
+        size = len(header) + len(payload)
+        if hasattr(os, 'writev'):
+            written = os.writev(self._fd, [header, payload])
+        else:
+            # Not POSIX (Windows): copy the frame into one buffer instead.
+            written = os.write(self._fd, header + payload)
+        if written < size:
+            # Rare, but allowed: finish the frame with more calls.
+            remainder = memoryview(header + payload)[written:]
+            while remainder:
+                remainder = remainder[os.write(self._fd, remainder):]
+        self._offset += size
+        self._update_index(name, doc, offset)
+        if self.fsync == 'always':
+            self._sync()
+        elif self.fsync is not None and name == DocumentNames.stop:
+            self._sync()
+        elif (self.fsync not in _FSYNC_POLICIES and
+                ttime.monotonic() - self._last_fsync >= self.fsync):
+            self._sync()
+
+    def _update_index(self, name, doc, offset):
+        location = {'segment': self.segment, 'offset': offset}
+        if name == DocumentNames.start:
+            self._write_index(start=doc['uid'], time=doc['time'], **location)
+        elif name == DocumentNames.descriptor:
+            self._descriptors[doc['uid']] = doc['run_start']
+            self._write_index(descriptor=doc['uid'],
+                              run_start=doc['run_start'],
+                              name=doc.get('name'), **location)
+        elif name in (DocumentNames.event, DocumentNames.event_page):
+            if name == DocumentNames.event:
+                first = last = int(doc['seq_num'])
+                count = 1
+            else:
+                first, last = int(doc['seq_num'][0]), int(doc['seq_num'][-1])
+                count = len(doc['seq_num'])
+            descriptor = doc['descriptor']
+            range_ = self._ranges.setdefault(
+                descriptor, [first, last, self.segment, offset, 0])
+            range_[1] = last
+            range_[4] += count
+            if range_[4] >= self.index_interval:
+                self._close_ranges([descriptor])
+        elif name == DocumentNames.stop:
+            run_start = doc['run_start']
+            descriptors = [uid for uid, run in self._descriptors.items()
+                           if run == run_start]
+            self._close_ranges(descriptors)
+            for uid in descriptors:
+                del self._descriptors[uid]
+            self._write_index(stop=doc['uid'], run_start=run_start,
+                              **location)
+
+    def _close_ranges(self, descriptors):
+        for descriptor in descriptors:
+            try:
+                first, last, segment, offset, _ = self._ranges.pop(descriptor)
+            except KeyError:
+                continue
+            self._write_index(events=descriptor, first=first, last=last,
+                              segment=segment, offset=offset)
+
+    def _write_index(self, **entry):
+        self._index.write(json.dumps(entry) + '\n')
+        self._index.flush()
+
+    def _sync(self):
+        os.fsync(self._fd)
+        os.fsync(self._index.fileno())
+        self._last_fsync = ttime.monotonic()
+
+    def flush(self):
+        "Index all Events received so far and force everything to disk."
+        self._close_ranges(list(self._ranges))
+        if self._fd is not None:
+            self._sync()
+
+    def close(self):
+        self.flush()
+        if self._fd is not None:
+            os.close(self._fd)
+        self._index.close()
+
+
+class JournalReader:
+    """
+    Read the runs in a journal written by a :class:`Journal`.
+
+    Segments are memory-mapped, and documents are only deserialized when
+    they are read. The journal may still be being written to: runs and
+    documents written since are picked up by later calls.
+
+    Parameters
+    ----------
+    directory : string
+        Directory of the journal.
+    deserializer : function, optional
+        Inverse of the Journal's serializer. Default is ``pickle.loads``.
+    handler_registry : dict, optional
+        Maps the spec of each 'resource' document to the handler class that
+        loads its data, as for a databroker. Handlers are created with
+        ``handler_class(path, **resource_kwargs)``, where ``path`` joins the
+        resource's ``root`` and ``resource_path``, and are called with the
+        ``datum_kwargs`` of each 'datum'. Used to fill documents (see
+        :meth:`JournalRun.documents`).
+
+    Examples
+    --------
+
+    Replay the most recent run into a callback, as fast as possible.
+
+    >>> reader = JournalReader('/var/tmp/bluesky-journal')
+    >>> reader[-1].replay(LiveTable(['det']))
+
+    Replay it in real time, or ten times faster.
+
+    >>> reader[-1].replay(LiveTable(['det']), rate=1)
+    >>> reader[-1].replay(LiveTable(['det']), rate=10)
+
+    Process every run after its end, as ``post_run`` does with a Broker.
+
+    >>> RE.subscribe(post_run(callback, reader))
+    """
+    def __init__(self, directory, *, deserializer=pickle.loads,
+                 handler_registry=None):
+        self.directory = directory
+        self._deserializer = deserializer
+        self.handler_registry = dict(handler_registry or {})
+        self._maps = {}  # {segment number: mmap}
+        self._index_offset = 0
+        self._runs = {}  # {run start uid: {key: index entry}}
+        self._descriptors = {}  # {descriptor uid: index entry}
+        self._ranges = {}  # {descriptor uid: [index entry]}
+
+    def _refresh_index(self):
+        "Read the index entries written since the last call."
+        with open(os.path.join(self.directory, _INDEX_NAME)) as f:
+            f.seek(self._index_offset)
+            for line in f:
+                if not line.endswith('\n'):
+                    break  # still being written
+                self._index_offset += len(line.encode())
+                entry = json.loads(line)
+                if 'start' in entry:
+                    self._runs[entry['start']] = {'start': entry}
+                elif 'stop' in entry:
+                    run = self._runs.get(entry['run_start'])
+                    if run is not None:
+                        run['stop'] = entry
+                elif 'descriptor' in entry:
+                    self._descriptors[entry['descriptor']] = entry
+                elif 'events' in entry:
+                    self._ranges.setdefault(entry['events'], []).append(entry)
+
+    def runs(self):
+        """
+        List the runs in the journal, oldest first.
+
+        Returns
+        -------
+        runs : list
+            a dict per run with its ``'uid'``, its ``'time'``, and whether it
+            is ``'complete'`` (its 'stop' document has been written)
+        """
+        self._refresh_index()
+        runs = sorted(self._runs.items(),
+                      key=lambda item: item[1]['start']['time'])
+        return [{'uid': uid, 'time': run['start']['time'],
+                 'complete': 'stop' in run}
+                for uid, run in runs]
+
+    def __getitem__(self, key):
+        """
+        Get a run by the uid of its 'start' document, or by position (for
+        example, -1 is the most recent run).
+        """
+        if isinstance(key, int):
+            key = self.runs()[key]['uid']
+        else:
+            self._refresh_index()
+        if key not in self._runs:
+            raise KeyError(key)
+        return JournalRun(self, key)
+
+    def __iter__(self):
+        for run in self.runs():
+            yield JournalRun(self, run['uid'])
+
+    def process(self, run, callback):
+        "Pass all the documents of a run to a callback."
+        run.replay(callback)
+
+    def _map(self, segment, end):
+        "Return the mmap of a segment, covering at least ``end`` bytes."
+        mm = self._maps.get(segment)
+        if mm is None or len(mm) < end:
+            path = _segment_path(self.directory, segment)
+            try:
+                with open(path, 'rb') as f:
+                    size = os.fstat(f.fileno()).st_size
+                    if size == 0:
+                        return None  # just created
+                    if mm is not None and size == len(mm):
+                        return mm
+                    mm = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+            except FileNotFoundError:
+                return None
+            self._maps[segment] = mm
+        return mm
+
+    def _frames(self, segment, offset):
+        """
+        Yield ``(segment, offset, name, doc)`` for each document from the
+        given location to the end of the journal.
+        """
+        while True:
+            mm = self._map(segment, offset + _FRAME.size)
+            if mm is None:
+                return
+            if len(mm) >= offset + _FRAME.size:
+                length, crc = _FRAME.unpack_from(mm, offset)
+                start = offset + _FRAME.size
+                mm = self._map(segment, start + length)
+                payload = memoryview(mm)[start:start + length]
+                if len(payload) == length and zlib.crc32(payload) == crc:
+                    name, doc = self._deserializer(payload)
+                    del payload  # Release the mmap, so it can be remapped.
+                    yield segment, offset, name, doc
+                    offset = start + length
+                    continue
+                del payload
+            # This is the end of the segment, or a frame still (or never
+            # completely) being written. Go on with the next segment, if any.
+            if not os.path.exists(_segment_path(self.directory,
+                                                segment + 1)):
+                return
+            segment, offset = segment + 1, len(_MAGIC)
+
+    def close(self):
+        for mm in self._maps.values():
+            mm.close()
+        self._maps.clear()
+
+
+def _doc_time(doc):
+    "Return the time of a document (of the first Event of an EventPage)."
+    time_ = doc.get('time')
+    if isinstance(time_, numbers.Number):
+        return time_
+    try:
+        return time_[0]
+    except (TypeError, IndexError):
+        return None
+
+
+def _fill(documents, handler_registry):
+    "Load externally-stored data into the Events and EventPages of a run."
+    external = {}  # {descriptor uid: fields stored externally}
+    resources = {}
+    datums = {}  # {datum id: (resource uid, datum_kwargs)}
+    handlers = {}  # {resource uid: handler}
+
+    def load(datum_id):
+        resource_uid, datum_kwargs = datums[datum_id]
+        try:
+            handler = handlers[resource_uid]
+        except KeyError:
+            resource = resources[resource_uid]
+            try:
+                handler_class = handler_registry[resource['spec']]
+            except KeyError:
+                raise KeyError("No handler is registered for the spec {!r}."
+                               "".format(resource['spec'])) from None
+            path = os.path.join(resource.get('root', ''),
+                                resource['resource_path'])
+            handler = handlers[resource_uid] = handler_class(
+                path, **resource.get('resource_kwargs', {}))
+        return handler(**datum_kwargs)
+
+    for name, doc in documents:
+        if name == 'descriptor':
+            external[doc['uid']] = [key for key, data_key
+                                    in doc['data_keys'].items()
+                                    if data_key.get('external')]
+        elif name == 'resource':
+            resources[doc['uid']] = doc
+        elif name == 'datum':
+            datums[doc['datum_id']] = (doc['resource'], doc['datum_kwargs'])
+        elif name == 'datum_page':
+            for i, datum_id in enumerate(doc['datum_id']):
+                datums[datum_id] = (doc['resource'],
+                                    {key: values[i] for key, values
+                                     in doc['datum_kwargs'].items()})
+        elif name in ('event', 'event_page') and external.get(
+                doc['descriptor']):
+            page = name == 'event_page'
+            data = dict(doc['data'])
+            filled = dict(doc.get('filled', {}))
+            for key in external[doc['descriptor']]:
+                done = filled.get(key, False)
+                if page:
+                    done = bool(done) and all(done)
+                if key not in data or done:
+                    continue
+                if page:
+                    data[key] = [load(datum_id) for datum_id in data[key]]
+                    filled[key] = [True] * len(data[key])
+                else:
+                    data[key] = load(data[key])
+                    filled[key] = True
+            doc = dict(doc, data=data, filled=filled)
+        yield name, doc
+
+
+class JournalRun:
+    """
+    One run in a journal. Get these from a :class:`JournalReader`.
+
+    Attributes
+    ----------
+    uid : string
+        uid of the run's 'start' document
+    """
+    def __init__(self, reader, uid):
+        self._reader = reader
+        self.uid = uid
+
+    def __repr__(self):
+        return 'JournalRun({!r})'.format(self.uid)
+
+    def documents(self, fill=False):
+        """
+        Yield the ``(name, doc)`` pairs of the run, in the order they were
+        written.
+
+        Parameters
+        ----------
+        fill : boolean, optional
+            If True, replace the datum ids of externally-stored fields in
+            Events and EventPages with the data, loaded by the reader's
+            ``handler_registry``. Default is False.
+        """
+        entry = self._reader._runs[self.uid]['start']
+        documents = self._documents(entry['segment'], entry['offset'])
+        if fill:
+            documents = _fill(documents, self._reader.handler_registry)
+        yield from documents
+
+    def _documents(self, segment, offset, descriptors=None):
+        """
+        Yield the documents of the run from a location on, until its 'stop'.
+
+        If ``descriptors`` is given, only the Events and EventPages of those
+        descriptors are yielded.
+        """
+        uid = self.uid
+        run_descriptors = set()
+        resources = set()
+        for _, _, name, doc in self._reader._frames(segment, offset):
+            if name == 'start':
+                ours = doc['uid'] == uid
+            elif name in ('stop', 'descriptor', 'resource'):
+                ours = doc.get('run_start') == uid
+                if ours and name == 'descriptor':
+                    run_descriptors.add(doc['uid'])
+                elif ours and name == 'resource':
+                    resources.add(doc['uid'])
+            elif name in ('event', 'event_page'):
+                if descriptors is not None:
+                    ours = doc['descriptor'] in descriptors
+                else:
+                    ours = doc['descriptor'] in run_descriptors
+            elif name in ('datum', 'datum_page'):
+                ours = doc['resource'] in resources
+            elif name == 'bulk_events':
+                ours = any(key in run_descriptors for key in doc)
+            else:
+                ours = False
+            if descriptors is not None:
+                if name in ('event', 'event_page') and ours:
+                    yield name, doc
+                elif name == 'stop' and ours:
+                    return
+                continue
+            if ours:
+                yield name, doc
+                if name == 'stop':
+                    return
+
+    def events(self, stream_name='primary', seq_num=1):
+        """
+        Yield the Events of a stream, starting from a sequence number.
+
+        The index is used to find where to start reading, so this does not
+        read the documents of the run that come before.
+
+        Parameters
+        ----------
+        stream_name : string, optional
+            Default is 'primary'.
+        seq_num : int, optional
+            Default is 1.
+        """
+        reader = self._reader
+        reader._refresh_index()
+        descriptors = {uid for uid, entry in reader._descriptors.items()
+                       if entry['run_start'] == self.uid and
+                       entry['name'] == stream_name}
+        if not descriptors:
+            return
+        # For each descriptor, start from the last indexed range beginning
+        # at or before seq_num, or from the descriptor itself.
+        starts = []
+        for descriptor in descriptors:
+            entry = reader._descriptors[descriptor]
+            location = (entry['segment'], entry['offset'])
+            for range_ in reader._ranges.get(descriptor, []):
+                if range_['first'] <= seq_num:
+                    location = max(location,
+                                   (range_['segment'], range_['offset']))
+            starts.append(location)
+        for name, doc in self._documents(*min(starts),
+                                         descriptors=descriptors):
+            if name == 'event_page':
+                events = unpack_event_page(doc)
+            else:
+                events = [doc]
+            for event in events:
+                if event['seq_num'] >= seq_num:
+                    yield event
+
+    def replay(self, callback, rate=None):
+        """
+        Pass all the documents of the run to a callback or a Dispatcher.
+
+        Parameters
+        ----------
+        callback : callable or Dispatcher
+            A callable with signature ``f(name, doc)``, or a Dispatcher,
+            such as a RunEngine's, whose ``process`` method is called.
+        rate : float, optional
+            If given, pace the documents by the times at which they were
+            created, this many times faster than real time (1 is real time).
+            By default, documents are passed on as fast as possible.
+        """
+        if isinstance(callback, Dispatcher):
+            def deliver(name, doc):
+                callback.process(DocumentNames[name], doc)
+        else:
+            deliver = callback
+        t0 = None
+        for name, doc in self.documents():
+            if rate is not None:
+                doc_time = _doc_time(doc)
+                if doc_time is not None:
+                    if t0 is None:
+                        t0, wall0 = doc_time, ttime.monotonic()
+                    delay = ((doc_time - t0) / rate -
+                             (ttime.monotonic() - wall0))
+                    if delay > 0:
+                        ttime.sleep(delay)
+            deliver(name, doc)
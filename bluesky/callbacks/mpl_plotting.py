@@ -1,13 +1,129 @@
-from collections import ChainMap
+from collections import ChainMap, OrderedDict
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
 from cycler import cycler
 import numpy as np
+import time as ttime
 import warnings
 
 from .core import CallbackBase, get_obj_fields
 
 
+class _ArrayBuffer:
+    """
+    An array that grows by appending, in amortized constant time.
+
+    Space is allocated ahead of time and doubled when it runs out.
+    """
+    def __init__(self, shape=(), dtype=float, capacity=64):
+        self._data = np.empty((capacity,) + tuple(shape), dtype=dtype)
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    @property
+    def values(self):
+        "The values appended so far (a view, not a copy)"
+        return self._data[:self._len]
+
+    def append(self, value):
+        if self._len == len(self._data):
+            data = np.empty((2 * len(self._data),) + self._data.shape[1:],
+                            dtype=self._data.dtype)
+            data[:self._len] = self._data[:self._len]
+            self._data = data
+        self._data[self._len] = value
+        self._len += 1
+
+
+class _Throttle:
+    """
+    Call a function at most ``max_fps`` times per second.
+
+    A call that comes too soon is put off, using a timer of the figure's
+    canvas so that the function runs in the GUI event loop, until enough
+    time has passed. Calls that come in the meantime are merged into it.
+    """
+    def __init__(self, figure, func, max_fps):
+        self.figure = figure
+        self.func = func
+        self.max_fps = max_fps
+        self._last_call = None
+        self._timer = None
+
+    def __call__(self):
+        if self.max_fps is None or self._last_call is None:
+            wait = 0
+        else:
+            wait = self._last_call + 1 / self.max_fps - ttime.monotonic()
+        if wait <= 0:
+            self._call()
+        elif self._timer is None:
+            self._timer = self.figure.canvas.new_timer(
+                interval=int(1000 * wait) + 1)
+            self._timer.single_shot = True
+            self._timer.add_callback(self._call)
+            self._timer.start()
+
+    @property
+    def pending(self):
+        "Whether a call has been put off"
+        return self._timer is not None
+
+    def flush(self):
+        "Make the call that was put off, if any, now."
+        if self.pending:
+            self._call()
+
+    def reset(self):
+        "Drop the call that was put off, if any, and start over."
+        if self._timer is not None:
+            self._timer.stop()
+            self._timer = None
+        self._last_call = None
+
+    def _call(self):
+        if self._timer is not None:
+            self._timer.stop()
+            self._timer = None
+        self._last_call = ttime.monotonic()
+        self.func()
+
+
+def _decimate(x, y, num):
+    """
+    Reduce a line to at most ``4 * num`` points that look the same when drawn.
+
+    The range of x is split into ``num`` equal bins, one per pixel. Of the
+    points in each bin, the first, last, lowest, and highest are kept, in
+    their original order. If x is not monotonic (a scan that goes back and
+    forth, say), points far apart along the line could fall in the same bin,
+    so the line is returned unchanged.
+    """
+    if len(y) <= 4 * num:
+        return x, y
+    step = np.diff(x)
+    if not (np.all(step >= 0) or np.all(step <= 0)):
+        return x, y
+    span = x[-1] - x[0]
+    if span == 0:
+        pixels = np.zeros(len(x), dtype=int)
+    else:
+        pixels = np.minimum(((x - x[0]) / span * num).astype(int), num - 1)
+    starts = np.flatnonzero(np.diff(pixels)) + 1
+    first = np.concatenate([[0], starts])
+    last = np.concatenate([starts - 1, [len(y) - 1]])
+    # The bins are contiguous, so sorting by bin and then by y puts the
+    # lowest point of each bin at its first position, the highest at its
+    # last.
+    nans = np.isnan(y)
+    lowest = np.lexsort((np.where(nans, np.inf, y), pixels))[first]
+    highest = np.lexsort((np.where(nans, -np.inf, y), pixels))[last]
+    index = np.unique(np.concatenate([first, last, lowest, highest]))
+    return x[index], y[index]
+
+
 class LivePlot(CallbackBase):
     """
     Build a function that updates a plot from a stream of Events.
@@ -40,6 +156,23 @@ class LivePlot(CallbackBase):
     epoch : {'run', 'unix'}, optional
         If 'run' t=0 is the time recorded in the RunStart document. If 'unix',
         t=0 is 1 Jan 1970 ("the UNIX epoch"). Default is 'run'.
+    max_fps : float, optional
+        Redraw at most this many times per second. Events that arrive in
+        between are drawn together, once enough time has passed (by a timer
+        of the figure's canvas), or at the end of the run. By default, the
+        plot is redrawn for every Event.
+    decimate : bool, optional
+        If True (default), draw long lines with only the points that are
+        visible at the resolution of the axes: for each pixel along x, the
+        first, last, lowest, and highest point. Lines whose x values go
+        back and forth are always drawn in full.
+    max_runs : int, optional
+        Keep the lines of at most this many runs on the axes, removing the
+        oldest when a new run starts. By default, all are kept.
+    keep_removed_runs : bool, optional
+        If True, keep the data of runs removed from the axes in
+        :attr:`removed_runs`, so that they can be plotted again with
+        :meth:`recall`. Default is False.
     All additional keyword arguments are passed through to ``Axes.plot``.
 
     Examples
@@ -48,7 +181,8 @@ class LivePlot(CallbackBase):
     >>> RE(my_scan, my_plotter)
     """
     def __init__(self, y, x=None, *, legend_keys=None, xlim=None, ylim=None,
-                 ax=None, fig=None, epoch='run', **kwargs):
+                 ax=None, fig=None, epoch='run', max_fps=None, decimate=True,
+                 max_runs=None, keep_removed_runs=False, **kwargs):
         super().__init__()
         if fig is not None:
             if ax is not None:
@@ -84,20 +218,95 @@ class LivePlot(CallbackBase):
         self.legend_title = " :: ".join([name for name in self.legend_keys])
         self._epoch_offset = None  # used if x == 'time'
         self._epoch = epoch
+        self.decimate = decimate
+        self._x_buffer = _ArrayBuffer()
+        self._y_buffer = _ArrayBuffer()
+        self._throttle = _Throttle(self.ax.figure,
+                                   lambda: self.update_plot(), max_fps)
+        if max_runs is not None and max_runs < 1:
+            raise ValueError("max_runs must be at least 1.")
+        self.max_runs = max_runs
+        self.keep_removed_runs = keep_removed_runs
+        # {start uid: [line, ...]} for the runs on the axes, oldest first;
+        # the first line is the run's data
+        self._runs = OrderedDict()
+        self._run_uid = None
+        # {start uid: (x, y)} for the runs on the axes that have ended
+        self._run_data = {}
+        # {start uid: (label, x, y)} for the runs removed from the axes
+        self.removed_runs = OrderedDict()
 
     def start(self, doc):
         # The doc is not used; we just use the signal that a new run began.
         self._epoch_offset = doc['time']  # used if self.x == 'time'
-        self.x_data, self.y_data = [], []
+        # New buffers: the last run's line may still be using the old ones.
+        self._x_buffer = _ArrayBuffer()
+        self._y_buffer = _ArrayBuffer()
+        self.x_data = self._x_buffer.values
+        self.y_data = self._y_buffer.values
+        self._throttle.reset()
         label = " :: ".join(
             [str(doc.get(name, name)) for name in self.legend_keys])
         kwargs = ChainMap(self.kwargs, {'label': label})
         self.current_line, = self.ax.plot([], [], **kwargs)
         self.lines.append(self.current_line)
+        self._run_uid = doc['uid']
+        self._runs[self._run_uid] = [self.current_line]
+        self._remove_old_runs()
         self.legend = self.ax.legend(
             loc=0, title=self.legend_title).draggable()
         super().start(doc)
 
+    def _remove_old_runs(self):
+        if self.max_runs is None:
+            return
+        for uid in list(self._runs):
+            if len(self._runs) <= self.max_runs:
+                break
+            lines = self._runs[uid]
+            if self.current_line in lines:
+                continue
+            del self._runs[uid]
+            for line in lines:
+                line.remove()
+                self.lines.remove(line)
+            line = lines[0]
+            x, y = self._run_data.pop(uid, None) or line.get_data()
+            if self.keep_removed_runs:
+                # Copy, to let go of the buffers' spare room.
+                self.removed_runs[uid] = (line.get_label(), np.array(x),
+                                          np.array(y))
+
+    def recall(self, uid):
+        """
+        Plot a run that was removed from the axes again.
+
+        It counts as the most recent run, so the oldest run on the axes may
+        be removed to make room for it.
+
+        Parameters
+        ----------
+        uid : string
+            uid of the run's 'start' document
+        """
+        label, x, y = self.removed_runs.pop(uid)
+        if self.decimate:
+            x_shown, y_shown = _decimate(x, y,
+                                         max(int(self.ax.bbox.width), 1))
+        else:
+            x_shown, y_shown = x, y
+        kwargs = ChainMap({'label': label}, self.kwargs)
+        line, = self.ax.plot(x_shown, y_shown, **kwargs)
+        self.lines.append(line)
+        self._runs[uid] = [line]
+        self._run_data[uid] = (x, y)
+        self._remove_old_runs()
+        self.legend = self.ax.legend(
+            loc=0, title=self.legend_title).draggable()
+        self.ax.relim(visible_only=True)
+        self.ax.autoscale_view(tight=True)
+        self.ax.figure.canvas.draw_idle()
+
     def event(self, doc):
         "Unpack data from the event and call self.update()."
         # This outer try/except block is needed because multiple event
@@ -125,25 +334,41 @@ class LivePlot(CallbackBase):
             new_x -= self._epoch_offset
 
         self.update_caches(new_x, new_y)
-        self.update_plot()
+        self._throttle()
         super().event(doc)
 
     def update_caches(self, x, y):
-        self.y_data.append(y)
-        self.x_data.append(x)
+        self._y_buffer.append(y)
+        self._x_buffer.append(x)
+        self.x_data = self._x_buffer.values
+        self.y_data = self._y_buffer.values
 
     def update_plot(self):
-        self.current_line.set_data(self.x_data, self.y_data)
+        x_data, y_data = self.x_data, self.y_data
+        if self.decimate:
+            x_data, y_data = _decimate(x_data, y_data,
+                                       max(int(self.ax.bbox.width), 1))
+        self.current_line.set_data(x_data, y_data)
         # Rescale and redraw.
         self.ax.relim(visible_only=True)
         self.ax.autoscale_view(tight=True)
         self.ax.figure.canvas.draw_idle()
 
+    @property
+    def max_fps(self):
+        return self._throttle.max_fps
+
+    @max_fps.setter
+    def max_fps(self, max_fps):
+        self._throttle.max_fps = max_fps
+
     def stop(self, doc):
-        if not self.x_data:
+        self._throttle.flush()
+        self._run_data[self._run_uid] = (self.x_data, self.y_data)
+        if not len(self.x_data):
             print('LivePlot did not get any data that corresponds to the '
                   'x axis. {}'.format(self.x))
-        if not self.y_data:
+        if not len(self.y_data):
             print('LivePlot did not get any data that corresponds to the '
                   'y axis. {}'.format(self.y))
         if len(self.y_data) != len(self.x_data):
@@ -177,6 +402,12 @@ class LiveScatter(CallbackBase):
     ax : Axes, optional
         matplotib Axes; if none specified, new figure and axes are made.
 
+    max_fps : float, optional
+        Update the plot at most this many times per second. Points that
+        arrive in between are shown together, once enough time has passed
+        (by a timer of the figure's canvas), or at the end of the run. By
+        default, the plot is updated for every Event.
+
     All additional keyword arguments are passed through to ``Axes.scatter``.
 
     See Also
@@ -184,7 +415,7 @@ class LiveScatter(CallbackBase):
     :class:`bluesky.callbacks.LiveGrid`.
     """
     def __init__(self, x, y, I, *, xlim=None, ylim=None,
-                 clim=None, cmap='viridis', ax=None, **kwargs):
+                 clim=None, cmap='viridis', ax=None, max_fps=None, **kwargs):
         if ax is None:
             fig, ax = plt.subplots()
             fig.show()
@@ -198,9 +429,13 @@ class LiveScatter(CallbackBase):
         self._sc = []
         self.ax = ax
         ax.margins(.1)
-        self._xdata, self._ydata, self._Idata = [], [], []
+        self._offsets = _ArrayBuffer(shape=(2,))
+        self._Idata = _ArrayBuffer()
         self._norm = mcolors.Normalize()
         self._minx, self._maxx, self._miny, self._maxy = (None,)*4
+        self._minI, self._maxI = None, None
+        self._throttle = _Throttle(ax.figure, lambda: self.update_plot(),
+                                   max_fps)
 
         self.xlim = xlim
         self.ylim = ylim
@@ -217,10 +452,13 @@ class LiveScatter(CallbackBase):
         self.kwargs.setdefault('s', 50)
 
     def start(self, doc):
-        self._xdata.clear()
-        self._ydata.clear()
-        self._Idata.clear()
-        sc = self.ax.scatter(self._xdata, self._ydata, c=self._Idata,
+        # New buffers: the last run's scatter may still be using the old ones.
+        self._offsets = _ArrayBuffer(shape=(2,))
+        self._Idata = _ArrayBuffer()
+        self._minx, self._maxx, self._miny, self._maxy = (None,)*4
+        self._minI, self._maxI = None, None
+        self._throttle.reset()
+        sc = self.ax.scatter([], [], c=[],
                              norm=self._norm, cmap=self.cmap, **self.kwargs)
         self._sc.append(sc)
         self.sc = sc
@@ -242,25 +480,42 @@ class LiveScatter(CallbackBase):
             self._maxx = x
             self._miny = y
             self._maxy = y
-
-        self._xdata.append(x)
-        self._ydata.append(y)
+        self._minx, self._maxx = min(x, self._minx), max(x, self._maxx)
+        self._miny, self._maxy = min(y, self._miny), max(y, self._maxy)
+        if not np.isnan(I):
+            if self._minI is None:
+                self._minI, self._maxI = I, I
+            self._minI, self._maxI = min(I, self._minI), max(I, self._maxI)
+
+        self._offsets.append((x, y))
         self._Idata.append(I)
-        offsets = np.vstack([self._xdata, self._ydata]).T
-        self.sc.set_offsets(offsets)
-        self.sc.set_array(np.asarray(self._Idata))
+        self._throttle()
+
+    def update_plot(self):
+        # The buffers' views are handed over without copying.
+        self.sc.set_offsets(self._offsets.values)
+        self.sc.set_array(self._Idata.values)
 
         if self.xlim is None:
-            minx, maxx = np.minimum(x, self._minx), np.maximum(x, self._maxx)
-            self.ax.set_xlim(minx, maxx)
+            self.ax.set_xlim(self._minx, self._maxx)
 
         if self.ylim is None:
-            miny, maxy = np.minimum(y, self._miny), np.maximum(y, self._maxy)
-            self.ax.set_ylim(miny, maxy)
+            self.ax.set_ylim(self._miny, self._maxy)
+
+        if self.clim is None and self._minI is not None:
+            self.sc.set_clim(self._minI, self._maxI)
+
+    @property
+    def max_fps(self):
+        return self._throttle.max_fps
+
+    @max_fps.setter
+    def max_fps(self, max_fps):
+        self._throttle.max_fps = max_fps
 
-        if self.clim is None:
-            clim = np.nanmin(self._Idata), np.nanmax(self._Idata)
-            self.sc.set_clim(*clim)
+    def stop(self, doc):
+        self._throttle.flush()
+        super().stop(doc)
 
 
 class LiveMesh(LiveScatter):
@@ -318,6 +573,12 @@ class LiveGrid(CallbackBase):
         Defines the positive direction of the y axis, takes the values 'up'
         (default) or 'down'.
 
+    max_fps : float, optional
+        Update the image at most this many times per second. Pixels that
+        arrive in between are shown together, once enough time has passed
+        (by a timer of the figure's canvas), or at the end of the run. By
+        default, the image is updated for every Event.
+
     See Also
     --------
     :class:`bluesky.callbacks.LiveScatter`.
@@ -325,7 +586,8 @@ class LiveGrid(CallbackBase):
     def __init__(self, raster_shape, I, *,
                  clim=None, cmap='viridis',
                  xlabel='x', ylabel='y', extent=None, aspect='equal',
-                 ax=None, x_positive='right', y_positive='up'):
+                 ax=None, x_positive='right', y_positive='up',
+                 max_fps=None):
         if ax is None:
             fig, ax = plt.subplots()
         ax.cla()
@@ -346,11 +608,16 @@ class LiveGrid(CallbackBase):
         self.aspect = aspect
         self.x_positive = x_positive
         self.y_positive = y_positive
+        self._minI, self._maxI = None, None
+        self._throttle = _Throttle(ax.figure, lambda: self.update_plot(),
+                                   max_fps)
 
     def start(self, doc):
         if self.im is not None:
             raise RuntimeError("Can not re-use LiveGrid")
         self._Idata = np.ones(self.raster_shape) * np.nan
+        self._minI, self._maxI = None, None
+        self._throttle.reset()
         # The user can control origin by specific 'extent'.
         extent = self.extent
         # origin must be 'lower' for the plot to fill in correctly
@@ -406,11 +673,43 @@ class LiveGrid(CallbackBase):
         super().event(doc)
 
     def update(self, pos, I):
+        old = self._Idata[pos]
         self._Idata[pos] = I
-        if self.clim is None:
-            self.im.set_clim(np.nanmin(self._Idata), np.nanmax(self._Idata))
+        # Write the pixel into the image's own (masked) copy of the data,
+        # rather than have the image copy the whole raster again.
+        if np.isnan(I):
+            self.im.get_array()[pos] = np.ma.masked
+        else:
+            self.im.get_array()[pos] = I
+        if old in (self._minI, self._maxI):
+            # An extreme value was overwritten: start over.
+            self._minI, self._maxI = None, None
+            if not np.all(np.isnan(self._Idata)):
+                self._minI = np.nanmin(self._Idata)
+                self._maxI = np.nanmax(self._Idata)
+        elif not np.isnan(I):
+            if self._minI is None:
+                self._minI, self._maxI = I, I
+            self._minI, self._maxI = min(I, self._minI), max(I, self._maxI)
+
+        self._throttle()
 
-        self.im.set_array(self._Idata)
+    def update_plot(self):
+        if self.clim is None and self._minI is not None:
+            self.im.set_clim(self._minI, self._maxI)
+        self.im.changed()
+
+    @property
+    def max_fps(self):
+        return self._throttle.max_fps
+
+    @max_fps.setter
+    def max_fps(self, max_fps):
+        self._throttle.max_fps = max_fps
+
+    def stop(self, doc):
+        self._throttle.flush()
+        super().stop(doc)
 
 
 class LiveRaster(LiveGrid):
@@ -445,6 +744,9 @@ class LiveFitPlot(LivePlot):
         passed to Axes.set_ylim
     ax : Axes, optional
         matplotib Axes; if none specified, new figure and axes are made.
+    max_runs, keep_removed_runs : optional
+        as for :class:`LivePlot`; a run's initial guess is removed with its
+        fit
     All additional keyword arguments are passed through to ``Axes.plot``.
     """
     def __init__(self, livefit, *, num_points=100, legend_keys=None, xlim=None,
@@ -476,6 +778,8 @@ class LiveFitPlot(LivePlot):
         self.init_guess_line, = self.ax.plot([], [], color='grey', label=label)
         self.lines.append(self.init_guess_line)
         super().start(doc)
+        # The initial guess goes with the run's fit, when it is removed.
+        self._runs[self._run_uid].append(self.init_guess_line)
         # Put fit above other lines (default 2) but below text (default 3).
         [line.set_zorder(2.5) for line in self.lines]
 
@@ -0,0 +1,282 @@
+"""
+Run callbacks, such as live plots, in a separate process.
+
+Drawing a figure can take longer than taking a reading. When a plotting
+callback runs in the RunEngine's process, its drawing time is time the
+RunEngine spends not acquiring. A :class:`ProcessCallback` creates the
+callback in a child process instead, which has its own matplotlib figures and
+event loop, and forwards documents to it. Passing a document to a
+ProcessCallback only puts it on a queue.
+"""
+import logging
+import multiprocessing
+import pickle
+import queue
+import threading
+import time
+import traceback
+
+logger = logging.getLogger(__name__)
+
+# How long the child process lets the GUI run between checks for documents
+_GUI_INTERVAL = 0.05
+# Documents sent to the child process in one message, at most
+_BATCH_SIZE = 1000
+# How often a caller waiting for a reply checks that the child is alive
+_REPLY_POLL_INTERVAL = 0.1
+
+
+class ProcessCallback:
+    """
+    A callback that forwards documents to a callback in another process.
+
+    The callback is created in a new process by calling
+    ``factory(*args, **kwargs)``. Documents are pickled and sent to it by a
+    background thread, in batches of whatever has accumulated, so that the
+    RunEngine never waits on the child process. The child process handles
+    all the documents that have arrived, then lets matplotlib redraw the
+    figures that changed, so it draws only the latest state when it falls
+    behind. No documents are dropped: a plot needs all of its points. (A
+    document that cannot be pickled is skipped, and the failure logged.)
+
+    Public attributes and methods of the callback are reached through the
+    ProcessCallback: reading an attribute fetches a copy of its value from
+    the child process, and calling a method calls it there. Setting an
+    attribute does not reach the callback. Arguments that refer to objects
+    of this process, such as the ``ax`` or ``fig`` of a plotting callback,
+    cannot be used: the callback makes its own figures in the child
+    process.
+
+    The child process is started with the 'spawn' method, which imports the
+    ``__main__`` module again in the child. In a script, create
+    ProcessCallbacks and run plans under ``if __name__ == '__main__':``, or
+    the child process runs them too.
+
+    Parameters
+    ----------
+    factory : callable
+        Creates the callback, typically a callback class. It must be
+        picklable, so lambdas and locally defined functions will not do.
+    *args
+        passed to ``factory``
+    backend : string, optional
+        matplotlib backend to use in the child process. By default,
+        matplotlib's default backend.
+    **kwargs
+        passed to ``factory``
+
+    Examples
+    --------
+
+    Plot in another process, so that drawing does not slow down the scan.
+
+    >>> RE.subscribe(ProcessCallback(LivePlot, 'det', 'motor'))
+
+    The same, for the BestEffortCallback, whose methods and attributes are
+    reached through the ProcessCallback.
+
+    >>> bec = ProcessCallback(BestEffortCallback)
+    >>> RE.subscribe(bec)
+    >>> bec.disable_table()
+    >>> peaks = bec.peaks
+    """
+    def __init__(self, factory, *args, backend=None, **kwargs):
+        # Start the child process afresh, rather than with a copy of this
+        # process's GUI and event loop state.
+        context = multiprocessing.get_context('spawn')
+        self._conn, child_conn = context.Pipe()
+        self._process = context.Process(
+            target=_serve, args=(child_conn, factory, args, kwargs, backend),
+            name='bluesky-callback', daemon=True)
+        self._process.start()
+        child_conn.close()
+        self._queue = queue.Queue()
+        self._call_lock = threading.Lock()
+        # Replies to requests that failed before reaching the child process
+        self._local_replies = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._send_loop,
+                                        name='bluesky-process-callback',
+                                        daemon=True)
+        self._thread.start()
+
+    def __call__(self, name, doc):
+        self._queue.put(('document', name, doc))
+
+    def __getattr__(self, name):
+        # Only reached for attributes that the ProcessCallback itself does
+        # not have. Private ones are not forwarded.
+        if name.startswith('_'):
+            raise AttributeError(name)
+        is_method, value = self._request(('getattr', name))
+        if not is_method:
+            return value
+
+        def method(*args, **kwargs):
+            return self.call(name, *args, **kwargs)
+        method.__name__ = name
+        return method
+
+    def call(self, method, *args, **kwargs):
+        """
+        Call a method of the callback and return the result.
+
+        The call is made after the documents sent so far have been handled,
+        so the result reflects them.
+
+        Parameters
+        ----------
+        method : string
+            name of the method
+        *args, **kwargs
+            passed to the method. They and the result must be picklable.
+        """
+        return self._request(('call', method, args, kwargs))
+
+    def _request(self, message):
+        "Send a request to the child process and wait for its reply."
+        with self._call_lock:
+            self._queue.put(message)
+            while True:
+                try:
+                    if self._conn.poll(_REPLY_POLL_INTERVAL):
+                        ok, result = self._conn.recv()
+                        break
+                except EOFError:
+                    raise RuntimeError("The callback process has exited.")
+                try:
+                    ok, result = self._local_replies.get_nowait()
+                    break
+                except queue.Empty:
+                    pass
+                if not self._process.is_alive():
+                    raise RuntimeError("The callback process has exited.")
+        if not ok:
+            error, details = result
+            if error == 'AttributeError' and message[0] == 'getattr':
+                raise AttributeError(message[1])
+            raise RuntimeError("{!r} failed in the callback process:\n{}"
+                               "".format(message[1], details))
+        return result
+
+    def _send_loop(self):
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            while item[0] == 'document' and len(batch) < _BATCH_SIZE:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+            # Pickle each message on its own, so that one that cannot be
+            # pickled is the only one lost.
+            pickled = []
+            for message in batch:
+                try:
+                    pickled.append(pickle.dumps(
+                        message, protocol=pickle.HIGHEST_PROTOCOL))
+                except Exception:
+                    if message[0] == 'document':
+                        logger.exception("Failed to pickle a %r document "
+                                         "for the callback process",
+                                         message[1])
+                    else:
+                        # Reply to the waiting caller here.
+                        self._local_replies.put(
+                            (False, (None, traceback.format_exc())))
+            try:
+                self._conn.send_bytes(
+                    pickle.dumps(pickled, protocol=pickle.HIGHEST_PROTOCOL))
+            except Exception:
+                logger.exception("Failed to send %d message(s) to the "
+                                 "callback process", len(pickled))
+            for _ in batch:
+                self._queue.task_done()
+            if item[0] == 'close':
+                return
+
+    def close(self, timeout=None):
+        """
+        Wait for the documents sent so far to be handled, and stop the
+        process.
+
+        Figures in the child process are closed with it.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Seconds to wait for the process to finish before killing it.
+            By default, wait as long as it takes.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(('close',))
+        self._thread.join()
+        self._process.join(timeout)
+        if self._process.is_alive():
+            self._process.terminate()
+        self._conn.close()
+
+
+def _serve(conn, factory, args, kwargs, backend):
+    "Run the callback in the child process."
+    try:
+        import matplotlib
+    except ImportError:
+        plt = None
+    else:
+        if backend is not None:
+            matplotlib.use(backend)
+        import matplotlib.pyplot as plt
+        plt.ion()
+    callback = factory(*args, **kwargs)
+    while True:
+        # Handle what has arrived, then let the figures redraw. Documents
+        # that keep arriving hold up the figures for _GUI_INTERVAL at most.
+        deadline = time.monotonic() + _GUI_INTERVAL
+        while time.monotonic() < deadline and conn.poll(_GUI_INTERVAL / 10):
+            for message in pickle.loads(conn.recv_bytes()):
+                message = pickle.loads(message)
+                kind = message[0]
+                if kind == 'document':
+                    _, name, doc = message
+                    try:
+                        callback(name, doc)
+                    except Exception:
+                        logger.exception("%r failed on a %r document",
+                                         callback, name)
+                elif kind in ('call', 'getattr'):
+                    try:
+                        conn.send((True, _handle_request(callback, message)))
+                    except Exception as err:
+                        conn.send((False, (type(err).__name__,
+                                           traceback.format_exc())))
+                elif kind == 'close':
+                    return
+        if plt is None or not plt.get_fignums():
+            conn.poll(_GUI_INTERVAL)
+        else:
+            _run_gui(plt, _GUI_INTERVAL)
+
+
+def _handle_request(callback, message):
+    if message[0] == 'call':
+        _, method, args, kwargs = message
+        return getattr(callback, method)(*args, **kwargs)
+    _, name = message
+    value = getattr(callback, name)
+    # Methods are called through 'call' rather than sent back.
+    if callable(value):
+        return (True, None)
+    return (False, value)
+
+
+def _run_gui(plt, interval):
+    "Draw the figures that changed and run the GUI event loop for a while."
+    figures = [plt.figure(num) for num in plt.get_fignums()]
+    for figure in figures:
+        if figure.stale:
+            figure.canvas.draw_idle()
+    figures[-1].canvas.start_event_loop(interval)
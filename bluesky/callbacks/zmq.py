@@ -1,12 +1,468 @@
 import asyncio
-import copy
+from collections import deque, OrderedDict
+import logging
+import mmap
 import multiprocessing
 import os
 import pickle
+import queue
+import shutil
 import socket
+import struct
+import tempfile
+import threading
 import time
+import weakref
+
+import numpy as np
+
 from ..run_engine import Dispatcher, DocumentNames
-from ..utils import apply_to_dict_recursively, sanitize_np
+
+logger = logging.getLogger(__name__)
+
+
+# Types of documents the Proxy caches for each open run, so that consumers
+# joining mid-run can interpret the rest of it.
+_RUN_HEADER_NAMES = {b'start', b'descriptor', b'resource'}
+_RUN_DATA_NAMES = {b'event', b'event_page', b'datum', b'datum_page'}
+# Maximum number of open runs cached by the Proxy. Beyond this, the run that
+# started longest ago is evicted; most likely its publisher died before
+# sending a 'stop' document.
+_MAX_CACHED_RUNS = 64
+# Seconds a RemoteDispatcher waits for the Proxy to serve cached documents.
+_REPLAY_TIMEOUT = 10
+
+# Seconds between attempts to drain a Publisher's spool while nothing new is
+# being published.
+_SPOOL_RETRY_INTERVAL = 0.1
+# A spool is rewritten without the messages already sent once they take up
+# more than this many bytes and more than half of the file.
+_SPOOL_COMPACT_SIZE = 2**26
+
+# Arrays at least this large (in bytes) are passed through the Publisher's
+# shared memory, if it has any.
+_SHARED_MEMORY_THRESHOLD = 65536
+
+# Key marking the placeholder left in a document where an array was moved
+# into its own message frame.
+_ARRAY_KEY = '__ndarray__'
+
+
+def _extract_arrays(doc, buffers):
+    """
+    Copy the dict structure of a document, moving numpy arrays out of it.
+
+    Each array is appended to ``buffers`` and replaced by a small placeholder
+    recording its index, dtype, and shape. Array data is never copied unless
+    the array is not contiguous. Numpy scalars and arrays that cannot be sent
+    as a raw buffer (object or structured dtypes) become built-in types.
+
+    Parameters
+    ----------
+    doc : dict
+    buffers : list
+        extended in place
+
+    Returns
+    -------
+    skeleton : dict
+    """
+    skeleton = {}
+    for key, val in doc.items():
+        if hasattr(val, 'items'):
+            val = _extract_arrays(val, buffers)
+        elif isinstance(val, np.ndarray):
+            if val.dtype.hasobject or val.dtype.fields is not None:
+                val = val.tolist()
+            else:
+                buffers.append(np.ascontiguousarray(val))
+                val = {_ARRAY_KEY: len(buffers) - 1,
+                       'dtype': val.dtype.str,
+                       'shape': list(val.shape)}
+        elif isinstance(val, np.generic):
+            val = val.item()
+        skeleton[key] = val
+    return skeleton
+
+
+def _topic(name, source):
+    "Build the 0MQ topic for a document of type ``name`` from ``source``."
+    return name.encode() + b' ' + source
+
+
+def _subscription_prefixes(document_names=None, hostname=None, pid=None,
+                           run_engine_id=None):
+    """
+    Build the 0MQ topic prefixes that select the given messages.
+
+    The topic is ``b'<name> <hostname> <pid> <RE id> '``. Subscriptions match
+    on prefixes, so a filter on pid can only be included if a hostname is
+    given too, and a filter on RunEngine id only if pid is given too.
+    Anything that cannot be expressed as a prefix must be filtered after
+    receipt.
+    """
+    if document_names is None:
+        if hostname is None:
+            return [b'']
+        document_names = [name.name for name in DocumentNames]
+    source = b''
+    for value in (hostname, pid, run_engine_id):
+        if value is None:
+            break
+        source += b'%s ' % str(value).encode()
+    return [_topic(name, source) for name in document_names]
+
+
+def _placeholders(skeleton):
+    "Yield the placeholders left by :func:`_extract_arrays` in a document."
+    for val in skeleton.values():
+        if hasattr(val, 'items'):
+            if _ARRAY_KEY in val:
+                yield val
+            else:
+                yield from _placeholders(val)
+
+
+def _restore_arrays(skeleton, buffers, shared=None):
+    """
+    Put arrays back into a document, in place, without copying them.
+
+    This reverses :func:`_extract_arrays`. The arrays are read-only views on
+    the received buffers. For arrays that a Publisher also put in shared
+    memory, ``shared(path, position, nbytes, written)`` is called, if given,
+    and returns the buffer holding the array, or None to use the one in the
+    message frame.
+    """
+    for key, val in skeleton.items():
+        if hasattr(val, 'items'):
+            if _ARRAY_KEY in val:
+                buffer = None
+                if 'shm' in val and shared is not None:
+                    buffer = shared(*val['shm'])
+                if buffer is None:
+                    buffer = buffers[val[_ARRAY_KEY]]
+                arr = np.frombuffer(buffer, dtype=val['dtype'])
+                arr.flags.writeable = False
+                skeleton[key] = arr.reshape(val['shape'])
+            else:
+                _restore_arrays(val, buffers, shared)
+    return skeleton
+
+
+class _Spool:
+    """
+    An append-only file of multipart messages waiting to be sent.
+
+    The file starts with the offset of the first message not sent yet, so
+    messages left behind by a Publisher that was closed or died are sent by
+    the next Publisher using the same file, and messages already sent are
+    not sent again. Each message is stored as its number of frames followed
+    by each frame's length and data.
+
+    Writes are flushed to the operating system, not synced to disk, so the
+    messages survive the Publisher's process dying but not the host. The
+    file is locked (where ``fcntl`` is available) so that two Publishers
+    cannot share it, and it is compacted as messages are sent, so it stays
+    within about twice the size of the messages waiting.
+    """
+    _OFFSET = struct.Struct('<Q')
+    _COUNT = struct.Struct('<I')
+    _LENGTH = struct.Struct('<Q')
+
+    def __init__(self, path):
+        self.path = path
+        mode = 'r+b' if os.path.exists(path) else 'w+b'
+        self._file = open(path, mode)
+        self._lock(self._file)
+        self._count = 0
+        header = self._file.read(self._OFFSET.size)
+        if len(header) < self._OFFSET.size:
+            self._truncate()
+            return
+        self._offset, = self._OFFSET.unpack(header)
+        # Count the messages left over, discarding an incomplete one at the
+        # end that was being written when the previous owner died.
+        end = self._offset
+        self._file.seek(end)
+        while True:
+            try:
+                frames = self._read()
+            except ValueError:
+                break
+            if frames is None:
+                break
+            end = self._file.tell()
+            self._count += 1
+        if self._count:
+            self._file.truncate(end)
+        else:
+            self._truncate()
+
+    def __len__(self):
+        return self._count
+
+    def _lock(self, file):
+        try:
+            import fcntl
+        except ImportError:
+            # Not POSIX: a spool shared by two Publishers is not detected.
+            return
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            file.close()
+            raise RuntimeError("The spool {} is in use by another Publisher."
+                               "".format(self.path))
+
+    def _truncate(self):
+        self._offset = self._OFFSET.size
+        self._file.seek(0)
+        self._file.truncate()
+        self._file.write(self._OFFSET.pack(self._offset))
+        self._file.flush()
+
+    def _read(self):
+        "Read the message at the current position; None if there is none."
+        header = self._file.read(self._COUNT.size)
+        if not header:
+            return None
+        if len(header) < self._COUNT.size:
+            raise ValueError("incomplete message")
+        count, = self._COUNT.unpack(header)
+        frames = []
+        for _ in range(count):
+            header = self._file.read(self._LENGTH.size)
+            if len(header) < self._LENGTH.size:
+                raise ValueError("incomplete message")
+            length, = self._LENGTH.unpack(header)
+            frame = self._file.read(length)
+            if len(frame) < length:
+                raise ValueError("incomplete message")
+            frames.append(frame)
+        return frames
+
+    def append(self, frames):
+        self._file.seek(0, os.SEEK_END)
+        self._file.write(self._COUNT.pack(len(frames)))
+        for frame in frames:
+            frame = memoryview(frame)
+            self._file.write(self._LENGTH.pack(frame.nbytes))
+            self._file.write(frame)
+        self._file.flush()
+        self._count += 1
+
+    def peek(self):
+        "Return the oldest message."
+        self._file.seek(self._offset)
+        frames = self._read()
+        self._next = self._file.tell()
+        return frames
+
+    def pop(self):
+        "Discard the message returned by the last call to :meth:`peek`."
+        self._count -= 1
+        if self._count:
+            self._offset = self._next
+            self._file.seek(0)
+            self._file.write(self._OFFSET.pack(self._offset))
+            self._file.flush()
+            size = self._file.seek(0, os.SEEK_END)
+            if self._offset > max(_SPOOL_COMPACT_SIZE, size // 2):
+                self._compact()
+        else:
+            self._truncate()
+
+    def _compact(self):
+        "Rewrite the file without the messages already sent."
+        # Write a new file and move it into place, so that a crash leaves
+        # either the old file or the new one.
+        new_path = self.path + '.tmp'
+        new_file = open(new_path, 'w+b')
+        self._lock(new_file)
+        new_file.write(self._OFFSET.pack(self._OFFSET.size))
+        self._file.seek(self._offset)
+        shutil.copyfileobj(self._file, new_file)
+        new_file.flush()
+        os.replace(new_path, self.path)
+        self._file.close()
+        self._file = new_file
+        self._offset = self._OFFSET.size
+
+    def close(self):
+        self._file.close()
+
+
+class _SharedRing:
+    """
+    A ring buffer of array data in a memory-mapped file, shared by one
+    Publisher and the RemoteDispatchers on the same host.
+
+    Positions are byte offsets counted from the creation of the ring, so
+    they grow forever and the data at ``position`` lives at
+    ``position % size``. A header holds the position up to which data has
+    been written and, for each consumer, its pid and the position up to which
+    it has finished with the data. The writer never overwrites data that a
+    live consumer has not finished with; when it would have to, the caller
+    sends the array some other way.
+
+    Every message referring to the ring records how much had been written
+    when it was sent. Messages arrive in order, so once a consumer has
+    processed a message, it is finished with everything written before it,
+    even the data of messages it never received.
+
+    Parameters
+    ----------
+    path : string
+    size : int, optional
+        If given, create the ring with this many bytes of data. Otherwise,
+        open an existing ring as a consumer.
+    """
+    _MAGIC = 0x626c7565736b7931
+    _MAX_CONSUMERS = 32
+    _HEADER_BYTES = 4096
+    _ALIGNMENT = 64
+    # Indices of words in the header
+    _SIZE, _WRITTEN, _CONSUMERS = 1, 2, 4
+
+    def __init__(self, path, size=None):
+        self.path = path
+        create = size is not None
+        if not create:
+            self._fd = os.open(path, os.O_RDWR)
+            size = os.fstat(self._fd).st_size - self._HEADER_BYTES
+        else:
+            self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            os.ftruncate(self._fd, self._HEADER_BYTES + size)
+        self._mmap = mmap.mmap(self._fd, self._HEADER_BYTES + size)
+        self._header = np.ndarray(self._HEADER_BYTES // 8, dtype='<i8',
+                                  buffer=self._mmap)
+        self._data = np.ndarray(size, dtype=np.uint8, buffer=self._mmap,
+                                offset=self._HEADER_BYTES)
+        # (pid, position) pairs, one per consumer; pid 0 marks a free slot
+        self._consumers = self._header[
+            self._CONSUMERS:self._CONSUMERS + 2 * self._MAX_CONSUMERS
+        ].reshape(-1, 2)
+        if create:
+            self._header[self._SIZE] = size
+            self._header[0] = self._MAGIC
+        elif self._header[0] != self._MAGIC:
+            raise ValueError("%s is not a shared ring buffer." % path)
+        self.size = size
+        self._slot = None
+        self._registered_at = None
+        self._seen = None
+
+    @property
+    def written(self):
+        return int(self._header[self._WRITTEN])
+
+    def write(self, array):
+        """
+        Copy an array into the ring and return its position.
+
+        Return None if the array is too big or the space is still in use.
+        """
+        nbytes = array.nbytes
+        if nbytes > self.size:
+            return None
+        position = -(-self.written // self._ALIGNMENT) * self._ALIGNMENT
+        if position % self.size + nbytes > self.size:
+            # Do not wrap around the end; start over at the beginning.
+            position += self.size - position % self.size
+        end = position + nbytes
+        if not self._can_overwrite(end - self.size):
+            return None
+        # Announce the overwrite before doing it, so that consumers copying
+        # unprotected data can tell that it changed under them.
+        self._header[self._WRITTEN] = end
+        offset = position % self.size
+        self._data[offset:offset + nbytes] = np.frombuffer(array, np.uint8)
+        return position
+
+    def _can_overwrite(self, position):
+        "Whether every consumer has finished with the data before position."
+        live = self._consumers[:, 0] != 0
+        if not live.any() or self._consumers[live, 1].min() >= position:
+            return True
+        # Forget consumers that died without saying goodbye, and try again.
+        # (This is why consumers must share our PID namespace.)
+        for slot, (pid, _) in enumerate(self._consumers):
+            if pid:
+                try:
+                    os.kill(int(pid), 0)
+                except ProcessLookupError:
+                    self._consumers[slot, 0] = 0
+                except PermissionError:
+                    pass
+        live = self._consumers[:, 0] != 0
+        return not live.any() or self._consumers[live, 1].min() >= position
+
+    def read(self, position, nbytes, written):
+        """
+        Return a buffer holding the data written at ``position``.
+
+        Data written after this consumer registered (on its first read) is
+        protected until :meth:`acknowledge` is called, so it is returned
+        without copying. Older data is copied, and ValueError is raised if it
+        has already been overwritten. If ``position`` is None, the data was
+        not put in the ring, and None is returned.
+        """
+        if self._slot is None:
+            self._register()
+        self._seen = max(self._seen, written)
+        if position is None:
+            return None
+        offset = position % self.size
+        if position >= self._registered_at:
+            return self._data[offset:offset + nbytes]
+        data = self._data[offset:offset + nbytes].tobytes()
+        if position < self.written - self.size:
+            raise ValueError("The data at position %d of %s has been "
+                             "overwritten." % (position, self.path))
+        return data
+
+    def _register(self):
+        # Imported here so that the module can be used where fcntl does not
+        # exist (Windows) as long as shared memory is not.
+        import fcntl
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            free = np.flatnonzero(self._consumers[:, 0] == 0)
+            if not len(free):
+                raise ValueError("%s already has %d consumers."
+                                 % (self.path, self._MAX_CONSUMERS))
+            slot = free[0]
+            self._registered_at = self._seen = self.written
+            # Set the position before the pid, which makes the slot live.
+            self._consumers[slot, 1] = self._registered_at
+            self._consumers[slot, 0] = os.getpid()
+            self._slot = slot
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def acknowledge(self):
+        "Let the writer reuse the data of all the messages read so far."
+        if self._slot is not None:
+            self._consumers[self._slot, 1] = self._seen
+
+    def close(self):
+        if self._slot is not None:
+            self._consumers[self._slot, 0] = 0
+            self._slot = None
+        os.close(self._fd)
+        del self._header, self._data, self._consumers
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Some arrays still use it; it is unmapped once they are gone.
+            pass
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
 
 
 class Publisher:
@@ -26,6 +482,74 @@ class Publisher:
         mocking its interface is accepted.
     serializer: function, optional
         optional function to serialize data. Default is pickle.dumps
+    queue_size : int, optional
+        Maximum number of documents waiting to be sent. If the queue is full,
+        the caller blocks until there is room. Default is 1000.
+    hwm : int, optional
+        0MQ send high water mark, the number of messages buffered by the
+        socket. By default, the 0MQ default is used.
+    batch_size : int, optional
+        Maximum number of consecutive small documents of the same type that
+        are coalesced into a single message. Default is 100.
+    spool : string, optional
+        Path of a file where messages are kept, in order, while the proxy is
+        unreachable or not keeping up, until they can be sent. Messages left
+        in this file by an earlier Publisher are sent first. By default,
+        messages are dropped by 0MQ in these situations. The file is not
+        synced to disk, and it grows for as long as the proxy is down. Only
+        one Publisher may use it at a time. This cannot be combined with
+        ``shared_memory``.
+    shared_memory : int, optional
+        Size in bytes of a ring buffer in shared memory from which
+        RemoteDispatchers on the same host can read large arrays. Not
+        available on Windows. By default, there is none.
+
+    Attributes
+    ----------
+    spooled : int
+        Number of messages waiting in the spool.
+
+    Notes
+    -----
+    Documents are serialized and sent by a background thread, so calling the
+    Publisher only enqueues them. When documents arrive faster than they can
+    be sent, consecutive documents of the same type that carry no arrays are
+    coalesced into one message. A 'stop' document is always sent
+    immediately. Use :meth:`flush` to wait until everything enqueued has been
+    sent.
+
+    Each message is a multipart message: a 0MQ topic frame giving the
+    document type and its source (``b'<name> <hostname> <pid> <RE id> '``),
+    so that subscribers can filter inside 0MQ without receiving anything
+    else, a frame with the serialized list of documents, and one
+    frame per numpy array in the documents holding the raw array data. Arrays
+    are neither copied nor converted to lists, so the serializer only has to
+    handle built-in types, and arrays must not be mutated after they are
+    emitted.
+
+    With a ``spool``, a message is written to the spool file instead of
+    being sent when the proxy is not connected, when the socket has reached
+    its high water mark, or when older messages are still spooled. The
+    background thread keeps trying to send the spooled messages, oldest
+    first, so the RunEngine never waits for the proxy. Messages that 0MQ
+    had already queued for a connection that then breaks are still lost.
+    :meth:`flush` does not wait for the spool to be emptied.
+
+    With ``shared_memory``, arrays of 64 kB or more are also copied into a
+    memory-mapped file (in ``/dev/shm`` where available) and messages carry
+    their location. RemoteDispatchers on the same host (by hostname) read
+    them from there; others, or any that cannot open the file, use the copy
+    sent through 0MQ as usual, so no consumer loses data. Each
+    RemoteDispatcher records in the file how far it has processed the data,
+    and the Publisher only reuses space that every live RemoteDispatcher is
+    finished with. When there is no such space, arrays are only sent through
+    0MQ, so acquisition never waits for consumers.
+
+    A RemoteDispatcher that has died without closing is recognized by its
+    pid, so all the processes sharing the file must share a PID namespace.
+    Containers that share ``/dev/shm`` and a hostname but not their process
+    ids must not use ``shared_memory``: the Publisher could take a live
+    consumer for dead and overwrite data it is still using.
 
     Example
     -------
@@ -35,9 +559,16 @@ class Publisher:
     >>> RE = RunEngine({})
     >>> publisher = Publisher('localhost:5567', RE=RE)
     """
-    def __init__(self, address, *, RE=None, zmq=None, serializer=pickle.dumps):
+    def __init__(self, address, *, RE=None, zmq=None, serializer=pickle.dumps,
+                 queue_size=1000, hwm=None, batch_size=100, spool=None,
+                 shared_memory=None):
+        if spool is not None and shared_memory is not None:
+            raise ValueError("Arrays in shared memory may be overwritten "
+                             "before spooled messages are sent, so spool and "
+                             "shared_memory cannot be combined.")
         if zmq is None:
             import zmq
+        self._zmq = zmq
         if isinstance(address, str):
             address = address.split(':', maxsplit=1)
         self.address = (address[0], int(address[1]))
@@ -45,25 +576,171 @@ class Publisher:
         self.hostname = socket.gethostname()
         self.pid = os.getpid()
         url = "tcp://%s:%d" % self.address
-        self._prefix = b'%s %d %d ' % (self.hostname.encode(),
+        self._source = b'%s %d %d ' % (self.hostname.encode(),
                                        self.pid, id(RE))
+        # Open the spool first: it fails if another Publisher is using it.
+        self._spool = None if spool is None else _Spool(spool)
         self._context = zmq.Context()
-        self._socket = self._context.socket(zmq.PUB)
+        if spool is None:
+            self._socket = self._context.socket(zmq.PUB)
+        else:
+            # An XPUB socket tells us when the proxy has subscribed, and
+            # NODROP makes it refuse messages instead of dropping them when
+            # the high water mark is reached. The monitor tells us when the
+            # connection breaks.
+            self._socket = self._context.socket(zmq.XPUB)
+            self._socket.setsockopt(zmq.XPUB_NODROP, 1)
+            self._socket.setsockopt(zmq.XPUB_VERBOSE, 1)
+            self._monitor = self._socket.get_monitor_socket(
+                zmq.EVENT_DISCONNECTED)
+        self._connected = False
+        if shared_memory is None:
+            self._ring = None
+        else:
+            fd, path = tempfile.mkstemp(
+                prefix='bluesky-', dir='/dev/shm' if os.path.isdir('/dev/shm')
+                else None)
+            os.close(fd)
+            # Remove the file at exit even if close() is never called.
+            self._unlink_ring = weakref.finalize(self, _unlink, path)
+            self._ring = _SharedRing(path, shared_memory)
+        if hwm is not None:
+            self._socket.setsockopt(zmq.SNDHWM, hwm)
         self._socket.connect(url)
+        self._serializer = serializer
+        self._batch_size = batch_size
+        # The socket is used only by this thread from here on.
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._send_loop,
+                                        name='bluesky-zmq-publisher',
+                                        daemon=True)
+        self._thread.start()
         if RE:
             self._subscription_token = RE.subscribe(self)
-        self._serializer = serializer
+
+    @property
+    def spooled(self):
+        return 0 if self._spool is None else len(self._spool)
 
     def __call__(self, name, doc):
-        doc = copy.deepcopy(doc)
-        apply_to_dict_recursively(doc, sanitize_np)
-        message = bytes(self._prefix)  # making a copy
-        message += b' '.join([name.encode(), self._serializer(doc)])
-        self._socket.send(message)
+        # Copy the document's structure now, in case it is mutated after
+        # this returns. Array data is shared, not copied.
+        buffers = []
+        skeleton = _extract_arrays(doc, buffers)
+        self._queue.put((name, skeleton, buffers))
+
+    def _send_loop(self):
+        pending = None
+        while True:
+            if pending is None:
+                timeout = _SPOOL_RETRY_INTERVAL if self.spooled else None
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    try:
+                        self._drain_spool()
+                    except Exception:
+                        logger.exception("Failed to send spooled messages")
+                    continue
+            else:
+                item, pending = pending, None
+            if item is None:
+                self._queue.task_done()
+                return
+            name, skeleton, buffers = item
+            batch = [skeleton]
+            if not buffers:
+                # Coalesce whatever small documents of the same type are
+                # already waiting.
+                while name != 'stop' and len(batch) < self._batch_size:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None or item[0] != name or item[2]:
+                        pending = item
+                        break
+                    batch.append(item[1])
+            try:
+                self._send(name, batch, buffers)
+            except Exception:
+                logger.exception("Failed to publish %d %r document(s)",
+                                 len(batch), name)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _send(self, name, batch, buffers):
+        if self._ring is not None and buffers:
+            # Documents with arrays are sent one at a time.
+            for placeholder in _placeholders(batch[0]):
+                index = placeholder[_ARRAY_KEY]
+                array = buffers[index]
+                if array.nbytes < _SHARED_MEMORY_THRESHOLD:
+                    continue
+                # The array is sent in its frame too, for consumers that
+                # cannot read the ring.
+                position = self._ring.write(array)
+                placeholder['shm'] = [self._ring.path, position, array.nbytes,
+                                      self._ring.written]
+        frames = [_topic(name, self._source), self._serializer(batch)]
+        frames.extend(buffers)
+        if self._spool is None:
+            self._socket.send_multipart(frames, copy=False)
+            return
+        self._drain_spool()
+        if self._connected and not self._spool:
+            try:
+                self._socket.send_multipart(frames, flags=self._zmq.NOBLOCK,
+                                            copy=False)
+                return
+            except self._zmq.Again:
+                pass
+        self._spool.append(frames)
+
+    def _update_connection(self):
+        zmq = self._zmq
+        while self._monitor.poll(0):
+            event, _ = struct.unpack('<HI',
+                                     self._monitor.recv_multipart()[0][:6])
+            if event == zmq.EVENT_DISCONNECTED:
+                self._connected = False
+        while True:
+            try:
+                message = self._socket.recv(zmq.NOBLOCK)
+            except zmq.Again:
+                break
+            if message[:1] == b'\x01':  # The proxy has subscribed.
+                self._connected = True
+
+    def _drain_spool(self):
+        "Send spooled messages, oldest first, until 0MQ stops taking them."
+        self._update_connection()
+        while self._spool and self._connected:
+            try:
+                self._socket.send_multipart(self._spool.peek(),
+                                            flags=self._zmq.NOBLOCK)
+            except self._zmq.Again:
+                break
+            self._spool.pop()
+
+    def flush(self):
+        "Block until all documents received so far have been sent."
+        self._queue.join()
 
     def close(self):
         if self.RE:
             self.RE.unsubscribe(self._subscription_token)
+        self._queue.put(None)  # Send everything left, then stop the thread.
+        self._thread.join()
+        if self._spool is not None:
+            if self._spool:
+                logger.warning("%d message(s) left unsent in %s",
+                               len(self._spool), self._spool.path)
+            self._spool.close()
+        if self._ring is not None:
+            # Consumers still holding the file open keep it alive.
+            self._unlink_ring()
+            self._ring.close()
         self._context.destroy()  # close Socket(s); terminate Context
 
 
@@ -79,6 +756,31 @@ class Proxy:
     out_port : int, optional
         Port that subscribers should subscribe to. If None, a random port is
         used.
+    replay_port : int, optional
+        If given, cache the 'start', 'descriptor', and 'resource' documents of
+        every run that is currently open and serve them on this port to
+        consumers that join mid-run. See the ``replay_address`` parameter of
+        :class:`RemoteDispatcher`.
+    num_cached_events : int, optional
+        Also cache the most recent messages carrying Events (or Datums) of
+        each open run, up to this many messages. Default is 0. Ignored
+        unless ``replay_port`` is given.
+    stats_port : int, optional
+        If given, publish traffic statistics (see :attr:`stats`) as JSON on
+        this port every ``stats_interval`` seconds.
+    stats_interval : float, optional
+        Seconds between updates of the traffic statistics. If neither this
+        nor ``stats_port`` is given, no statistics are kept. Default is 5 if
+        only ``stats_port`` is given.
+    io_threads : int, optional
+        Number of 0MQ I/O threads. Default is 1, which is enough for about a
+        gigabit per second of traffic.
+    in_hwm : int, optional
+        Receive high water mark (in messages) of the socket facing
+        RunEngines. By default, the 0MQ default is used.
+    out_hwm : int, optional
+        Send high water mark (in messages) per subscriber of the socket facing
+        subscribers. By default, the 0MQ default is used.
     zmq : object, optional
         By default, the 'zmq' module is imported and used. Anything else
         mocking its interface is accepted.
@@ -89,10 +791,38 @@ class Proxy:
         Port that RunEngines should broadcast to.
     out_port : int
         Port that subscribers should subscribe to.
+    replay_port : int or None
+        Port that late-joining subscribers request cached documents from.
+    stats_port : int or None
+        Port that traffic statistics are published on.
+    stats : dict or None
+        The latest traffic statistics: for each publisher (keyed on
+        ``'<hostname> <pid> <RE id>'``) the total number of messages and
+        bytes received, the message and byte rates over the last interval,
+        and the size of the largest message; also the current number of
+        subscriptions (a RemoteDispatcher may hold several, one per topic),
+        or None if libzmq is older than 4.2 and cannot report them all.
+        Messages dropped for subscribers that have reached ``out_hwm`` are
+        not included: 0MQ drops them without telling the proxy.
+    stats_hook
+        Callable with signature ``f(stats)`` called each time the statistics
+        are updated; default is None.
     closed : boolean
         True if the Proxy has already been started and subsequently
         interrupted and is therefore unusable.
 
+    Notes
+    -----
+    If no cache and no statistics are requested, messages are forwarded
+    entirely inside 0MQ. Otherwise they are forwarded by a Python loop, which
+    has some overhead per message. Either way, delivery is the same: a
+    subscriber that has reached ``out_hwm`` misses messages, and the others
+    do not. Those drops happen inside 0MQ, which does not report them, so
+    they cannot be counted: counting them would take a socket that blocks or
+    fails instead of dropping, and so holds up every subscriber for the
+    slowest one. A subscriber can detect its own losses from gaps in the
+    ``seq_num`` of Events.
+
     Examples
     --------
 
@@ -114,15 +844,33 @@ class Proxy:
     56505
     >>> proxy.start()  # runs until interrupted
     """
-    def __init__(self, in_port=None, out_port=None, *, zmq=None):
+    def __init__(self, in_port=None, out_port=None, *, replay_port=None,
+                 num_cached_events=0, stats_port=None, stats_interval=None,
+                 io_threads=1, in_hwm=None, out_hwm=None, zmq=None):
         if zmq is None:
             import zmq
         self.zmq = zmq
         self.closed = False
+        self.num_cached_events = num_cached_events
+        if stats_interval is None and stats_port is not None:
+            stats_interval = 5
+        self.stats_interval = stats_interval
+        self.stats = None
+        self.stats_hook = None
+        # {source: (header messages, recent data messages)} for open runs
+        self._run_cache = OrderedDict()
+        # {source: [messages, bytes, largest message]}
+        self._traffic = {}
+        self._num_subscriptions = 0
+        # Whether every unsubscription is reported, so the count is right
+        self._count_subscriptions = False
+        replay = stats = None
         try:
-            context = zmq.Context(1)
+            context = zmq.Context(io_threads)
             # Socket facing clients
             frontend = context.socket(zmq.SUB)
+            if in_hwm is not None:
+                frontend.setsockopt(zmq.RCVHWM, in_hwm)
             if in_port is None:
                 in_port = frontend.bind_to_random_port("tcp://*")
             else:
@@ -131,11 +879,40 @@ class Proxy:
             frontend.setsockopt_string(zmq.SUBSCRIBE, "")
 
             # Socket facing services
-            backend = context.socket(zmq.PUB)
+            if stats_interval is None:
+                backend = context.socket(zmq.PUB)
+            else:
+                # XPUB delivers like PUB, and also tells us about
+                # subscriptions, including those to topics that another
+                # subscriber already has (VERBOSE) and the matching
+                # unsubscriptions (VERBOSER).
+                backend = context.socket(zmq.XPUB)
+                backend.setsockopt(zmq.XPUB_VERBOSE, 1)
+                try:
+                    backend.setsockopt(zmq.XPUB_VERBOSER, 1)
+                except (AttributeError, zmq.ZMQError):
+                    # libzmq < 4.2: unsubscriptions from topics that another
+                    # subscriber still has are not reported, so the count
+                    # would only grow. Do not report it.
+                    ...
+                else:
+                    self._count_subscriptions = True
+            if out_hwm is not None:
+                backend.setsockopt(zmq.SNDHWM, out_hwm)
             if out_port is None:
                 out_port = backend.bind_to_random_port("tcp://*")
             else:
                 backend.bind("tcp://*:%d" % out_port)
+
+            # Socket serving cached documents to late joiners
+            if replay_port is not None:
+                replay = context.socket(zmq.ROUTER)
+                replay.bind("tcp://*:%d" % replay_port)
+
+            # Socket publishing traffic statistics
+            if stats_port is not None:
+                stats = context.socket(zmq.PUB)
+                stats.bind("tcp://*:%d" % stats_port)
         except:
             # Clean up whichever components we have defined so far.
             try:
@@ -146,28 +923,150 @@ class Proxy:
                 backend.close()
             except NameError:
                 ...
+            for sock in (replay, stats):
+                if sock is not None:
+                    sock.close()
             context.term()
             raise
         else:
             self.in_port = in_port
             self.out_port = out_port
+            self.replay_port = replay_port
+            self.stats_port = stats_port
             self._frontend = frontend
             self._backend = backend
+            self._replay = replay
+            self._stats = stats
             self._context = context
-        
+
     def start(self):
         if self.closed:
             raise RuntimeError("This Proxy has already been started and "
                                "interrupted. Create a fresh instance with "
                                "{}".format(repr(self)))
         try:
-            self.zmq.device(self.zmq.FORWARDER, self._frontend, self._backend)
+            if self._replay is None and self.stats_interval is None:
+                self.zmq.device(self.zmq.FORWARDER, self._frontend,
+                                self._backend)
+            else:
+                self._forward()
         finally:
             self.closed = True
             self._frontend.close()
             self._backend.close()
+            for sock in (self._replay, self._stats):
+                if sock is not None:
+                    sock.close()
             self._context.term()
 
+    def _forward(self):
+        zmq = self.zmq
+        keep_stats = self.stats_interval is not None
+        poller = zmq.Poller()
+        poller.register(self._frontend, zmq.POLLIN)
+        if self._replay is not None:
+            poller.register(self._replay, zmq.POLLIN)
+        if keep_stats:
+            poller.register(self._backend, zmq.POLLIN)
+            last_report = time.monotonic()
+            next_report = last_report + self.stats_interval
+            last_totals = {}
+        timeout = None
+        while True:
+            if keep_stats:
+                timeout = max(0, 1000 * (next_report - time.monotonic()))
+            for sock, _ in poller.poll(timeout):
+                if sock is self._frontend:
+                    frames = self._frontend.recv_multipart(copy=False)
+                    if keep_stats:
+                        self._forward_and_count(frames)
+                    else:
+                        self._backend.send_multipart(frames, copy=False)
+                    if self._replay is not None:
+                        self._cache(frames)
+                elif sock is self._replay:
+                    identity, *request = self._replay.recv_multipart()
+                    self._serve_replay(identity)
+                else:
+                    # A subscription (b'\x01<topic>') or unsubscription
+                    # (b'\x00<topic>') arriving at the XPUB backend
+                    message = self._backend.recv()
+                    if message[:1] == b'\x01':
+                        self._num_subscriptions += 1
+                    elif message[:1] == b'\x00':
+                        self._num_subscriptions -= 1
+            if keep_stats and time.monotonic() >= next_report:
+                now = time.monotonic()
+                self._report_stats(now - last_report, last_totals)
+                last_totals = {source: list(traffic) for source, traffic
+                               in self._traffic.items()}
+                last_report = now
+                next_report = now + self.stats_interval
+
+    def _forward_and_count(self, frames):
+        source = frames[0].bytes.split(b' ', 1)[1]
+        try:
+            traffic = self._traffic[source]
+        except KeyError:
+            traffic = self._traffic[source] = [0, 0, 0]
+        nbytes = sum(len(frame) for frame in frames)
+        traffic[0] += 1
+        traffic[1] += nbytes
+        traffic[2] = max(traffic[2], nbytes)
+        self._backend.send_multipart(frames, copy=False)
+
+    def _report_stats(self, interval, last_totals):
+        publishers = {}
+        for source, (messages, nbytes, largest) in self._traffic.items():
+            last_messages, last_nbytes, *_ = last_totals.get(source,
+                                                             (0, 0))
+            publishers[source.decode().strip()] = {
+                'messages': messages,
+                'bytes': nbytes,
+                'message_rate': (messages - last_messages) / interval,
+                'byte_rate': (nbytes - last_nbytes) / interval,
+                'largest_message': largest}
+        if self._count_subscriptions:
+            subscriptions = self._num_subscriptions
+        else:
+            subscriptions = None
+        self.stats = {'time': time.time(),
+                      'interval': interval,
+                      'subscriptions': subscriptions,
+                      'publishers': publishers}
+        if self._stats is not None:
+            self._stats.send_json(self.stats)
+        if self.stats_hook is not None:
+            self.stats_hook(self.stats)
+
+    def _cache(self, frames):
+        name, source = frames[0].bytes.split(b' ', 1)
+        if name in _RUN_DATA_NAMES:
+            if self.num_cached_events and source in self._run_cache:
+                self._run_cache[source][1].append(frames)
+        elif name == b'start':
+            # A RunEngine has at most one open run, so this replaces any
+            # run from the same source that never sent a 'stop'.
+            self._run_cache.pop(source, None)
+            self._run_cache[source] = (
+                [frames], deque(maxlen=self.num_cached_events))
+            while len(self._run_cache) > _MAX_CACHED_RUNS:
+                self._run_cache.popitem(last=False)
+        elif name in _RUN_HEADER_NAMES:
+            if source in self._run_cache:
+                self._run_cache[source][0].append(frames)
+        elif name == b'stop':
+            self._run_cache.pop(source, None)
+
+    def _serve_replay(self, identity):
+        # Send each cached message in order, then an empty terminator.
+        for headers, data in self._run_cache.values():
+            for frames in headers:
+                self._replay.send_multipart([identity] + frames, copy=False)
+            for frames in data:
+                self._replay.send_multipart([identity] + frames, copy=False)
+        self._replay.send_multipart([identity, b''])
+
     def __repr__(self):
         return ("{}(in_port={in_port}, out_port={out_port})"
                 "".format(type(self).__name__, **vars(self)))
@@ -189,6 +1088,9 @@ class RemoteDispatcher(Dispatcher):
     run_engine_id : int, optional
         A filter: only process documents from a RunEngine with this Python id
         (memory address).
+    document_names : list, optional
+        A filter: only process documents of these types, such as
+        ``['start', 'stop']``.
     loop : zmq.asyncio.ZMQEventLoop, optional
     zmq : object, optional
         By default, the 'zmq' module is imported and used. Anything else
@@ -198,6 +1100,41 @@ class RemoteDispatcher(Dispatcher):
         else mocking its interface is accepted.
     deserializer: function, optional
         optional function to deserialize data. Default is pickle.loads
+    max_burst : int, optional
+        Maximum number of waiting messages received and dispatched in one go.
+        Default is 1000.
+    replay_address : string or tuple, optional
+        Address of the replay port of a :class:`Proxy` started with a
+        ``replay_port``. If given, the documents it has cached for runs that
+        are already open are processed first, when :meth:`start` is called,
+        so that a consumer joining mid-run can interpret the rest of the run.
+
+    Attributes
+    ----------
+    last_burst_size : int
+        Number of messages received in one go the last time messages were
+        drained (at most ``max_burst``). This is not the full backlog, which
+        0MQ does not report, but values much above 1 mean that the callbacks
+        are not keeping up.
+    lag : float or None
+        Seconds between the 'time' of the last document dispatched and its
+        dispatch, including transport and time spent waiting in queues. This
+        assumes the clocks of the sending and receiving hosts agree.
+
+    Notes
+    -----
+    Filters are applied by 0MQ subscriptions where possible, so that
+    messages that are filtered out are never received. This covers
+    ``document_names`` and ``hostname``, plus ``pid`` if ``hostname`` is also
+    given and ``run_engine_id`` if ``pid`` is also given.
+
+    Numpy arrays sent by a :class:`Publisher` are rebuilt directly on top of
+    the received message buffers, without copying. They are read-only.
+    Arrays that a Publisher on the same host also put in shared memory are
+    read from there, as views on that memory, which the Publisher may reuse
+    once the message has been dispatched: callbacks that keep such arrays
+    must copy them. If the shared memory cannot be opened or read, the
+    arrays sent in the message are used.
 
     Example
     -------
@@ -209,12 +1146,26 @@ class RemoteDispatcher(Dispatcher):
     >>> d.start()  # runs until interrupted
     """
     def __init__(self, address, *, hostname=None, pid=None, run_engine_id=None,
-                 loop=None, zmq=None, zmq_asyncio=None,
-                 deserializer=pickle.loads):
+                 document_names=None, loop=None, zmq=None, zmq_asyncio=None,
+                 deserializer=pickle.loads, max_burst=1000,
+                 replay_address=None):
         if zmq is None:
             import zmq
         if zmq_asyncio is None:
             import zmq.asyncio as zmq_asyncio
+        if isinstance(replay_address, str):
+            replay_address = replay_address.split(':', maxsplit=1)
+        if replay_address is not None:
+            replay_address = (replay_address[0], int(replay_address[1]))
+        self.replay_address = replay_address
+        self._replayed_uids = set()
+        self._rings = {}  # {path: _SharedRing} for same-host Publishers
+        self._unusable_rings = set()  # paths that could not be opened
+        self._hostname = socket.gethostname()
+        self._zmq = zmq
+        self.max_burst = max_burst
+        self.last_burst_size = 0
+        self.lag = None
         if isinstance(address, str):
             address = address.split(':', maxsplit=1)
         self._deserializer = deserializer
@@ -231,16 +1182,19 @@ class RemoteDispatcher(Dispatcher):
         self._socket = self._context.socket(zmq.SUB)
         url = "tcp://%s:%d" % self.address
         self._socket.connect(url)
-        self._socket.setsockopt_string(zmq.SUBSCRIBE, "")
+        self._prefixes = tuple(_subscription_prefixes(
+            document_names, hostname, pid, run_engine_id))
+        for prefix in self._prefixes:
+            self._socket.setsockopt(zmq.SUBSCRIBE, prefix)
         self._task = None
 
         def is_our_message(_hostname, _pid, _RE_id):
             # Close over filters and decide if this message applies to this
-            # RemoteDispatcher.
+            # RemoteDispatcher. This catches whatever the subscriptions could
+            # not express.
             return ((hostname is None or hostname == _hostname)
                     and (pid is None or pid == _pid)
-                    and (run_engine_id is None or run_engine_id ==
-                         run_engine_id))
+                    and (run_engine_id is None or run_engine_id == _RE_id))
         self._is_our_message = is_our_message
 
         super().__init__()
@@ -248,18 +1202,123 @@ class RemoteDispatcher(Dispatcher):
     @asyncio.coroutine
     def _poll(self):
         while True:
-            message = yield from self._socket.recv()
-            hostname, pid, RE_id, name, doc = message.split(b' ', 4)
-            hostname = hostname.decode()
-            pid = int(pid)
-            RE_id = int(RE_id)
-            name = name.decode()
-            if self._is_our_message(hostname, pid, RE_id):
-                doc = self._deserializer(doc)
-                self.loop.call_soon(self.process, DocumentNames[name], doc)
+            burst = [(yield from self._socket.recv_multipart(copy=False))]
+            # Drain whatever else is already waiting. Non-blocking receives
+            # complete immediately, without a round trip through the loop.
+            while len(burst) < self.max_burst:
+                try:
+                    frames = yield from self._socket.recv_multipart(
+                        flags=self._zmq.NOBLOCK, copy=False)
+                except self._zmq.Again:
+                    break
+                burst.append(frames)
+            self.last_burst_size = len(burst)
+            self._process_burst(burst)
+
+    @asyncio.coroutine
+    def _replay(self):
+        sock = self._context.socket(self._zmq.DEALER)
+        sock.connect("tcp://%s:%d" % self.replay_address)
+        burst = []
+        try:
+            yield from sock.send(b'replay')
+            while True:
+                frames = yield from sock.recv_multipart(copy=False)
+                if len(frames) == 1:
+                    break  # empty terminator
+                burst.append(frames)
+        finally:
+            sock.close(linger=0)
+        self._process_burst(burst, replayed=True)
+
+    def _process_burst(self, burst, replayed=False):
+        docs = []
+        for topic, payload, *buffers in burst:
+            topic = topic.bytes
+            if replayed and not topic.startswith(self._prefixes):
+                # Replayed messages do not go through our subscriptions.
+                continue
+            name, hostname, pid, RE_id = topic.split(b' ', 4)[:4]
+            if not self._is_our_message(hostname.decode(), int(pid),
+                                        int(RE_id)):
+                continue
+            name = DocumentNames[name.decode()]
+            buffers = [frame.buffer for frame in buffers]
+            # Shared memory can only be read on the host that wrote it.
+            shared = (self._shared_buffer
+                      if hostname.decode() == self._hostname else None)
+            for doc in self._deserializer(payload.bytes):
+                uid = doc.get('uid')
+                if isinstance(uid, list):
+                    # Pages have a list of uids.
+                    uid = tuple(uid)
+                if isinstance(uid, (str, tuple)):
+                    # A document published around the time of the replay
+                    # request may arrive both ways. Process it once.
+                    if replayed:
+                        self._replayed_uids.add(uid)
+                    elif uid in self._replayed_uids:
+                        self._replayed_uids.discard(uid)
+                        continue
+                    else:
+                        # Documents arrive in the order the proxy sent them,
+                        # so the first live one that was not replayed ends
+                        # the overlap: no replayed uid can arrive again.
+                        self._replayed_uids.clear()
+                try:
+                    doc = _restore_arrays(doc, buffers, shared)
+                except (OSError, ValueError) as err:
+                    logger.warning("Skipping a %r document whose arrays are "
+                                   "not available: %s", name.name, err)
+                    continue
+                docs.append((name, doc))
+        for name, doc in docs:
+            # A failing callback must not end the _poll task or drop the rest
+            # of the burst. Log it, as the loop would for a scheduled call.
+            try:
+                self.process(name, doc)
+            except Exception:
+                logger.exception("A callback failed on a %r document",
+                                 name.name)
+        for ring in self._rings.values():
+            ring.acknowledge()
+        if docs:
+            doc_time = docs[-1][1].get('time')
+            if isinstance(doc_time, (int, float)):
+                self.lag = time.time() - doc_time
+
+    def _shared_buffer(self, path, position, nbytes, written):
+        # Return None, to use the array sent in the message, if the ring
+        # cannot be used.
+        try:
+            ring = self._rings[path]
+        except KeyError:
+            if path in self._unusable_rings:
+                return None
+            try:
+                ring = _SharedRing(path)
+            except (OSError, ValueError) as err:
+                logger.info("Using arrays sent through 0MQ instead of "
+                            "shared memory: %s", err)
+                self._unusable_rings.add(path)
+                return None
+            self._rings[path] = ring
+        try:
+            return ring.read(position, nbytes, written)
+        except ValueError:
+            return None  # overwritten, or too many consumers
 
     def start(self):
         try:
+            if self.replay_address is not None:
+                try:
+                    self.loop.run_until_complete(
+                        asyncio.wait_for(self._replay(), _REPLAY_TIMEOUT,
+                                         loop=self.loop))
+                except asyncio.TimeoutError:
+                    logger.warning("No replay received from %s:%d; only "
+                                   "new documents will be processed.",
+                                   *self.replay_address)
             self._task = self.loop.create_task(self._poll())
             self.loop.run_forever()
         except:
@@ -271,3 +1330,6 @@ class RemoteDispatcher(Dispatcher):
             self._task.cancel()
             self.loop.stop()
         self._task = None
+        for ring in self._rings.values():
+            ring.close()
+        self._rings.clear()
@@ -0,0 +1,116 @@
+"""
+Write ``.npy`` files that grow, and can be read, as rows are appended.
+
+An :class:`NpyColumn` is a regular ``.npy`` file with room reserved for more
+rows than it holds. Its header gives the number of rows written so far, so
+readers load it with ``numpy.load(path, mmap_mode='r')`` at any time without
+reading it into memory.
+"""
+import numpy as np
+
+# Room reserved for the .npy header, so that it can be rewritten in place as
+# the column grows.
+_HEADER_SIZE = 256
+_MAGIC = b'\x93NUMPY\x01\x00'
+# Rows allocated when a column is created. Capacity doubles as needed.
+_INITIAL_CAPACITY = 1024
+
+
+def missing_value(dtype):
+    "The value given to rows that have no data: NaN, or 0 for integers."
+    if np.dtype(dtype).kind in 'fc':
+        return np.nan
+    return 0
+
+
+class NpyColumn:
+    """
+    A ``.npy`` file of rows that can be appended to.
+
+    Space is allocated (sparsely) for more rows than are written, and the
+    header always gives the number of rows written as of the last call to
+    :meth:`flush`, so that the file can be loaded while it grows.
+
+    Parameters
+    ----------
+    path : string
+        The file is created, or overwritten.
+    dtype : numpy.dtype or string
+    shape : tuple, optional
+        Shape of each row. Default is ``()``, a column of scalars.
+    length : int, optional
+        Start with this many rows of :func:`missing_value`. Default is 0.
+    capacity : int, optional
+        Number of rows to allocate space for at first. Default is 1024.
+    """
+    def __init__(self, path, dtype, shape=(), length=0,
+                 capacity=_INITIAL_CAPACITY):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.shape = tuple(shape)
+        self.length = 0
+        self._row_size = self.dtype.itemsize * int(np.prod(self.shape))
+        self._file = open(path, 'w+b')
+        self._map = None
+        self._reserve(max(capacity, length, 1))
+        if length:
+            self._map[:length] = missing_value(self.dtype)
+            self.length = length
+        self.flush()
+
+    def _reserve(self, capacity):
+        self.capacity = capacity
+        self._map = None
+        self._file.truncate(_HEADER_SIZE + capacity * self._row_size)
+        if self._row_size:
+            self._map = np.memmap(self._file, dtype=self.dtype, mode='r+',
+                                  offset=_HEADER_SIZE,
+                                  shape=(capacity,) + self.shape)
+
+    def append(self, values):
+        "Append rows, given as an array (or list) of them."
+        n = len(values)
+        if self.length + n > self.capacity:
+            if self._map is not None:
+                self._map.flush()
+            capacity = self.capacity
+            while self.length + n > capacity:
+                capacity *= 2
+            self._reserve(capacity)
+            self.flush()
+        if self._map is not None:
+            self._map[self.length:self.length + n] = values
+        self.length += n
+
+    def flush(self, sync=True):
+        """
+        Update the header for the rows appended so far.
+
+        Parameters
+        ----------
+        sync : boolean, optional
+            If True (default), also write the data to disk. Otherwise, it is
+            left for the operating system to write; readers on this host see
+            it all the same.
+        """
+        header = "{{'descr': {!r}, 'fortran_order': False, 'shape': {!r}, }}" \
+            .format(np.lib.format.dtype_to_descr(self.dtype),
+                    (self.length,) + self.shape)
+        header = header.encode('latin1')
+        padding = _HEADER_SIZE - len(_MAGIC) - 2 - len(header) - 1
+        if padding < 0:
+            raise ValueError("The shape {} is too long to be stored."
+                             "".format(self.shape))
+        if sync and self._map is not None:
+            self._map.flush()
+        self._file.seek(0)
+        self._file.write(_MAGIC + (_HEADER_SIZE - len(_MAGIC) - 2).to_bytes(
+            2, 'little') + header + b' ' * padding + b'\n')
+        self._file.flush()
+
+    def close(self):
+        "Write everything, and release the space reserved for more rows."
+        self.flush()
+        self._map = None
+        self._file.truncate(_HEADER_SIZE + self.length * self._row_size)
+        self._file.close()
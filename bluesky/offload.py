@@ -0,0 +1,143 @@
+"""
+Move large array readings out of Event documents into local files.
+
+Assign an :class:`ArrayOffloader` to ``RunEngine.array_offloader`` and the
+RunEngine writes array readings above a size threshold to chunked ``.npy``
+files instead of putting them in Events. It emits the matching 'resource'
+and 'datum' documents, marks the fields as external in the descriptor, and
+puts datum ids in the Events, which are then small. Use
+:class:`NpyChunkHandler` to load the arrays back, for example by registering
+it with a databroker.
+"""
+import os
+
+import numpy as np
+
+from .npy import NpyColumn
+from .utils import new_uid
+
+
+class ArrayOffloader:
+    """
+    Write large array readings to chunked ``.npy`` files.
+
+    Each field of each stream is written to a series of ``.npy`` files of at
+    most ``chunk_size`` arrays, under
+    ``<root>/<run start uid>/<stream>/<field>_<chunk>.npy``. Each file is
+    described by a 'resource' document with spec ``'BLUESKY_NPY_CHUNK'`` and
+    each array by a 'datum' document giving its index in the file.
+
+    Parameters
+    ----------
+    root : string
+        Directory under which files are written
+    threshold : int, optional
+        Arrays of at least this many bytes are offloaded, as decided by the
+        first reading of each field in each stream. Default is 1 MiB.
+    chunk_size : int, optional
+        Maximum number of arrays per file. Default is 100.
+
+    Examples
+    --------
+
+    >>> RE.array_offloader = ArrayOffloader('/var/tmp/bluesky-arrays')
+    """
+    spec = 'BLUESKY_NPY_CHUNK'
+
+    def __init__(self, root, *, threshold=2**20, chunk_size=100):
+        self.root = root
+        self.threshold = threshold
+        self.chunk_size = chunk_size
+        self._run_start = None
+        # {(stream name, field): (resource uid, NpyColumn, chunk number)}
+        self._chunks = {}
+
+    def select(self, data):
+        """
+        Return the fields that should be offloaded.
+
+        Parameters
+        ----------
+        data : dict
+            maps fields to values, as in an Event
+        """
+        return {field for field, value in data.items()
+                if isinstance(value, np.ndarray) and
+                value.nbytes >= self.threshold}
+
+    def write(self, run_start, stream_name, field, value):
+        """
+        Write an array and return the documents describing where it is.
+
+        Returns
+        -------
+        asset_docs : list
+            ``(name, doc)`` pairs: a 'resource' document if a new file was
+            started, and a 'datum' document
+        datum_id : string
+        """
+        if run_start != self._run_start:
+            self.close_run()
+            self._run_start = run_start
+        key = (stream_name, field)
+        value = np.asarray(value)
+        asset_docs = []
+        resource_uid, column, chunk = self._chunks.get(key, (None, None, -1))
+        if (column is None or column.length >= self.chunk_size or
+                column.dtype != value.dtype or column.shape != value.shape):
+            if column is not None:
+                column.close()
+            chunk += 1
+            resource_path = os.path.join(
+                run_start, stream_name, '{}_{:06d}.npy'.format(field, chunk))
+            path = os.path.join(self.root, resource_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            column = NpyColumn(path, value.dtype, value.shape,
+                               capacity=self.chunk_size)
+            resource_uid = new_uid()
+            asset_docs.append(('resource',
+                               {'uid': resource_uid, 'spec': self.spec,
+                                'root': self.root,
+                                'resource_path': resource_path,
+                                'resource_kwargs': {},
+                                'path_semantics': 'posix'}))
+            self._chunks[key] = (resource_uid, column, chunk)
+        index = column.length
+        column.append(value[np.newaxis])
+        # Make the array readable right away. Leave it to the operating
+        # system to put the data on disk: syncing every array would make the
+        # RunEngine wait for the disk.
+        column.flush(sync=False)
+        datum_id = '{}/{}'.format(resource_uid, index)
+        asset_docs.append(('datum', {'resource': resource_uid,
+                                     'datum_id': datum_id,
+                                     'datum_kwargs': {'index': index}}))
+        return asset_docs, datum_id
+
+    def close_run(self):
+        "Finish the files of the current run."
+        for _, column, _ in self._chunks.values():
+            column.close()
+        self._chunks.clear()
+        self._run_start = None
+
+
+class NpyChunkHandler:
+    """
+    Load arrays written by an :class:`ArrayOffloader`.
+
+    This follows the databroker handler interface: it is created from a
+    'resource' document and called with the ``datum_kwargs`` of each
+    'datum'.
+    """
+    specs = {ArrayOffloader.spec}
+
+    def __init__(self, resource_path, root=''):
+        self._path = os.path.join(root, resource_path)
+
+    def __call__(self, index):
+        # The file may have grown since it was last loaded.
+        return np.load(self._path, mmap_mode='r')[index]
+
+    def get_file_list(self, datum_kwarg_gen):
+        return [self._path]
@@ -529,8 +529,9 @@ def collect(obj, *, stream=False):
     obj : fly-able
         Device with 'kickoff', 'complete', and 'collect' methods
     stream : boolean
-        If False (default), emit events documents in one bulk dump. If True,
-        emit events one at time.
+        If False (default), emit events documents in bulk dumps of bounded
+        size (see ``RunEngine.collect_chunk_size``). If True, emit events one
+        at time.
 
     Yields
     ------
@@ -5,7 +5,7 @@ import sys
 import logging
 from warnings import warn
 from inspect import Parameter, Signature
-from itertools import count, tee
+from itertools import count, tee, islice
 from collections import deque, defaultdict, ChainMap
 from enum import Enum
 import functools
@@ -13,6 +13,7 @@ import inspect
 from contextlib import ExitStack
 
 import jsonschema
+import numpy as np
 from event_model import DocumentNames, schemas
 from super_state_machine.machines import StateMachine
 from super_state_machine.extras import PropertyMachine
@@ -25,7 +26,8 @@ from .utils import (CallbackRegistry, SigintHandler, normalize_subs_input,
                     InvalidCommand, PlanHalt, Msg, ensure_generator,
                     single_gen, short_uid)
 
-_validate = functools.partial(jsonschema.validate, types={'array': (list, tuple)})
+_validate = functools.partial(jsonschema.validate,
+                              types={'array': (list, tuple, np.ndarray)})
 
 
 class RunEngineStateMachine(StateMachine):
@@ -191,6 +193,21 @@ class RunEngine:
         It is set to ``bluesky.run_engine.PAUSE_MSG`` by default and
         can be modified based on needs.
 
+    collect_chunk_size : int or None
+        Maximum number of Events bundled into one 'bulk_events' document when
+        collecting from a flyer with ``stream=False``. Default is 10000. Set
+        to None for no limit.
+
+    collect_chunk_nbytes : int or None
+        Approximate maximum size in bytes of the data carried by one
+        'bulk_events' document. Default is 64 MiB. Set to None for no limit.
+
+    array_offloader
+        If not None, an object like ``bluesky.offload.ArrayOffloader`` that
+        writes large array readings to files, so that Events carry a datum
+        id in their place, described by 'resource' and 'datum' documents.
+        Default is None.
+
     commands:
         The list of commands available to Msg.
 
@@ -234,6 +251,9 @@ class RunEngine:
         self.waiting_hook = None
         self.record_interruptions = False
         self.pause_msg = PAUSE_MSG
+        self.collect_chunk_size = 10000
+        self.collect_chunk_nbytes = 64 * 2**20
+        self.array_offloader = None
 
         # The RunEngine keeps track of a *lot* of state.
         # All flags and caches are defined here with a comment. Good luck.
@@ -259,6 +279,7 @@ class RunEngine:
         self._config_values_cache = dict()  # " obj.read_configuration() values
         self._config_ts_cache = dict()  # " obj.read_configuration() timestamps
         self._descriptors = dict()  # cache of {name: (objs_frozen_set, doc)}
+        self._offloaded_fields = dict()  # {stream name: fields in files}
         self._monitor_params = dict()  # cache of {obj: (cb, kwargs)}
         self._sequence_counters = dict()  # a seq_num counter per stream
         self._teed_sequence_counters = dict()  # for if we redo data-points
@@ -469,6 +490,7 @@ class RunEngine:
         self._config_values_cache.clear()
         self._config_ts_cache.clear()
         self._descriptors.clear()
+        self._offloaded_fields.clear()
         self._sequence_counters.clear()
         self._teed_sequence_counters.clear()
         self._groups.clear()
@@ -1419,6 +1441,8 @@ class RunEngine:
                    reason=reason,
                    num_events=num_events)
         self._clear_run_cache()
+        if self.array_offloader is not None:
+            self.array_offloader.close_run()
         yield from self.emit(DocumentNames.stop, doc)
         self.log.debug("Emitted RunStop (uid=%r)", doc['uid'])
         yield from self._reset_checkpoint_state_coro()
@@ -1642,6 +1666,10 @@ class RunEngine:
         self._bundling = False
         self._bundle_name = None
 
+        # Merge list of readings into single dict.
+        readings = {k: v for d in self._read_cache for k, v in d.items()}
+        data, timestamps = _rearrange_into_parallel_dicts(readings)
+
         d_objs, doc = self._descriptors.get(desc_key, (None, None))
         if d_objs is not None and d_objs != objs_read:
             raise RuntimeError("Mismatched objects read, expected {!s}, "
@@ -1666,6 +1694,14 @@ class RunEngine:
                 config[name]['data_keys'] = self._config_desc_cache[obj]
                 if hasattr(obj, 'hints'):
                     hints[name] = obj.hints
+            if self.array_offloader is not None:
+                offloaded = self.array_offloader.select(
+                    {k: v for k, v in data.items()
+                     if 'external' not in data_keys.get(k, {})})
+                for field in offloaded:
+                    data_keys[field] = dict(data_keys[field],
+                                            external='FILESTORE:')
+                self._offloaded_fields[desc_key] = offloaded
             descriptor_uid = new_uid()
             doc = dict(run_start=self._run_start_uid, time=ttime.time(),
                        data_keys=data_keys, uid=descriptor_uid,
@@ -1679,8 +1715,15 @@ class RunEngine:
 
         descriptor_uid = doc['uid']
 
+        # Write large arrays to files, replacing them with datum ids.
+        asset_docs = list(self._asset_docs_cache)
+        for field in self._offloaded_fields.get(desc_key, ()):
+            docs, data[field] = self.array_offloader.write(
+                self._run_start_uid, desc_key, field, data[field])
+            asset_docs.extend(docs)
+
         # Resource and Datum documents
-        for name, doc in self._asset_docs_cache:
+        for name, doc in asset_docs:
             # Add a 'run_start' field to the resource document on its way out.
             if name == 'resource':
                 doc['run_start'] = self._run_start_uid
@@ -1689,11 +1732,6 @@ class RunEngine:
         # Event documents
         seq_num = next(self._sequence_counters[seq_num_key])
         event_uid = new_uid()
-        # Merge list of readings into single dict.
-        readings = {k: v for d in self._read_cache for k, v in d.items()}
-        for key in readings:
-            readings[key]['value'] = readings[key]['value']
-        data, timestamps = _rearrange_into_parallel_dicts(readings)
         # Mark all externally-stored data as not filled so that consumers
         # know that the corresponding data are identifies, not dereferenced
         # data.
@@ -1832,6 +1870,15 @@ class RunEngine:
 
             Msg('collect', obj)
             Msg('collect', obj, stream=True)
+
+        If ``stream`` is False, Events are emitted in 'bulk_events' documents
+        of bounded size (see ``RunEngine.collect_chunk_size`` and
+        ``RunEngine.collect_chunk_nbytes``). If ``obj.collect()`` is a
+        generator, memory use is then independent of the length of the scan.
+
+        If the flyer has a ``collect_pages`` method, it is used instead of
+        ``collect`` and each page of arrays it yields is emitted as one
+        'event_page' document, irrespective of ``stream``.
         """
         obj = msg.obj
 
@@ -1888,32 +1935,75 @@ class RunEngine:
 
             bulk_data[descriptor_uid] = []
 
+        if hasattr(obj, 'collect_pages'):
+            for page in obj.collect_pages():
+                stream_name, descriptor_uid = local_descriptors[
+                    frozenset(page['data'])]
+                num = len(page['time'])
+                if not num:
+                    continue
+                counter = self._sequence_counters[stream_name]
+                first_seq_num = next(counter)
+                # Advance the counter past the rest of the page.
+                deque(islice(counter, num - 1), maxlen=0)
+                data_keys = self._descriptors[stream_name][1]['data_keys']
+                filled = {k: [False] * num
+                          for k, v in data_keys.items() if 'external' in v}
+                doc = dict(descriptor=descriptor_uid,
+                           time=page['time'],
+                           uid=[new_uid() for _ in range(num)],
+                           seq_num=list(range(first_seq_num,
+                                              first_seq_num + num)),
+                           data=page['data'],
+                           timestamps=page['timestamps'],
+                           filled=filled)
+                yield from self.emit(DocumentNames.event_page, doc)
+                self.log.debug("Emitted EventPage of %d Events with data "
+                               "keys %r (descriptor uid=%r)", num,
+                               doc['data'].keys(), descriptor_uid)
+            return
+
         # If stream is True, run 'event' subscription per document.
-        # If stream is False, run 'bulk_events' subscription once.
+        # If stream is False, run 'bulk_events' subscription once per chunk
+        # of at most collect_chunk_size events or collect_chunk_nbytes bytes.
         stream = msg.kwargs.get('stream', False)
+        max_events = self.collect_chunk_size
+        max_nbytes = self.collect_chunk_nbytes
+        chunk_events = 0
+        chunk_nbytes = 0
+        emitted_bulk = False
         for ev in obj.collect():
-            objs_read = frozenset(ev['data'])
-            stream_name, descriptor_uid = local_descriptors[objs_read]
-            seq_num = next(self._sequence_counters[stream_name])
-
-            event_uid = new_uid()
-
-            reading = ev['data']
-            for key in ev['data']:
-                reading[key] = reading[key]
-            ev['data'] = reading
+            # Stamp the Event in place; the flyer hands over ownership.
+            stream_name, descriptor_uid = local_descriptors[
+                frozenset(ev['data'])]
             ev['descriptor'] = descriptor_uid
-            ev['seq_num'] = seq_num
-            ev['uid'] = event_uid
+            ev['seq_num'] = next(self._sequence_counters[stream_name])
+            ev['uid'] = new_uid()
 
             if stream:
                 self.log.debug("Emitted Event with data keys %r (uid=%r)",
                                ev['data'].keys(), ev['uid'])
                 yield from self.emit(DocumentNames.event, ev)
-            else:
-                bulk_data[descriptor_uid].append(ev)
+                continue
 
-        if not stream:
+            bulk_data[descriptor_uid].append(ev)
+            chunk_events += 1
+            if max_nbytes is not None:
+                chunk_nbytes += _estimate_nbytes(ev['data'])
+            if ((max_events is not None and chunk_events >= max_events) or
+                    (max_nbytes is not None and chunk_nbytes >= max_nbytes)):
+                yield from self.emit(DocumentNames.bulk_events, bulk_data)
+                self.log.debug("Emitted chunk of %d bulk events for "
+                               "descriptors with uids %r", chunk_events,
+                               bulk_data.keys())
+                emitted_bulk = True
+                bulk_data = {uid: [] for uid in bulk_data}
+                chunk_events = 0
+                chunk_nbytes = 0
+
+        # Flush the remainder. Always emit at least one (possibly empty)
+        # 'bulk_events' document, as consumers may rely on it.
+        if not stream and (chunk_events or not emitted_bulk):
             yield from self.emit(DocumentNames.bulk_events, bulk_data)
             self.log.debug("Emitted bulk events for descriptors with uids "
                            "%r", bulk_data.keys())
@@ -2427,6 +2517,17 @@ class Dispatcher:
         self.cb_registry.ignore_exceptions = val
 
 
+def _estimate_nbytes(data):
+    "Cheaply estimate the memory used by the values in an Event's data."
+    nbytes = 0
+    for value in data.values():
+        size = getattr(value, 'nbytes', None)
+        if size is None:
+            size = sys.getsizeof(value)
+        nbytes += size
+    return nbytes
+
+
 def _rearrange_into_parallel_dicts(readings):
     data = {}
     timestamps = {}
@@ -1,9 +1,13 @@
 import ast
+import pytest
 from bluesky.plans import scan, grid_scan
 import bluesky.preprocessors as bpp
 import bluesky.plan_stubs as bps
 from bluesky.preprocessors import SupplementalData
 from bluesky.callbacks.best_effort import BestEffortCallback
+from bluesky.callbacks.core import LiveTable
+from bluesky.callbacks.fitting import PeakStats
+from bluesky.callbacks.mpl_plotting import LivePlot
 
 
 def test_hints(RE, hw):
@@ -86,3 +90,69 @@ def test_live_grid(RE, hw):
     bec = BestEffortCallback()
     RE.subscribe(bec)
     RE(grid_scan([hw.det4], hw.motor1, 0, 1, 1, hw.motor2, 0, 1, 2, True))
+
+
+@pytest.fixture
+def received(monkeypatch):
+    "Record the descriptor of every Event passed to a table, plot or fit."
+    received = []
+    for cls in (LiveTable, LivePlot, PeakStats):
+        def event(self, doc, _event=cls.event):
+            received.append((self, doc['descriptor']))
+            return _event(self, doc)
+        monkeypatch.setattr(cls, 'event', event)
+    return received
+
+
+def test_routes(RE, hw, received):
+    bec = BestEffortCallback()
+    RE.subscribe(bec)
+
+    @bpp.run_decorator(md={'hints': {'dimensions': [(['motor'],
+                                                     'primary')]}})
+    def plan():
+        for i in range(3):
+            yield from bps.mv(hw.motor, i)
+            yield from bps.trigger_and_read([hw.motor, hw.ab_det])
+            yield from bps.trigger_and_read([hw.ab_det], name='secondary')
+
+    RE(plan())
+    uids = {doc['name']: uid for uid, doc in bec._descriptors.items()}
+    primary_plot = bec._live_plots[uids['primary']]['det_a']
+    secondary_plot = bec._live_plots[uids['secondary']]['det_a']
+    # The table and each plot only get the Events of their own descriptor.
+    table_events = [uid for consumer, uid in received
+                    if isinstance(consumer, LiveTable)]
+    assert table_events == [uids['primary']] * 3
+    for plots in (bec._live_plots, bec._peak_stats):
+        for uid, consumers in plots.items():
+            for consumer in consumers.values():
+                assert [u for c, u in received if c is consumer] == [uid] * 3
+    assert len(primary_plot.y_data) == len(secondary_plot.y_data) == 3
+
+
+def test_baseline_order(RE, hw, capsys):
+    bec = BestEffortCallback()
+    RE.subscribe(bec)
+    sd = SupplementalData(baseline=[hw.motor2, hw.ab_det, hw.motor1])
+    RE.preprocessors.append(sd)
+    RE(scan([hw.ab_det], hw.motor, 1, 5, 5))
+    out = capsys.readouterr().out
+    # The hinted fields are printed in the order in which they were read.
+    for subject in ('Start-of-run', 'End-of-run'):
+        section = out.split(subject + ' baseline readings:')[1]
+        rows = section.splitlines()[2:5]
+        assert [row.split('|')[1].strip() for row in rows] == \
+            ['motor2', 'det_a', 'motor1']
+
+
+def test_disabled_consumers(RE, hw, received):
+    bec = BestEffortCallback()
+    RE.subscribe(bec)
+    bec.disable_table()
+    bec.disable_plots()
+    RE(scan([hw.ab_det], hw.motor, 1, 5, 5))
+    assert bec._table is None
+    assert not bec._live_plots and not bec._peak_stats
+    assert all(not route.consumers for route in bec._routes.values())
+    assert not received
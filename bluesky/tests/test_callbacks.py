@@ -159,6 +159,42 @@ def test_table(RE, hw):
             assert ln[26:] == kn[26:]
 
 
+def test_table_buffered(RE, hw):
+    lines = []
+    logged = []
+    table = LiveTable(['det'], out=lines.append, logbook=logged.append,
+                      refresh_interval=1000, max_rows_per_refresh=5)
+    RE(count([hw.det], num=30), table)
+    # The header, printed at once, then the rows buffered until the end
+    assert len(lines) == 3 + 1 + 5 + 1
+    assert lines[3].split() == ['|', '...', '26', 'rows', '...', '|']
+    assert len(lines[3]) == len(lines[0])
+    assert lines[4].split()[1] == '27'
+    assert lines[-2] == lines[0]
+    # The complete table is kept.
+    assert len(table.table.split('\n')) == 3 + 30 + 1
+    assert logged == ['\n'.join([lines[-1], table.table])]
+
+    # Rows are printed at the refresh interval.
+    lines.clear()
+    table = LiveTable(['det'], out=lines.append, refresh_interval=0)
+    RE(count([hw.det], num=3), table)
+    assert len(lines) == 3 + 3 + 1 + 1
+
+
+def test_table_buffered_timer(RE, hw):
+    docs = []
+    RE(count([hw.det], num=3), lambda name, doc: docs.append((name, doc)))
+    lines = []
+    table = LiveTable(['det'], out=lines.append, refresh_interval=0.2)
+    # All but the 'stop' document: the rows held back are printed anyway.
+    for name, doc in docs[:-1]:
+        table(name, doc)
+    assert len(lines) < 3 + 3
+    time.sleep(0.5)
+    assert len(lines) == 3 + 3
+
+
 def test_table_external(RE, hw, db):
     RE.subscribe(db.insert)
     hw.img.reg = db.reg
@@ -321,6 +357,105 @@ def test_live_fit_plot(RE, hw):
         assert np.allclose(livefit.result.values[k], v, atol=1e-6)
 
 
+def test_live_plot_max_fps(RE, hw):
+    fig, ax = plt.subplots()
+    lplot = LivePlot('det', 'motor', ax=ax, max_fps=1e-3)
+    draws = []
+    update_plot = lplot.update_plot
+    lplot.update_plot = lambda: draws.append(update_plot())
+    RE(scan([hw.det], hw.motor, -1, 1, 50), lplot)
+    # once for the first Event, and once at the end
+    assert len(draws) == 2
+    x, y = lplot.current_line.get_data()
+    assert np.array_equal(x, np.linspace(-1, 1, 50))
+    assert np.array_equal(y, lplot.y_data)
+
+
+def test_live_plot_max_fps_timer(RE, hw):
+    fig, ax = plt.subplots()
+    lplot = LivePlot('det', 'motor', ax=ax, max_fps=1e-3)
+    docs = []
+    RE(scan([hw.det], hw.motor, -1, 1, 5),
+       lambda name, doc: docs.append((name, doc)))
+    # All but the 'stop' document
+    for name, doc in docs[:-1]:
+        lplot(name, doc)
+    assert len(lplot.current_line.get_xdata()) == 1
+    # A redraw is put off for the other points, and draws them when due.
+    assert lplot._throttle.pending
+    lplot._throttle.flush()
+    assert not lplot._throttle.pending
+    assert np.array_equal(lplot.current_line.get_xdata(),
+                          np.linspace(-1, 1, 5))
+
+
+def test_live_plot_max_runs(RE, hw):
+    fig, ax = plt.subplots()
+    lplot = LivePlot('det', 'motor', ax=ax, max_runs=2,
+                     keep_removed_runs=True)
+    uids = [RE(scan([hw.det], hw.motor, -1, 1, num), lplot)[0]
+            for num in (3, 4, 5)]
+    assert len(lplot.lines) == len(ax.lines) == 2
+    assert list(lplot.removed_runs) == uids[:1]
+    label, x, y = lplot.removed_runs[uids[0]]
+    assert np.array_equal(x, np.linspace(-1, 1, 3))
+
+    # Recalling a run removes the oldest one left.
+    lplot.recall(uids[0])
+    assert list(lplot.removed_runs) == uids[1:2]
+    assert [line.get_label() for line in ax.lines] == \
+        [lplot.current_line.get_label(), label]
+    assert np.array_equal(ax.lines[-1].get_xdata(), x)
+    with pytest.raises(ValueError):
+        LivePlot('det', max_runs=0)
+
+
+def test_live_fit_plot_max_runs(RE, hw):
+    lmfit = pytest.importorskip('lmfit')
+
+    def gaussian(x, A, sigma, x0):
+        return A * np.exp(-(x - x0) ** 2 / (2 * sigma ** 2))
+
+    model = lmfit.Model(gaussian)
+    init_guess = {'A': 2,
+                  'sigma': lmfit.Parameter('sigma', 3, min=0),
+                  'x0': -0.2}
+    livefit = LiveFit(model, 'det', {'x': 'motor'}, init_guess)
+    fig, ax = plt.subplots()
+    lfplot = LiveFitPlot(livefit, ax=ax, max_runs=1, keep_removed_runs=True)
+    uids = [RE(scan([hw.det], hw.motor, -1, 1, 5), lfplot)[0]
+            for _ in range(3)]
+    # The initial guess is removed with its run's fit.
+    assert ax.lines == lfplot.lines == [lfplot.init_guess_line,
+                                        lfplot.current_line]
+    assert list(lfplot.removed_runs) == uids[:2]
+    label, x, y = lfplot.removed_runs[uids[0]]
+    assert len(x) == len(y) == lfplot.num_points
+
+
+def test_decimate():
+    from bluesky.callbacks.mpl_plotting import _decimate
+    x = np.arange(10005.)
+    y = np.sin(x / 100)
+    y[3] = np.nan
+    dx, dy = _decimate(x, y, 100)
+    assert len(dx) <= 4 * 100
+    assert np.all(np.diff(dx) > 0)
+    assert np.nanmax(dy) == np.nanmax(y) and np.nanmin(dy) == np.nanmin(y)
+    assert dx[0] == 0 and dx[-1] == x[-1]
+    # Points are binned by x, not by position along the line: the dense
+    # half of this line is reduced, the sparse half is kept.
+    x = np.concatenate([np.linspace(0, 1, 10000), np.arange(2, 102)])
+    dx, dy = _decimate(x, np.sin(x), 100)
+    assert len(dx) < 200 and np.array_equal(dx[-99:], x[-99:])
+    # Decreasing x is binned as well.
+    assert len(_decimate(x[::-1], np.sin(x[::-1]), 100)[0]) == len(dx)
+    # A line going back and forth is left alone, as are short lines.
+    x = np.tile(np.linspace(-1, 1, 1000), 10)
+    assert len(_decimate(x, np.sin(x), 100)[0]) == len(x)
+    assert len(_decimate(x[:300], x[:300], 100)[0]) == 300
+
+
 @pytest.mark.parametrize('int_meth, stop_num, msg_num',
                          [('stop', 1, 5),
                           ('abort', 1, 5),
@@ -379,6 +514,64 @@ def test_live_scatter(RE, hw):
                     xlim=(-3, 3), ylim=(-5, 5)))
 
 
+def test_live_grid_incremental():
+    grid = LiveGrid((2, 3), 'I', max_fps=1e-3)
+    grid('start', {'time': 0, 'uid': 'abcdef', 'scan_id': 1})
+    values = [2., np.nan, -3., 7., 1.]
+    for seq_num, I in enumerate(values, 1):
+        grid('event', {'data': {'I': I}, 'seq_num': seq_num})
+    # Only the first pixel has been shown so far.
+    assert grid.im.get_clim()[1] < 7
+    grid.update((1, 0), 0.)  # Overwrite the maximum.
+    grid('stop', {'uid': 'b', 'run_start': 'abcdef'})
+    expected = np.ma.masked_invalid([[2., np.nan, -3.], [0., 1., np.nan]])
+    assert np.ma.allequal(grid.im.get_array(), expected)
+    assert np.array_equal(grid.im.get_array().mask, expected.mask)
+    assert grid.im.get_clim() == (-3, 2)
+
+
+def test_live_grid_max_fps_timer():
+    grid = LiveGrid((2, 3), 'I', max_fps=1e-3)
+    grid('start', {'time': 0, 'uid': 'abcdef', 'scan_id': 1})
+    for seq_num, I in enumerate([1., 5., 3.], 1):
+        grid('event', {'data': {'I': I}, 'seq_num': seq_num})
+    assert grid.im.get_clim()[1] < 5
+    # The pixels put off are shown when the redraw is due, without a 'stop'.
+    assert grid._throttle.pending
+    grid._throttle.flush()
+    assert grid.im.get_clim() == (1, 5)
+
+
+def test_live_scatter_incremental():
+    scatter = LiveScatter('x', 'y', 'I', max_fps=1e-3)
+    scatter('start', {'time': 0, 'uid': 'a'})
+    points = [(1, 5, 2.), (-2, 3, np.nan), (4, -1, -3.), (0, 0, 7.)]
+    for seq_num, (x, y, I) in enumerate(points, 1):
+        scatter('event', {'data': {'x': x, 'y': y, 'I': I},
+                          'seq_num': seq_num})
+    # Only the first point has been drawn so far.
+    assert len(scatter.sc.get_offsets()) == 1
+    scatter('stop', {'uid': 'b', 'run_start': 'a'})
+    assert np.array_equal(scatter.sc.get_offsets(),
+                          [(x, y) for x, y, _ in points])
+    assert scatter.ax.get_xlim() == (-2, 4)
+    assert scatter.ax.get_ylim() == (-1, 5)
+    assert scatter.sc.get_clim() == (-3, 7)
+
+
+def test_live_scatter_max_fps_timer():
+    scatter = LiveScatter('x', 'y', 'I', max_fps=1e-3)
+    scatter('start', {'time': 0, 'uid': 'a'})
+    for seq_num in range(1, 4):
+        scatter('event', {'data': {'x': seq_num, 'y': 0, 'I': 1.},
+                          'seq_num': seq_num})
+    assert len(scatter.sc.get_offsets()) == 1
+    # The points put off are shown when the redraw is due, without a 'stop'.
+    assert scatter._throttle.pending
+    scatter._throttle.flush()
+    assert len(scatter.sc.get_offsets()) == 3
+
+
 @pytest.mark.xfail(raises=InterfaceError,
                    reason='something funny going on with 3.5, 3.6 and sqlite')
 def test_broker_base(RE, hw, db):
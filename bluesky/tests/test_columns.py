@@ -0,0 +1,97 @@
+import json
+import os
+
+import numpy as np
+
+from bluesky.callbacks.columns import ColumnStore, load_stream
+from bluesky.plans import count
+
+
+def test_column_store(RE, hw, tmpdir):
+    directory = str(tmpdir)
+    store = ColumnStore(directory)
+    docs = []
+    RE.subscribe(store)
+    RE.subscribe(lambda name, doc: docs.append((name, doc)))
+    uid, = RE(count([hw.det, hw.direct_img], num=1500))
+
+    columns = load_stream(directory, uid)
+    events = [doc for name, doc in docs if name == 'event']
+    assert isinstance(columns['det'], np.memmap)
+    assert np.array_equal(columns['det'],
+                          [event['data']['det'] for event in events])
+    assert np.array_equal(columns['seq_num'], np.arange(1, 1501))
+    assert np.array_equal(columns['time'],
+                          [event['time'] for event in events])
+    assert np.array_equal(columns['timestamps/det'],
+                          [event['timestamps']['det'] for event in events])
+    assert columns['img'].shape == (1500, 10, 10)
+    assert np.array_equal(columns['img'][-1], events[-1]['data']['img'])
+
+    with open(os.path.join(directory, uid, 'metadata.json')) as f:
+        metadata = json.load(f)
+    assert metadata['start']['uid'] == uid
+    assert metadata['stop']['run_start'] == uid
+    assert metadata['streams']['primary']['fields'] == ['det', 'img']
+
+
+def test_column_store_pages_and_missing_fields(tmpdir):
+    directory = str(tmpdir)
+    store = ColumnStore(directory, flush_interval=2)
+    data_keys = {'x': {'dtype': 'number', 'shape': [], 'source': ''},
+                 'n': {'dtype': 'integer', 'shape': [], 'source': ''},
+                 'label': {'dtype': 'string', 'shape': [], 'source': ''}}
+    store('start', {'uid': 'a', 'time': 0})
+    store('descriptor', {'uid': 'b', 'run_start': 'a', 'time': 0,
+                         'name': 'primary', 'data_keys': data_keys})
+    store('event', {'descriptor': 'b', 'time': 1, 'seq_num': 1,
+                    'data': {'x': 1.5, 'label': 'one'},
+                    'timestamps': {'x': 1, 'label': 1}})
+    store('event_page', {'descriptor': 'b', 'time': [2, 3],
+                         'seq_num': [2, 3],
+                         'data': {'x': np.array([2.5, 3.5]),
+                                  'n': np.array([2, 3]),
+                                  'label': ['two', 'three']},
+                         'timestamps': {'x': [2, 3], 'n': [2, 3],
+                                        'label': [2, 3]}})
+
+    # The run is not over, but the Events received so far can be read.
+    columns = load_stream(directory, 'a')
+    assert np.array_equal(columns['x'], [1.5, 2.5, 3.5])
+    assert np.array_equal(columns['n'], [0, 2, 3])  # filled before 'n' came
+    assert columns['n'].dtype == np.int64
+    assert 'label' not in columns
+
+    store('stop', {'uid': 'c', 'run_start': 'a', 'time': 4})
+    with open(os.path.join(directory, 'a', 'metadata.json')) as f:
+        metadata = json.load(f)
+    assert metadata['streams']['primary']['skipped_fields'] == ['label']
+    # Spare capacity is released at the end of the run.
+    assert os.path.getsize(os.path.join(directory, 'a', 'primary',
+                                        'x.npy')) == 256 + 3 * 8
+
+
+def test_column_store_reserved_names_and_misfits(tmpdir):
+    directory = str(tmpdir)
+    store = ColumnStore(directory)
+    # 'img' is described as a scalar, as some devices do, but is an image.
+    data_keys = {'time': {'dtype': 'number', 'shape': [], 'source': ''},
+                 'img': {'dtype': 'number', 'shape': [], 'source': ''}}
+    store('start', {'uid': 'a', 'time': 0})
+    store('descriptor', {'uid': 'b', 'run_start': 'a', 'time': 0,
+                         'name': 'primary', 'data_keys': data_keys})
+    for i, img in enumerate([np.ones((2, 2)), np.ones((3, 3)),
+                             np.ones((2, 2))]):
+        store('event', {'descriptor': 'b', 'time': 10 + i, 'seq_num': i + 1,
+                        'data': {'time': 5, 'img': img},
+                        'timestamps': {'time': 1, 'img': 1}})
+    store('stop', {'uid': 'c', 'run_start': 'a', 'time': 4})
+
+    columns = load_stream(directory, 'a')
+    assert np.array_equal(columns['time'], [10, 11, 12])
+    assert columns['img'].shape == (3, 2, 2)
+    assert np.isnan(columns['img'][1]).all()
+    assert np.array_equal(columns['img'][2], np.ones((2, 2)))
+    with open(os.path.join(directory, 'a', 'metadata.json')) as f:
+        metadata = json.load(f)
+    assert metadata['streams']['primary']['skipped_fields'] == ['time']
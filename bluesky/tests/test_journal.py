@@ -0,0 +1,195 @@
+import json
+import os
+import pickle
+import time
+import zlib
+
+import numpy as np
+from ophyd.sim import SynSignal
+import pytest
+
+from bluesky.callbacks.broker import post_run
+from bluesky.callbacks.journal import (Journal, JournalReader, _FRAME,
+                                       _MAGIC)
+from bluesky.offload import ArrayOffloader, NpyChunkHandler
+from bluesky.plans import count
+from bluesky.run_engine import Dispatcher
+
+
+def read_segment(path):
+    with open(path, 'rb') as f:
+        assert f.read(len(_MAGIC)) == _MAGIC
+        while True:
+            header = f.read(_FRAME.size)
+            if not header:
+                return
+            length, crc = _FRAME.unpack(header)
+            payload = f.read(length)
+            assert zlib.crc32(payload) == crc
+            yield pickle.loads(payload)
+
+
+def read_index(directory):
+    with open(os.path.join(directory, 'index.jsonl')) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_journal(RE, hw, tmpdir):
+    directory = str(tmpdir)
+    journal = Journal(directory, index_interval=2)
+    docs = []
+    RE.subscribe(journal)
+    RE.subscribe(lambda name, doc: docs.append((name, doc)))
+    uid, = RE(count([hw.det], num=5))
+    journal.close()
+
+    assert list(read_segment(os.path.join(directory, '00000000.journal'))) \
+        == docs
+    index = read_index(directory)
+    descriptor_uid = docs[1][1]['uid']
+    assert [(key, entry[key]) for entry in index for key in entry
+            if key in ('start', 'descriptor', 'stop')] == [
+        ('start', uid), ('descriptor', descriptor_uid),
+        ('stop', docs[-1][1]['uid'])]
+    ranges = [(entry['first'], entry['last']) for entry in index
+              if 'events' in entry]
+    assert ranges == [(1, 2), (3, 4), (5, 5)]
+    # The offset of each range is that of its first Event.
+    entry = next(entry for entry in index if 'events' in entry)
+    with open(os.path.join(directory, '00000000.journal'), 'rb') as f:
+        f.seek(entry['offset'])
+        length, _ = _FRAME.unpack(f.read(_FRAME.size))
+        name, doc = pickle.loads(f.read(length))
+    assert name == 'event' and doc['seq_num'] == 1
+
+
+def test_journal_segments(RE, hw, tmpdir):
+    directory = str(tmpdir)
+    journal = Journal(directory, segment_size=1, fsync=None)
+    token = RE.subscribe(journal)
+    RE(count([hw.det], num=3))
+    RE.unsubscribe(token)
+    journal.close()
+    # One document per segment, plus the index
+    assert len(os.listdir(directory)) == 6 + 1
+    ranges = [(entry['first'], entry['segment']) for entry
+              in read_index(directory) if 'events' in entry]
+    assert ranges == [(1, 2), (2, 3), (3, 4)]
+
+    # Reopening appends new segments.
+    journal = Journal(directory, fsync=0.5)
+    assert journal.segment == 5
+    RE.subscribe(journal)
+    RE(count([hw.det]))
+    journal.close()
+    assert journal.segment == 6
+    assert len(list(read_segment(os.path.join(directory,
+                                              '00000006.journal')))) == 4
+
+
+def test_journal_without_writev(RE, hw, tmpdir, monkeypatch):
+    monkeypatch.delattr(os, 'writev')
+    directory = str(tmpdir)
+    journal = Journal(directory)
+    docs = []
+    RE.subscribe(journal)
+    RE.subscribe(lambda name, doc: docs.append((name, doc)))
+    RE(count([hw.det], num=3))
+    journal.close()
+    assert list(read_segment(os.path.join(directory, '00000000.journal'))) \
+        == docs
+
+
+def test_journal_fsync_policy(tmpdir):
+    with pytest.raises(ValueError):
+        Journal(str(tmpdir), fsync='sometimes')
+
+
+def test_journal_reader(RE, hw, tmpdir):
+    directory = str(tmpdir)
+    journal = Journal(directory, index_interval=2)
+    RE.subscribe(journal)
+    RE(count([hw.det], num=2))
+    docs = []
+    token = RE.subscribe(lambda name, doc: docs.append((name, doc)))
+    uid, = RE(count([hw.det], num=5))
+    RE.unsubscribe(token)
+    # Another run follows, and the journal is still being written.
+    RE(count([hw.det], num=1))
+
+    reader = JournalReader(directory)
+    runs = reader.runs()
+    assert len(runs) == 3 and all(run['complete'] for run in runs)
+    assert runs[1]['uid'] == uid
+    run = reader[uid]
+    assert list(run.documents()) == docs
+    assert [event['seq_num'] for event in run.events(seq_num=4)] == [4, 5]
+    assert list(run.events(stream_name='baseline')) == []
+
+    dispatcher = Dispatcher()
+    replayed = []
+    dispatcher.subscribe(lambda name, doc: replayed.append((name, doc)))
+    run.replay(dispatcher)
+    assert replayed == docs
+
+    # post_run accepts a JournalReader in place of a Broker.
+    replayed.clear()
+    post_run(lambda name, doc: replayed.append((name, doc)),
+             reader)('stop', docs[-1][1])
+    assert replayed == docs
+    journal.close()
+    reader.close()
+
+
+def test_journal_reader_fill(RE, hw, tmpdir):
+    directory = str(tmpdir.join('journal'))
+    RE.array_offloader = ArrayOffloader(str(tmpdir.join('arrays')),
+                                        threshold=800)
+    journal = Journal(directory)
+    RE.subscribe(journal)
+    img = SynSignal(func=lambda: np.ones((10, 10)), name='img')
+    uid, = RE(count([hw.det, img], num=2))
+    journal.close()
+
+    run = JournalReader(directory)[uid]
+    event = next(doc for name, doc in run.documents() if name == 'event')
+    assert event['filled'] == {'img': False}
+    with pytest.raises(KeyError):
+        list(run.documents(fill=True))
+
+    reader = JournalReader(directory, handler_registry={
+        ArrayOffloader.spec: NpyChunkHandler})
+    events = [doc for name, doc in reader[uid].documents(fill=True)
+              if name == 'event']
+    assert len(events) == 2
+    for event in events:
+        assert event['filled'] == {'img': True}
+        assert np.array_equal(event['data']['img'], np.ones((10, 10)))
+    reader.close()
+
+
+def test_journal_replay_rate(tmpdir):
+    directory = str(tmpdir)
+    journal = Journal(directory)
+    journal('start', {'uid': 'a', 'time': 100})
+    journal('descriptor', {'uid': 'b', 'run_start': 'a', 'time': 100.1,
+                           'name': 'primary'})
+    journal('stop', {'uid': 'c', 'run_start': 'a', 'time': 100.3})
+    reader = JournalReader(directory)
+    for rate, expected in [(1, 0.3), (10, 0.03)]:
+        t0 = time.monotonic()
+        reader['a'].replay(lambda name, doc: None, rate=rate)
+        assert expected <= time.monotonic() - t0 < expected + 0.2
+    journal.close()
+
+
+def test_journal_reader_ignores_torn_frame(tmpdir):
+    directory = str(tmpdir)
+    journal = Journal(directory)
+    journal('start', {'uid': 'a', 'time': 0})
+    journal.close()
+    with open(os.path.join(directory, '00000000.journal'), 'ab') as f:
+        f.write(_FRAME.pack(1000, 0) + b'partial')
+    reader = JournalReader(directory)
+    assert reader.runs() == [{'uid': 'a', 'time': 0, 'complete': False}]
+    assert [name for name, doc in reader['a'].documents()] == ['start']
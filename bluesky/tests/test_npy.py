@@ -0,0 +1,21 @@
+import numpy as np
+
+from bluesky.npy import NpyColumn
+
+
+def test_npy_column(tmpdir):
+    path = str(tmpdir.join('column.npy'))
+    column = NpyColumn(path, 'f8', (2,), length=1, capacity=2)
+    assert np.load(path).shape == (1, 2)
+    column.append(np.ones((3, 2)))
+    column.flush(sync=False)
+    # The file has grown past its first capacity, and can be read meanwhile.
+    assert column.capacity == 4
+    data = np.load(path, mmap_mode='r')
+    assert np.isnan(data[0]).all()
+    assert (data[1:] == 1).all()
+    column.append([[2, 2]])
+    column.close()
+    data = np.load(path)
+    assert data.shape == (5, 2)
+    assert (data[4] == 2).all()
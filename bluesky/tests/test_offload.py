@@ -0,0 +1,55 @@
+from itertools import count as counter
+import os
+
+import numpy as np
+from ophyd.sim import SynSignal
+
+from bluesky.offload import ArrayOffloader, NpyChunkHandler
+from bluesky.plans import count
+
+
+def test_array_offloader(RE, hw, tmpdir):
+    root = str(tmpdir)
+    RE.array_offloader = ArrayOffloader(root, threshold=800, chunk_size=2)
+    docs = []
+    RE.subscribe(lambda name, doc: docs.append((name, doc)))
+    frame_number = counter(1)
+    img = SynSignal(func=lambda: np.full((10, 10), next(frame_number)),
+                    name='img')
+    RE(count([hw.det, img], num=5))
+
+    descriptor, = [doc for name, doc in docs if name == 'descriptor']
+    assert descriptor['data_keys']['img']['external'] == 'FILESTORE:'
+    assert 'external' not in descriptor['data_keys']['det']
+    resources = {doc['uid']: doc for name, doc in docs if name == 'resource'}
+    datums = {doc['datum_id']: doc for name, doc in docs if name == 'datum'}
+    events = [doc for name, doc in docs if name == 'event']
+    assert len(resources) == 3  # 5 images in chunks of 2
+    assert len(datums) == 5
+    frames = []
+    for event in events:
+        assert event['filled'] == {'img': False}
+        datum = datums[event['data']['img']]
+        resource = resources[datum['resource']]
+        assert resource['run_start'] == descriptor['run_start']
+        # Resources and datums come before the Events that refer to them.
+        assert docs.index(('datum', datum)) < docs.index(('event', event))
+        handler = NpyChunkHandler(resource['resource_path'],
+                                  root=resource['root'])
+        frames.append(handler(**datum['datum_kwargs']))
+    # One new frame per Event, all in order
+    first = frames[0][0, 0]
+    for i, frame in enumerate(frames):
+        assert np.array_equal(frame, np.full((10, 10), first + i))
+    # The files are trimmed to their content when the run ends.
+    for resource in resources.values():
+        path = os.path.join(root, resource['resource_path'])
+        assert np.load(path).shape[0] in (1, 2)
+
+    # Small arrays stay in the Events.
+    RE.array_offloader.threshold = 801
+    docs.clear()
+    RE(count([img]))
+    event, = [doc for name, doc in docs if name == 'event']
+    assert isinstance(event['data']['img'], np.ndarray)
+    assert not any(name == 'resource' for name, doc in docs)
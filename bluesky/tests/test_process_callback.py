@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from bluesky.callbacks import CallbackCounter
+from bluesky.callbacks.mpl_plotting import LivePlot
+from bluesky.callbacks.process import ProcessCallback
+from bluesky.plans import count, scan
+
+
+def test_process_callback(RE, hw):
+    counter = ProcessCallback(CallbackCounter)
+    RE.subscribe(counter)
+    RE(count([hw.det], num=5))
+    # start, descriptor, 5 events, stop
+    assert counter.call('__getattribute__', 'value') == 8
+    # Attributes are forwarded too.
+    assert counter.value == 8
+    with pytest.raises(AttributeError):
+        counter.no_such_attribute
+    with pytest.raises(RuntimeError):
+        counter.call('no_such_method')
+    counter.close()
+    assert not counter._process.is_alive()
+
+
+def test_process_callback_plot(RE, hw):
+    plot = ProcessCallback(LivePlot, 'det', 'motor', backend='agg')
+    RE(scan([hw.det], hw.motor, -1, 1, 5), plot)
+    assert np.array_equal(plot.x_data, np.linspace(-1, 1, 5))
+    # Methods are called in the child process.
+    plot.update_caches(2, 3)
+    assert plot.y_data[-1] == 3
+    plot.close()
+
+
+def test_process_callback_unpicklable(RE, hw):
+    counter = ProcessCallback(CallbackCounter)
+    RE.subscribe(counter)
+    # One document that cannot be pickled is lost, not the rest.
+    counter('event', {'data': {'f': lambda: None}})
+    RE(count([hw.det], num=5))
+    assert counter.value == 8
+    # A call whose arguments cannot be pickled fails at once.
+    with pytest.raises(RuntimeError):
+        counter.call('__call__', 'event', lambda: None)
+    assert counter.value == 8
+    # A call to a process that has died fails rather than waiting forever.
+    counter._process.terminate()
+    counter._process.join()
+    with pytest.raises(RuntimeError):
+        counter.value
+    counter.close()
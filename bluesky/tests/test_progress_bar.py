@@ -1,8 +1,10 @@
 from bluesky.utils import ProgressBar, ProgressBarManager
+from tqdm._utils import _term_move_up
 from bluesky.plan_stubs import mv
 from bluesky.tests import requires_ophyd
 from bluesky import RunEngine
 from collections import OrderedDict
+import io
 import time
 
 
@@ -110,3 +112,28 @@ def test_draw_before_update():
     # Test that the default meter placeholder is valid to draw.
     pbar = ProgressBar([Status()])
     pbar.draw()
+
+
+def test_manager_rate_limits_drawing():
+    class Status:
+        done = False
+
+        def watch(self, func):
+            self.func = func
+
+    manager = ProgressBarManager(delay_draw=0.1, refresh_interval=0.05)
+    st = Status()
+    manager([st])
+    pbar = manager.pbar
+    pbar.fp = io.StringIO()
+    # Updates are only recorded; drawing happens on the manager's thread.
+    t0 = time.time()
+    while time.time() - t0 < 0.5:
+        st.func(name='', current=time.time() - t0, initial=0, target=1)
+    time.sleep(0.1)
+    draws = pbar.fp.getvalue().count(_term_move_up())
+    assert 3 <= draws <= 10
+    assert not pbar.changed
+    assert '0.5' in pbar.meters[0] or '0.4' in pbar.meters[0]
+    manager(None)
+    assert manager.pbar is None and pbar.done
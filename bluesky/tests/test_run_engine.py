@@ -1301,6 +1301,116 @@ def test_flyer_descriptor(RE, hw):
     assert 'object_keys' in descriptor
 
 
+def test_collect_bulk_events_in_chunks(RE):
+    from ophyd.sim import NullStatus
+
+    class GeneratingFlyer:
+        name = 'gen_flyer'
+        parent = None
+
+        def __init__(self, num):
+            self.num = num
+
+        def kickoff(self):
+            return NullStatus()
+
+        def complete(self):
+            return NullStatus()
+
+        def describe_collect(self):
+            return {'primary': {'x': {'source': 'gen', 'dtype': 'number',
+                                      'shape': []}}}
+
+        def collect(self):
+            for i in range(self.num):
+                yield {'time': i, 'data': {'x': i}, 'timestamps': {'x': i}}
+
+    collector = []
+    RE.subscribe(lambda name, doc: collector.append(doc), 'bulk_events')
+
+    RE.collect_chunk_size = 4
+    flyer = GeneratingFlyer(10)
+    RE([Msg('open_run'), Msg('kickoff', flyer), Msg('collect', flyer),
+        Msg('close_run')])
+    assert [len(evs) for doc in collector for evs in doc.values()] == [4, 4, 2]
+    seq_nums = [ev['seq_num'] for doc in collector
+                for evs in doc.values() for ev in evs]
+    assert seq_nums == list(range(1, 11))
+
+    # An exact multiple of the chunk size does not produce an empty chunk.
+    collector.clear()
+    RE([Msg('open_run'), Msg('collect', GeneratingFlyer(8)),
+        Msg('close_run')])
+    assert [len(evs) for doc in collector for evs in doc.values()] == [4, 4]
+
+    # The size limit applies too.
+    collector.clear()
+    RE.collect_chunk_size = None
+    RE.collect_chunk_nbytes = 1
+    RE([Msg('open_run'), Msg('collect', GeneratingFlyer(3)),
+        Msg('close_run')])
+    assert [len(evs) for doc in collector for evs in doc.values()] == [1, 1, 1]
+
+    # With no events, one empty bulk_events document is still emitted.
+    collector.clear()
+    RE([Msg('open_run'), Msg('collect', GeneratingFlyer(0)),
+        Msg('close_run')])
+    assert [len(evs) for doc in collector for evs in doc.values()] == [0]
+
+
+def test_collect_pages(RE):
+    import numpy as np
+    from ophyd.sim import NullStatus
+    from bluesky.callbacks import CallbackBase
+
+    class PagingFlyer:
+        name = 'paging_flyer'
+        parent = None
+
+        def kickoff(self):
+            return NullStatus()
+
+        def complete(self):
+            return NullStatus()
+
+        def describe_collect(self):
+            return {'primary': {'x': {'source': 'gen', 'dtype': 'number',
+                                      'shape': []}}}
+
+        def collect(self):
+            raise AssertionError("collect_pages should be used instead")
+
+        def collect_pages(self):
+            for start in (0, 5):
+                x = np.arange(start, start + 5)
+                yield {'time': x.astype(float), 'data': {'x': x},
+                       'timestamps': {'x': x.astype(float)}}
+
+    class EventCollector(CallbackBase):
+        def __init__(self):
+            self.events = []
+
+        def event(self, doc):
+            self.events.append(doc)
+
+    pages = []
+    events = EventCollector()
+    RE.subscribe(lambda name, doc: pages.append(doc), 'event_page')
+    RE.subscribe(events)
+    flyer = PagingFlyer()
+    RE([Msg('open_run'), Msg('kickoff', flyer), Msg('collect', flyer),
+        Msg('close_run')])
+
+    assert len(pages) == 2
+    assert [page['seq_num'] for page in pages] == [[1, 2, 3, 4, 5],
+                                                   [6, 7, 8, 9, 10]]
+    assert isinstance(pages[0]['data']['x'], np.ndarray)
+    assert len(set(uid for page in pages for uid in page['uid'])) == 10
+    # CallbackBase unpacks pages for subclasses that only handle Events.
+    assert [ev['data']['x'] for ev in events.events] == list(range(10))
+    assert [ev['seq_num'] for ev in events.events] == list(range(1, 11))
+
+
 def test_filled(RE, hw, db):
 
     collector = []
@@ -1,7 +1,8 @@
 import numpy as np
 from bluesky.plans import scan
 from ophyd.sim import motor, noisy_det, det, SynGauss
-from bluesky.callbacks.fitting import PeakStats
+from bluesky.callbacks.fitting import (LivePeakStats, PeakStats,
+                                       _half_max_crossings)
 
 
 def get_ps(x, y, shift=0.5):
@@ -87,3 +88,44 @@ def test_peak_statistics_compare_chx(RE):
     assert np.allclose(ps.cen, ps_chx['cen'], atol=1e-6)
     assert np.allclose(ps.com, ps_chx['com'], atol=1e-6)
     assert np.allclose(ps.fwhm, ps_chx['fwhm'], atol=1e-6)
+
+
+def test_live_peak_statistics(RE):
+    s = np.random.RandomState(1)
+    noisy_det_fix = SynGauss('noisy_det_fix', motor, 'motor', center=0, Imax=1,
+                             noise='uniform', sigma=1, noise_multiplier=0.1,
+                             random_state=s)
+    ps = PeakStats('motor', 'noisy_det_fix')
+    lps = LivePeakStats('motor', 'noisy_det_fix')
+    results = []
+
+    def record(name, doc):
+        if name == 'event':
+            results.append((lps.max, lps.cen))
+
+    RE(scan([noisy_det_fix], motor, -5, 5, 100), [ps, lps, record])
+
+    # At the end of the run, the results agree with PeakStats.
+    assert np.allclose(lps.com, ps.com)
+    assert lps.max == ps.max and lps.min == ps.min
+    assert np.allclose(lps.crossings, ps.crossings)
+    assert np.allclose(lps.cen, ps.cen)
+    assert np.allclose(lps.fwhm, ps.fwhm)
+    # During the run, they describe the points so far.
+    i = np.argmax(ps.y_data)
+    assert results[i][0] == ps.max
+    j = np.argmax(ps.y_data[:i])
+    assert results[i - 1][0] == (ps.x_data[j], ps.y_data[j])
+    x, y = ps.x_data[:10], ps.y_data[:10]
+    crossings = _half_max_crossings(x, y, (np.max(y) + np.min(y)) / 2)
+    assert np.allclose(results[9][1], np.mean(crossings))
+
+    # Memory is bounded, and the results stay close.
+    lps = LivePeakStats('motor', 'det', max_points=16)
+    ps = PeakStats('motor', 'det')
+    RE(scan([det], motor, -5, 5, 1000), [ps, lps])
+    assert len(lps._x_points) <= 16
+    assert np.allclose(lps.com, ps.com)
+    assert lps.max == ps.max
+    assert np.allclose(lps.cen, ps.cen, atol=0.01)
+    assert np.allclose(lps.fwhm, ps.fwhm, atol=0.05)
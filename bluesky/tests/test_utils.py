@@ -3,7 +3,8 @@ import pytest
 from functools import reduce
 import operator
 
-from bluesky.utils import ensure_generator, Msg, merge_cycler
+from bluesky.utils import (ensure_generator, Msg, merge_cycler,
+                           MetadataStore)
 from cycler import cycler
 
 
@@ -100,3 +101,80 @@ def test_cycler_merge_mixed(hw, children):
 
     assert mcyc.keys == cyc.keys
     assert mcyc.by_key() == cyc.by_key()
+
+
+def test_metadata_store(RE, hw, tmpdir):
+    from bluesky.plans import count
+    path = str(tmpdir.join('md.sqlite'))
+    RE.md = MetadataStore(path, scan_id_block=2)
+    RE.md['project'] = 'sitting'
+    starts = []
+    RE(count([hw.det]), {'start': lambda name, doc: starts.append(doc)})
+    assert starts[0]['scan_id'] == 1
+    assert starts[0]['project'] == 'sitting'
+    for _ in range(4):
+        RE(count([hw.det]))
+    assert RE.md['scan_id'] == 5
+    RE.md.flush()
+
+    # The session dies without closing. Scan ids in the block it reserved
+    # are never used again.
+    md = MetadataStore(path)
+    assert md['project'] == 'sitting'
+    assert md['scan_id'] == 6
+    md.close()
+
+    # Closing saves everything, and releases the reserved scan ids.
+    RE.md['scan_id'] = 2
+    del RE.md['project']
+    RE.md.close()
+    with pytest.raises(RuntimeError):
+        RE.md['project'] = 'standing'
+    # Flushing and closing again do nothing.
+    RE.md.flush()
+    RE.md.close()
+    md = MetadataStore(path)
+    assert dict(md) == {'scan_id': 2}
+    md.close()
+
+
+def test_nb_kicker_sleeps_when_idle():
+    import asyncio
+    import matplotlib.pyplot as plt
+    from bluesky import utils
+    loop = asyncio.new_event_loop()
+    fig, ax = plt.subplots()
+    try:
+        utils.install_nb_kicker(loop=loop)
+        kicker = utils._NB_KICKER_INSTALLED[loop]
+        loop.run_until_complete(asyncio.sleep(1, loop=loop))
+        # A fixed 0.03 s interval would have kicked about 33 times.
+        assert kicker.kicks < 12
+
+        # A change to a figure wakes the kicker right away.
+        kicks = kicker.kicks
+        loop.call_soon(ax.plot, [1, 2])
+        loop.run_until_complete(asyncio.sleep(0.05, loop=loop))
+        assert kicker.kicks > kicks
+        assert not fig.stale
+    finally:
+        utils._NB_KICKER_INSTALLED.pop(loop)._handle.cancel()
+        loop.close()
+        plt.close(fig)
+
+
+def test_kicker_of_closed_loop():
+    import asyncio
+    import matplotlib.pyplot as plt
+    from bluesky import utils
+    loop = asyncio.new_event_loop()
+    fig, ax = plt.subplots()
+    try:
+        utils.install_nb_kicker(loop=loop)
+        loop.run_until_complete(asyncio.sleep(0.05, loop=loop))
+    finally:
+        loop.close()
+    # The figure's changes no longer reach the kicker, and do not fail.
+    ax.plot([1, 2])
+    assert loop not in utils._NB_KICKER_INSTALLED
+    plt.close(fig)
@@ -1,13 +1,19 @@
 from bluesky import Msg
 import multiprocessing
 import os
+import pickle
 import numpy as np
 import pytest
 import signal
+import socket
 import threading
 import time
-from bluesky.callbacks.zmq import Proxy, Publisher, RemoteDispatcher
+import bluesky.callbacks.zmq
+from bluesky.callbacks.zmq import (Proxy, Publisher, RemoteDispatcher, _Spool,
+                                   _extract_arrays, _restore_arrays,
+                                   _subscription_prefixes)
 from bluesky.plans import count
+from event_model import DocumentNames
 import cloudpickle
 
 
@@ -253,3 +259,387 @@ def test_zmq_no_RE_newserializer(RE):
     assert remote_accumulator == local_accumulator
 
 
+def test_array_frames_round_trip():
+    image = np.arange(12, dtype=np.uint16).reshape(3, 4)
+    doc = {'data': {'img': image, 'x': np.float64(3), 'y': 1,
+                    'strided': image[:, ::2],
+                    'objects': np.array(['a', None], dtype=object)},
+           'seq_num': 1}
+    buffers = []
+    skeleton = _extract_arrays(doc, buffers)
+    # The document itself is not modified.
+    assert doc['data']['img'] is image
+    assert len(buffers) == 2
+    assert buffers[0] is image  # contiguous arrays are not copied
+
+    received = _restore_arrays(pickle.loads(pickle.dumps(skeleton)),
+                               [memoryview(buf) for buf in buffers])
+    data = received['data']
+    assert data['img'].dtype == image.dtype
+    assert np.array_equal(data['img'], image)
+    assert np.array_equal(data['strided'], image[:, ::2])
+    assert not data['img'].flags.writeable
+    assert data['x'] == 3 and type(data['x']) is float
+    assert data['y'] == 1
+    assert data['objects'] == ['a', None]
+    assert received['seq_num'] == 1
+
+
+class _FakeSocket:
+    def __init__(self, sent, gate):
+        self.sent = sent
+        self.gate = gate
+
+    def setsockopt(self, *args):
+        ...
+
+    def connect(self, url):
+        ...
+
+    def send_multipart(self, frames, copy=True):
+        self.gate.wait()
+        self.sent.append(frames)
+
+
+class _FakeZMQ:
+    PUB = SNDHWM = object()
+
+    def __init__(self):
+        self.sent = []
+        self.gate = threading.Event()
+
+    def Context(self):
+        fake_zmq = self
+
+        class Context:
+            def socket(self, socket_type):
+                return _FakeSocket(fake_zmq.sent, fake_zmq.gate)
+
+            def destroy(self):
+                ...
+
+        return Context()
+
+
+def test_publisher_coalesces_small_documents():
+    fake_zmq = _FakeZMQ()
+    p = Publisher('127.0.0.1:5567', zmq=fake_zmq, batch_size=3)
+    image = np.ones((2, 2))
+    # The first document is held up in send_multipart while the rest queue.
+    p('start', {'uid': 'a'})
+    time.sleep(0.1)
+    for i in range(4):
+        p('event', {'seq_num': i})
+    p('event', {'seq_num': 4, 'data': {'img': image}})
+    p('event', {'seq_num': 5})
+    p('stop', {'uid': 'b'})
+    fake_zmq.gate.set()
+    p.flush()
+
+    messages = [(frames[0].split(b' ')[0], pickle.loads(frames[1]),
+                 frames[2:]) for frames in fake_zmq.sent]
+    assert [(name, [doc.get('seq_num') for doc in docs], len(buffers))
+            for name, docs, buffers in messages] == [
+        (b'start', [None], 0),
+        (b'event', [0, 1, 2], 0),  # capped at batch_size
+        (b'event', [3], 0),
+        (b'event', [4], 1),  # documents with arrays are sent alone
+        (b'event', [5], 0),
+        (b'stop', [None], 0)]
+    p.close()
+
+
+def test_subscription_prefixes():
+    assert _subscription_prefixes() == [b'']
+    assert _subscription_prefixes(['start', 'stop']) == [b'start ', b'stop ']
+    prefixes = _subscription_prefixes(hostname='host')
+    assert b'event host ' in prefixes
+    assert len(prefixes) == len(DocumentNames)
+    assert _subscription_prefixes(['event'], 'host', 1, 2) == [
+        b'event host 1 2 ']
+    # A pid cannot be part of the prefix without a hostname.
+    assert _subscription_prefixes(['event'], pid=1) == [b'event ']
+    assert _subscription_prefixes(['event'], 'host', run_engine_id=2) == [
+        b'event host ']
+
+
+def test_remote_dispatcher_filters():
+    d = RemoteDispatcher('localhost:5555', run_engine_id=2)
+    assert d._is_our_message('host', 1, 2)
+    assert not d._is_our_message('host', 1, 3)
+
+
+def test_remote_dispatcher_drains_bursts():
+    import zmq
+    context = zmq.Context()
+    pub = context.socket(zmq.PUB)
+    port = pub.bind_to_random_port('tcp://127.0.0.1')
+    try:
+        d = RemoteDispatcher(('127.0.0.1', port))
+        received = []
+
+        def fail_once(name, doc):
+            if doc['seq_num'] == 3:
+                raise RuntimeError("a broken callback")
+
+        d.subscribe(lambda name, doc: received.append(doc['seq_num']))
+        d.subscribe(fail_once)
+        time.sleep(0.5)  # Let the subscription reach the PUB socket.
+        now = time.time()
+        for i in range(5):
+            pub.send_multipart([b'event host 1 2 ',
+                                pickle.dumps([{'seq_num': 2 * i,
+                                               'time': now},
+                                              {'seq_num': 2 * i + 1,
+                                               'time': now}])])
+        time.sleep(0.5)  # Let them all arrive before the dispatcher starts.
+        d.loop.call_later(0.5, d.stop)
+        d.start()
+    finally:
+        context.destroy()
+    # The failing callback did not stop the dispatcher.
+    assert received == list(range(10))
+    assert d.last_burst_size == 5
+    assert d.lag >= 0.5
+
+
+def _free_port():
+    "Return a port that is free now, to pass to a Proxy in another process."
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_proxy_replay_for_late_joiner():
+    in_port, out_port, replay_port = (_free_port() for _ in range(3))
+
+    def start_proxy():
+        Proxy(in_port, out_port, replay_port=replay_port,
+              num_cached_events=2).start()
+
+    proxy_proc = multiprocessing.Process(target=start_proxy, daemon=True)
+    proxy_proc.start()
+    time.sleep(2)  # Give this plenty of time to start up.
+    p = Publisher(('127.0.0.1', in_port))
+    time.sleep(1)
+
+    def event(seq_num):
+        return {'uid': 'e%d' % seq_num, 'seq_num': seq_num,
+                'descriptor': 'd'}
+
+    try:
+        # An earlier run, which is complete, is not replayed.
+        p('start', {'uid': 'old'})
+        p('stop', {'uid': 'old-stop', 'run_start': 'old'})
+        p('start', {'uid': 's'})
+        p('descriptor', {'uid': 'd', 'run_start': 's'})
+        for i in range(1, 4):
+            p('event', event(i))
+            p.flush()  # one message each, rather than a batch
+        time.sleep(0.5)
+
+        d = RemoteDispatcher(('127.0.0.1', out_port),
+                             replay_address=('127.0.0.1', replay_port))
+        received = []
+        d.subscribe(lambda name, doc: received.append((name, doc['uid'])))
+        time.sleep(0.5)
+        # These are cached by the proxy *and* queued for the dispatcher.
+        p('event', event(4))
+        p.flush()
+        p('event_page', {'uid': ['e5', 'e6'], 'seq_num': [5, 6],
+                         'descriptor': 'd'})
+        p.flush()
+        time.sleep(0.5)
+
+        def publish_new_event():
+            p('event', event(7))
+            p.flush()
+
+        d.loop.call_later(0.5, publish_new_event)
+        d.loop.call_later(1, d.stop)
+        d.start()
+    finally:
+        p.close()
+        proxy_proc.terminate()
+        proxy_proc.join()
+    assert received == [('start', 's'), ('descriptor', 'd'), ('event', 'e4'),
+                        ('event_page', ['e5', 'e6']), ('event', 'e7')]
+    # Once past the overlap, the replayed uids are let go.
+    assert not d._replayed_uids
+
+
+def test_proxy_stats():
+    import zmq
+
+    in_port, out_port, stats_port = (_free_port() for _ in range(3))
+
+    def start_proxy():
+        Proxy(in_port, out_port, stats_port=stats_port, stats_interval=0.5,
+              io_threads=2, in_hwm=100, out_hwm=100).start()
+
+    proxy_proc = multiprocessing.Process(target=start_proxy, daemon=True)
+    proxy_proc.start()
+    time.sleep(2)  # Give this plenty of time to start up.
+    context = zmq.Context()
+    stats_socket = context.socket(zmq.SUB)
+    stats_socket.setsockopt(zmq.SUBSCRIBE, b'')
+    stats_socket.connect('tcp://127.0.0.1:%d' % stats_port)
+    # Two subscribers to the same topic count as two subscriptions.
+    subscribers = []
+    for _ in range(2):
+        sub = context.socket(zmq.SUB)
+        sub.setsockopt(zmq.SUBSCRIBE, b'event ')
+        sub.connect('tcp://127.0.0.1:%d' % out_port)
+        subscribers.append(sub)
+    p = Publisher(('127.0.0.1', in_port))
+    try:
+        time.sleep(1)
+        for i in range(3):
+            p('event', {'seq_num': i, 'data': {'img': np.ones(1000)}})
+        p.flush()
+        # Skip any reports from before the messages arrived.
+        while stats_socket.poll(2000):
+            stats = stats_socket.recv_json()
+            if stats['publishers']:
+                break
+    finally:
+        p.close()
+        context.destroy()
+        proxy_proc.terminate()
+        proxy_proc.join()
+    publisher_stats, = stats['publishers'].values()
+    assert publisher_stats['messages'] == 3
+    assert publisher_stats['largest_message'] > 8000
+    assert publisher_stats['bytes'] >= 3 * 8000
+    assert stats['subscriptions'] == 2
+
+
+def test_publisher_spools_while_proxy_is_down(tmpdir):
+    import zmq
+    spool = str(tmpdir.join('spool'))
+    image = np.arange(6).reshape(2, 3)
+    port = _free_port()
+    p = Publisher(('127.0.0.1', port), spool=spool)
+    p('start', {'uid': 'a'})
+    p('event', {'seq_num': 1, 'data': {'img': image}})
+    p.flush()
+    assert p.spooled == 2
+    p.close()  # Whatever is left in the spool is sent by the next Publisher.
+
+    p = Publisher(('127.0.0.1', port), spool=spool)
+    assert p.spooled == 2
+    with pytest.raises(RuntimeError):
+        Publisher(('127.0.0.1', port), spool=spool)
+    p('event', {'seq_num': 2})
+    p.flush()
+    assert p.spooled == 3
+
+    context = zmq.Context()
+    sub = context.socket(zmq.SUB)
+    sub.setsockopt(zmq.SUBSCRIBE, b'')
+    sub.bind('tcp://127.0.0.1:%d' % port)
+    try:
+        received = []
+        while len(received) < 4:
+            assert sub.poll(5000)
+            frames = sub.recv_multipart()
+            for doc in pickle.loads(frames[1]):
+                received.append(_restore_arrays(doc, frames[2:]))
+            if len(received) == 3:
+                p('stop', {'uid': 'b'})
+        assert [doc.get('seq_num') for doc in received] == [None, 1, 2, None]
+        assert np.array_equal(received[1]['data']['img'], image)
+        assert p.spooled == 0
+    finally:
+        p.close()
+        context.destroy()
+    assert os.path.getsize(spool) == 8  # only the header is left
+
+
+def test_spool_compaction(tmpdir, monkeypatch):
+    monkeypatch.setattr(bluesky.callbacks.zmq, '_SPOOL_COMPACT_SIZE', 100)
+    path = str(tmpdir.join('spool'))
+    spool = _Spool(path)
+    for i in range(10):
+        spool.append([b'topic', b'%d' % i * 10])
+    size = os.path.getsize(path)
+    for i in range(6):
+        assert spool.peek() == [b'topic', b'%d' % i * 10]
+        spool.pop()
+    # Messages already sent were dropped from the file.
+    assert os.path.getsize(path) < size
+    spool.close()
+    # The rest are still there, in order.
+    spool = _Spool(path)
+    remaining = []
+    while spool:
+        remaining.append(spool.peek())
+        spool.pop()
+    assert remaining == [[b'topic', b'%d' % i * 10] for i in range(6, 10)]
+    spool.close()
+
+
+def test_publisher_shared_memory():
+    import zmq
+    context = zmq.Context()
+    sub = context.socket(zmq.SUB)
+    sub.setsockopt(zmq.SUBSCRIBE, b'')
+    port = sub.bind_to_random_port('tcp://127.0.0.1')
+    p = Publisher(('127.0.0.1', port), shared_memory=2**20)
+    # Messages are handed to the dispatchers by hand, not received by them.
+    d = RemoteDispatcher(('127.0.0.1', _free_port()))
+    received = []
+    d.subscribe(lambda name, doc: received.append(doc['data']['img'].copy()))
+    images = [np.full((256, 256), i, dtype=float) for i in range(4)]  # 512 kB
+
+    def publish(image):
+        p('event', {'data': {'img': image}, 'time': time.time()})
+        assert sub.poll(5000)
+        return sub.recv_multipart(copy=False)
+
+    def ring_position(frames):
+        doc, = pickle.loads(frames[1].bytes)
+        return doc['data']['img']['shm'][1]
+
+    try:
+        # Publish until the subscription has reached the Publisher.
+        while True:
+            p('start', {})
+            if sub.poll(100):
+                break
+        time.sleep(0.1)
+        while sub.poll(0):
+            sub.recv_multipart()
+        burst = [publish(images[0])]
+        assert ring_position(burst[0]) is not None
+        # The image is sent through 0MQ too, for consumers elsewhere.
+        assert len(burst[0][2].bytes) == images[0].nbytes
+        d._process_burst(burst)
+        assert list(d._rings) == [p._ring.path]
+        # Nobody else has registered, so space for one more image is free,
+        # then the space of the image just dispatched can be reused, but
+        # after that the ring is full and images only go through 0MQ.
+        burst += [publish(image) for image in images[1:]]
+        assert [ring_position(frames) is None for frames in burst] == [
+            False, False, False, True]
+        d._process_burst(burst[1:])
+        for expected, actual in zip(images, received):
+            assert np.array_equal(expected, actual)
+
+        # A consumer that cannot open the ring uses the arrays in the
+        # messages.
+        os.unlink(p._ring.path)
+        d2 = RemoteDispatcher(('127.0.0.1', _free_port()))
+        received.clear()
+        d2.subscribe(
+            lambda name, doc: received.append(doc['data']['img'].copy()))
+        d2._process_burst(burst)
+        assert not d2._rings
+        for expected, actual in zip(images, received):
+            assert np.array_equal(expected, actual)
+        d2.stop()
+    finally:
+        d.stop()
+        p.close()
+        context.destroy()
+    assert not os.path.exists(p._ring.path)
@@ -1,12 +1,16 @@
 from collections import namedtuple
+from collections.abc import MutableMapping
 import asyncio
+import atexit
+import json
 import os
 import sys
 import signal
+import sqlite3
 import operator
 import uuid
 from functools import reduce
-from weakref import ref, WeakKeyDictionary
+from weakref import ref, WeakKeyDictionary, WeakMethod, WeakSet
 import types
 import inspect
 from inspect import Parameter, Signature
@@ -742,13 +746,261 @@ def get_history():
             return historydict.HistoryDict(':memory:')
 
 
+_DELETED = object()
+
+
+def _call_weak_method(method):
+    func = method()
+    if func is not None:
+        func()
+
+
+class MetadataStore(MutableMapping):
+    """
+    A dict-like metadata stash, kept in memory and saved in the background.
+
+    This is a stand-in for :class:`historydict.HistoryDict` as ``RE.md``.
+    Reads and writes act on an in-memory dict, so they never wait for the
+    disk. Changed keys are saved to a sqlite file by a background thread,
+    which writes all the changes made since its last write in one
+    transaction. Values must be JSON-serializable.
+
+    If the process dies, changes made in the last moments before may be
+    lost, except that ``scan_id`` never goes backward: a block of scan ids
+    is reserved in the file (synchronously, once per ``scan_id_block``
+    runs), and after an unclean shutdown ``scan_id`` resumes from the end of
+    the reserved block, so no scan id is given to two runs.
+
+    Parameters
+    ----------
+    path : string
+        sqlite file, created if needed. Use ``':memory:'`` for a store that
+        does not persist.
+    scan_id_block : int, optional
+        Number of scan ids reserved at a time. Default is 100.
+
+    Examples
+    --------
+
+    >>> RE.md = MetadataStore('~/.config/bluesky/md.sqlite')
+    """
+    def __init__(self, path, *, scan_id_block=100):
+        self.path = os.path.expanduser(path)
+        self.scan_id_block = scan_id_block
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS metadata "
+                           "(key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS reserved "
+                           "(key TEXT PRIMARY KEY, value INTEGER)")
+        self._conn.commit()
+        self._cache = {key: json.loads(value) for key, value in
+                       self._conn.execute("SELECT key, value FROM metadata")}
+        row = self._conn.execute("SELECT value FROM reserved "
+                                 "WHERE key='scan_id'").fetchone()
+        self._reserved_scan_id = row[0] if row else None
+        if (self._reserved_scan_id is not None and
+                self._reserved_scan_id > self._cache.get('scan_id', 0)):
+            # The last session did not close cleanly. Scan ids up to the end
+            # of its reserved block may have been used.
+            self._cache['scan_id'] = self._reserved_scan_id
+        self._pending = {}  # {key: value, or _DELETED}
+        self._lock = threading.Lock()  # guards the cache and _pending
+        self._db_lock = threading.Lock()  # serializes writes to the file
+        self._changed = threading.Condition(self._lock)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='bluesky-metadata-store')
+        self._thread.start()
+        atexit.register(_call_weak_method, WeakMethod(self.close))
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def __getitem__(self, key):
+        return self._cache[key]
+
+    def __setitem__(self, key, value):
+        if self._closed:
+            raise RuntimeError("The MetadataStore is closed.")
+        if key == 'scan_id':
+            self._reserve_scan_id(value)
+        with self._lock:
+            self._cache[key] = value
+            self._pending[key] = value
+            self._changed.notify()
+
+    def __delitem__(self, key):
+        if self._closed:
+            raise RuntimeError("The MetadataStore is closed.")
+        with self._lock:
+            del self._cache[key]
+            self._pending[key] = _DELETED
+            self._changed.notify()
+
+    def __iter__(self):
+        return iter(self._cache)
+
+    def __contains__(self, key):
+        return key in self._cache
+
+    def __len__(self):
+        return len(self._cache)
+
+    def _reserve_scan_id(self, scan_id):
+        reserved = self._reserved_scan_id
+        if (reserved is not None and
+                self._cache.get('scan_id', 0) <= scan_id <= reserved):
+            return
+        # Going past the reserved block, or back below the current value:
+        # record the new block before the scan id can be used.
+        reserved = scan_id + self.scan_id_block
+        with self._db_lock:
+            self._conn.execute("INSERT OR REPLACE INTO reserved "
+                               "VALUES ('scan_id', ?)", (reserved,))
+            self._conn.commit()
+        self._reserved_scan_id = reserved
+
+    def _run(self):
+        while True:
+            with self._lock:
+                self._changed.wait_for(
+                    lambda: self._pending or self._closed)
+                if self._closed:
+                    return
+            self._write_pending()
+
+    def _write_pending(self):
+        with self._db_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                # Serialize under the lock, in case values are mutated.
+                updates = [(key, json.dumps(value))
+                           for key, value in pending.items()
+                           if value is not _DELETED]
+            deletions = [(key,) for key, value in pending.items()
+                         if value is _DELETED]
+            if not (updates or deletions):
+                return
+            with self._conn:
+                self._conn.executemany("INSERT OR REPLACE INTO metadata "
+                                       "VALUES (?, ?)", updates)
+                self._conn.executemany("DELETE FROM metadata WHERE key=?",
+                                       deletions)
+
+    def flush(self):
+        """
+        Save all changes made so far, and wait until they are saved.
+
+        Once the store is closed, everything is saved and this does nothing.
+        """
+        with self._lock:
+            if self._closed:
+                return
+        self._write_pending()
+
+    def close(self):
+        """
+        Save everything and stop the background thread.
+
+        Values are saved in full, so changes made to them in place (such as
+        appending to a list) are saved too. This is called at exit.
+        """
+        if self._closed:
+            return
+        with self._lock:
+            self._closed = True
+            self._pending.update(self._cache)
+            self._changed.notify()
+        self._thread.join()
+        self._write_pending()
+        with self._db_lock:
+            # A clean shutdown: release the unused scan ids.
+            with self._conn:
+                self._conn.execute("DELETE FROM reserved WHERE key='scan_id'")
+            self._conn.close()
+
+
 _QT_KICKER_INSTALLED = {}
 _NB_KICKER_INSTALLED = {}
+# figures whose stale_callback wakes the kickers
+_HOOKED_FIGURES = WeakSet()
+
 
+class _Kicker:
+    """
+    Call ``kick`` from an event loop when figures change, and less and less
+    often while they do not.
 
-def install_kicker(loop=None, update_rate=0.03):
+    When a figure becomes stale (for example, because a callback added a
+    point to a plot) the kicker wakes, no sooner than ``update_rate`` seconds
+    after it last ran. Otherwise, the time between kicks doubles each time
+    ``kick`` reports that there was nothing to draw, up to ``max_interval``.
+    """
+    def __init__(self, loop, kick, update_rate, max_interval):
+        self.loop = loop
+        self._kick = kick
+        self.update_rate = update_rate
+        self.max_interval = max(update_rate, max_interval)
+        self.kicks = 0  # how many times kick has been called
+        self._interval = update_rate
+        self._last = loop.time()
+        self._waking = False
+        # When the next kick is scheduled for (TimerHandle.when() is not
+        # available before Python 3.7)
+        self._when = loop.time()
+        self._handle = loop.call_at(self._when, self._run)
+
+    def _run(self):
+        self.kicks += 1
+        self._last = self.loop.time()
+        from matplotlib._pylab_helpers import Gcf
+        for manager in Gcf.get_all_fig_managers():
+            figure = manager.canvas.figure
+            if figure not in _HOOKED_FIGURES:
+                figure.stale_callback = partial(_wake_kickers,
+                                                figure.stale_callback)
+                _HOOKED_FIGURES.add(figure)
+        if self._kick():
+            self._interval = self.update_rate
+        else:
+            self._interval = min(2 * self._interval, self.max_interval)
+        self._when = self.loop.time() + self._interval
+        self._handle = self.loop.call_at(self._when, self._run)
+
+    def wake(self):
+        "Kick soon. This may be called from any thread."
+        if not self._waking:
+            self._waking = True
+            try:
+                self.loop.call_soon_threadsafe(self._wake)
+            except RuntimeError:
+                # The event loop is closed. Drop this kicker so that it does
+                # not break the drawing of figures.
+                for kickers in (_QT_KICKER_INSTALLED, _NB_KICKER_INSTALLED):
+                    if kickers.get(self.loop) is self:
+                        del kickers[self.loop]
+
+    def _wake(self):
+        self._waking = False
+        when = max(self._last + self.update_rate, self.loop.time())
+        if when < self._when:
+            self._handle.cancel()
+            self._when = when
+            self._handle = self.loop.call_at(when, self._run)
+
+
+def _wake_kickers(stale_callback, figure, stale):
+    if stale_callback is not None:
+        stale_callback(figure, stale)
+    if stale:
+        for kickers in (_QT_KICKER_INSTALLED, _NB_KICKER_INSTALLED):
+            for kicker in list(kickers.values()):
+                kicker.wake()
+
+
+def install_kicker(loop=None, update_rate=0.03, max_interval=None):
     """
-    Install a periodic callback to integrate drawing and asyncio event loops.
+    Install a callback to integrate drawing and asyncio event loops.
 
     This dispatches to :func:`install_qt_kicker` or :func:`install_nb_kicker`
     depending on the current matplotlib backend.
@@ -757,21 +1009,33 @@ def install_kicker(loop=None, update_rate=0.03):
     ----------
     loop : event loop, optional
     update_rate : number
-        Seconds between periodic updates. Default is 0.03.
+        Minimum seconds between updates. Default is 0.03.
+    max_interval : number, optional
+        Maximum seconds between updates when no figure has changed. Defaults
+        to that of :func:`install_qt_kicker` or :func:`install_nb_kicker`.
     """
     import matplotlib
     backend = matplotlib.get_backend()
+    kwargs = {'update_rate': update_rate}
+    if max_interval is not None:
+        kwargs['max_interval'] = max_interval
     if backend == 'nbAgg':
-        install_nb_kicker(loop=loop, update_rate=update_rate)
+        install_nb_kicker(loop=loop, **kwargs)
     elif backend in ('Qt4Agg', 'Qt5Agg'):
-        install_qt_kicker(loop=loop, update_rate=update_rate)
+        install_qt_kicker(loop=loop, **kwargs)
     else:
         raise NotImplementedError("The matplotlib backend {} is not yet "
                                   "supported.".format(backend))
 
 
-def install_qt_kicker(loop=None, update_rate=0.03):
-    """Install a periodic callback to integrate Qt and asyncio event loops.
+def install_qt_kicker(loop=None, update_rate=0.03, max_interval=0.05):
+    """Install a callback to integrate Qt and asyncio event loops.
+
+    The Qt event loop is run, and figures are drawn, soon after a figure
+    changes (but at most once per ``update_rate``). While no figure changes,
+    this happens less often, down to once per ``max_interval``. The Qt event
+    loop also handles the user's input to the windows (panning, zooming,
+    resizing), so ``max_interval`` is how long that input may wait.
 
     If a version of the Qt bindings are not already imported, this function
     will do nothing.
@@ -782,7 +1046,10 @@ def install_qt_kicker(loop=None, update_rate=0.03):
     ----------
     loop : event loop, optional
     update_rate : number
-        Seconds between periodic updates. Default is 0.03.
+        Minimum seconds between updates. Default is 0.03.
+    max_interval : number
+        Maximum seconds between updates when no figure has changed. Default
+        is 0.05. Set it equal to ``update_rate`` to update at a fixed rate.
     """
     if loop is None:
         loop = asyncio.get_event_loop()
@@ -793,33 +1060,28 @@ def install_qt_kicker(loop=None, update_rate=0.03):
         return
     import matplotlib.backends.backend_qt5
     from matplotlib.backends.backend_qt5 import _create_qApp
-    from matplotlib._pylab_helpers import Gcf
 
     _create_qApp()
     qApp = matplotlib.backends.backend_qt5.qApp
 
-    try:
-        _draw_all = Gcf.draw_all  # mpl version >= 1.5
-    except AttributeError:
-        # slower, but backward-compatible
-        def _draw_all():
-            for f_mgr in Gcf.get_all_fig_managers():
-                f_mgr.canvas.draw_idle()
-
     def _qt_kicker():
         # The RunEngine Event Loop interferes with the qt event loop. Here we
         # kick it to keep it going.
-        _draw_all()
-
+        drew = _draw_stale()
         qApp.processEvents()
-        loop.call_later(update_rate, _qt_kicker)
+        return drew
 
-    _QT_KICKER_INSTALLED[loop] = loop.call_soon(_qt_kicker)
+    _QT_KICKER_INSTALLED[loop] = _Kicker(loop, _qt_kicker, update_rate,
+                                         max_interval)
 
 
-def install_nb_kicker(loop=None, update_rate=0.03):
+def install_nb_kicker(loop=None, update_rate=0.03, max_interval=0.25):
     """
-    Install a periodic callback to integrate ipykernel and asyncio event loops.
+    Install a callback to integrate ipykernel and asyncio event loops.
+
+    Figures are drawn soon after they change (but at most once per
+    ``update_rate``). While no figure changes, the event loop is woken less
+    often, down to once per ``max_interval``.
 
     It is safe to call this function multiple times.
 
@@ -827,9 +1089,11 @@ def install_nb_kicker(loop=None, update_rate=0.03):
     ----------
     loop : event loop, optional
     update_rate : number
-        Seconds between periodic updates. Default is 0.03.
+        Minimum seconds between updates. Default is 0.03.
+    max_interval : number
+        Maximum seconds between updates when no figure has changed. Default
+        is 0.25. Set it equal to ``update_rate`` to update at a fixed rate.
     """
-    import matplotlib
     if loop is None:
         loop = asyncio.get_event_loop()
     global _NB_KICKER_INSTALLED
@@ -839,13 +1103,24 @@ def install_nb_kicker(loop=None, update_rate=0.03):
     def _nbagg_kicker():
         # This is more brute-force variant of the _qt_kicker function used
         # inside install_qt_kicker.
-        for f_mgr in matplotlib._pylab_helpers.Gcf.get_all_fig_managers():
-            if f_mgr.canvas.figure.stale:
-                f_mgr.canvas.draw()
+        return _draw_stale(draw_idle=False)
 
-        loop.call_later(update_rate, _nbagg_kicker)
+    _NB_KICKER_INSTALLED[loop] = _Kicker(loop, _nbagg_kicker, update_rate,
+                                         max_interval)
 
-    _NB_KICKER_INSTALLED[loop] = loop.call_soon(_nbagg_kicker)
+
+def _draw_stale(draw_idle=True):
+    "Draw the figures that have changed, and return whether there were any."
+    from matplotlib._pylab_helpers import Gcf
+    drew = False
+    for f_mgr in Gcf.get_all_fig_managers():
+        if f_mgr.canvas.figure.stale:
+            if draw_idle:
+                f_mgr.canvas.draw_idle()
+            else:
+                f_mgr.canvas.draw()
+            drew = True
+    return drew
 
 
 def apply_sub_factories(factories, plan):
@@ -940,6 +1215,34 @@ def sanitize_np(val):
     return val
 
 
+def unpack_event_page(page):
+    """
+    Yield the Event documents packed into an EventPage document.
+
+    Parameters
+    ----------
+    page : dict
+        an EventPage document, with a column per Event field
+
+    Yields
+    ------
+    event : dict
+    """
+    descriptor = page['descriptor']
+    data = page['data']
+    timestamps = page['timestamps']
+    filled = page.get('filled', {})
+    for i, (time_, uid, seq_num) in enumerate(zip(page['time'], page['uid'],
+                                                  page['seq_num'])):
+        yield {'descriptor': descriptor,
+               'time': time_,
+               'uid': uid,
+               'seq_num': seq_num,
+               'data': {k: v[i] for k, v in data.items()},
+               'timestamps': {k: v[i] for k, v in timestamps.items()},
+               'filled': {k: v[i] for k, v in filled.items()}}
+
+
 def expiring_function(func, loop, *args, **kwargs):
     """
     If timeout has not occurred, call func(*args, **kwargs).
@@ -1036,7 +1339,7 @@ def apply_to_dict_recursively(d, f):
 
 
 class ProgressBar:
-    def __init__(self, status_objs, delay_draw=0.2):
+    def __init__(self, status_objs, delay_draw=0.2, *, autodraw=True):
         """
         Represent status objects with a progress bars.
 
@@ -1048,6 +1351,10 @@ class ProgressBar:
             To avoid flashing progress bars that will complete quickly after
             they are displayed, delay drawing until the progress bar has been
             around for awhile. Default is 0.2 seconds.
+        autodraw : boolean, optional
+            If True (default), draw on every update. If False, updates are
+            only recorded, and the bar is drawn by calling :meth:`draw`,
+            as :class:`ProgressBarManager` does from its own thread.
         """
         self.meters = []
         self.status_objs = []
@@ -1056,14 +1363,18 @@ class ProgressBar:
         self.fp = sys.stdout
         self.creation_time = time.time()
         self.delay_draw = delay_draw
+        self.autodraw = autodraw
         self.drawn = False
         self.done = False
         self.lock = threading.RLock()
+        # The latest update of each meter not yet drawn, {pos: kwargs}
+        self._updates = {}
+        self._updates_lock = threading.Lock()
 
         # If the ProgressBar is not finished before the delay_draw time but
         # never again updated after the delay_draw time, we need to draw it
         # once.
-        if delay_draw:
+        if delay_draw and autodraw:
             threading.Thread(target=self._ensure_draw, daemon=True).start()
 
         # Create a closure over self.update for each status object that
@@ -1082,13 +1393,31 @@ class ProgressBar:
                unit='units', precision=None,
                fraction=None,
                time_elapsed=None, time_remaining=None):
+        # Compute this only if the status object did not provide it.
+        if time_elapsed is None:
+            time_elapsed = time.time() - self.creation_time
+        # Only record the update. It is formatted when it is drawn, and
+        # updates that are superseded before then are never formatted.
+        with self._updates_lock:
+            self._updates[pos] = dict(
+                name=name, current=current, initial=initial, target=target,
+                unit=unit, precision=precision, fraction=fraction,
+                time_elapsed=time_elapsed, time_remaining=time_remaining)
+        if self.autodraw:
+            self.draw()
+
+    @property
+    def changed(self):
+        "Whether there are updates that have not been drawn."
+        return bool(self._updates)
+
+    def _format_meter(self, pos, *,
+                      name, current, initial, target, unit, precision,
+                      fraction, time_elapsed, time_remaining):
         if all(x is not None for x in (current, initial, target)):
             # Display a proper progress bar.
             total = round(_L2norm(target, initial), precision or 3)
             n = round(_L2norm(current, initial), precision or 3)
-            # Compute this only if the status object did not provide it.
-            if time_elapsed is None:
-                time_elapsed = time.time() - self.creation_time
             # TODO Account for 'fraction', which might in some special cases
             # differ from the naive computation above.
             # TODO Account for 'time_remaining' which might in some special
@@ -1108,9 +1437,7 @@ class ProgressBar:
                 meter = name + ' [In progress. No progress bar available.]'
             meter += ' ' * (self.ncols - len(meter))
             meter = meter[:self.ncols]
-
-        self.meters[pos] = meter
-        self.draw()
+        return meter
 
     def draw(self):
         with self.lock:
@@ -1118,6 +1445,10 @@ class ProgressBar:
                 return
             if self.done:
                 return
+            with self._updates_lock:
+                updates, self._updates = self._updates, {}
+            for pos, kwargs in updates.items():
+                self.meters[pos] = self._format_meter(pos, **kwargs)
             for meter in self.meters:
                 tqdm.status_printer(self.fp)(meter)
                 self.fp.write('\n')
@@ -1144,25 +1475,66 @@ class ProgressBar:
 
 
 class ProgressBarManager:
-    def __init__(self, delay_draw=0.2):
+    def __init__(self, delay_draw=0.2, refresh_interval=0.1):
+        """
+        Show a progress bar while the RunEngine waits.
+
+        Use an instance as ``RunEngine.waiting_hook``. One thread, started
+        on first use, draws the progress bar: status objects only record
+        their updates, and the latest state of all of them is drawn at most
+        once every ``refresh_interval``, however often they report.
+
+        Parameters
+        ----------
+        delay_draw : float, optional
+            Seconds to wait before drawing a progress bar, so that quick
+            actions do not flash one. Default is 0.2.
+        refresh_interval : float, optional
+            Minimum seconds between draws. Default is 0.1.
+        """
         self.delay_draw = delay_draw
+        self.refresh_interval = refresh_interval
         self.pbar = None
+        self._condition = threading.Condition()
+        self._thread = None
 
     def __call__(self, status_objs_or_none):
-        if status_objs_or_none is not None:
-            # Start a new ProgressBar.
-            if self.pbar is not None:
-                warnings.warn("Previous ProgressBar never competed.")
-                self.pbar.clear()
-            self.pbar = ProgressBar(status_objs_or_none,
-                                    delay_draw=self.delay_draw)
-        else:
-            # Clean up an old one.
-            if self.pbar is None:
-                warnings.warn("There is no Progress bar to clean up.")
+        with self._condition:
+            if status_objs_or_none is not None:
+                # Start a new ProgressBar.
+                if self.pbar is not None:
+                    warnings.warn("Previous ProgressBar never competed.")
+                    self.pbar.clear()
+                self.pbar = ProgressBar(status_objs_or_none,
+                                        delay_draw=self.delay_draw,
+                                        autodraw=False)
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._render, name='bluesky-progress-bar',
+                        daemon=True)
+                    self._thread.start()
             else:
-                self.pbar.clear()
-                self.pbar = None
+                # Clean up an old one.
+                if self.pbar is None:
+                    warnings.warn("There is no Progress bar to clean up.")
+                else:
+                    self.pbar.clear()
+                    self.pbar = None
+            self._condition.notify()
+
+    def _render(self):
+        while True:
+            with self._condition:
+                # Sleep until there is a progress bar to draw.
+                while self.pbar is None:
+                    self._condition.wait()
+                pbar = self.pbar
+            if not pbar.drawn or pbar.changed:
+                # This does nothing before delay_draw or after clear().
+                pbar.draw()
+            with self._condition:
+                if self.pbar is pbar:
+                    self._condition.wait(self.refresh_interval)
 
 
 def _L2norm(x, y):